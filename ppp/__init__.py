@@ -14,8 +14,11 @@ PPP Web Application
 
 Functions
 - run: Common executional entry point from interfaces.
+- check: Validation entry point from interfaces, without rendering.
 """
 import os
+import sys
+from contextlib import nullcontext
 from copy import copy
 
 try:
@@ -27,65 +30,123 @@ from itertools import product
 from collections import OrderedDict
 
 from ppp.definitions.error import OdkException, InvalidLanguageException
-from ppp.definitions.constants import MULTI_ARGUMENT_CONVERSION_OPTIONS
-from ppp.odkform import OdkForm, set_template_env
+from ppp.definitions.constants import (
+    MULTI_ARGUMENT_CONVERSION_OPTIONS,
+    ALL_LANGUAGES_TOKEN,
+    COMPRESSION_FORMATS,
+)
 
+# Modules which import Jinja2 and pmix, and with it xlrd, are imported where
+# needed, so that the CLI can start and parse arguments without them.
+LAZY_ATTRIBUTES = {"OdkForm": "ppp.odkform", "set_template_env": "ppp.odkform"}
 
-def convert_file(in_file, language=None, outpath=None, **kwargs):
+
+def __getattr__(name):
+    """Import attributes of the package on first access."""
+    if name in LAZY_ATTRIBUTES:
+        from importlib import import_module
+
+        return getattr(import_module(LAZY_ATTRIBUTES[name]), name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def convert_file(
+    in_file,
+    language=None,
+    outpath=None,
+    diagnostics=None,
+    archive=None,
+    wb=None,
+    **kwargs
+):
     """Run ODK form conversion.
 
     Args:
         in_file (str): Path to load source file.
         language (str or None): Language to render form.
         outpath (str or None): Path to save converted file.
+        diagnostics (OdkDiagnostics): Collection to add warnings to, e.g. to
+            share between conversions of the same file. If not supplied,
+            warnings are printed once the conversion is done.
+        archive (OutputArchive): Archive to write converted file to, as an
+            entry named as by get_out_name(), instead of to outpath. The
+            entry is compressed by the archive, so 'compress' is ignored.
+        wb (Xlsform): The workbook of in_file, if already read, e.g. to
+            convert it with several combinations of options.
         **format (str): File format to be output.
-        **debug (bool): Debugging on or off.
+        **debug (str): One of DEBUG_MODES, or None for debugging off.
+            'sidecar' writes debug data to a file next to the converted file,
+            as named by get_debug_file(), or is 'inline' if printing.
         **highlight (bool): Highlighting on or off.
+        **compress (str): One of COMPRESSION_FORMATS, to compress the output
+            as it is rendered.
+
+    Returns:
+        OdkDiagnostics: Warnings found while converting.
 
     Raises:
         InvalidLanguageException: Language related.
         OdkChoicesError: Choice or choice list related.
         OdkFormError: General form related exception.
     """
+    from pmix import Xlsform
+    from ppp.metrics import count, stage, timed_chunks
+    from ppp.odkform import OdkForm
 
-    set_template_env(kwargs["style"] if "style" in kwargs else "default")
-
-    form = OdkForm.from_file(in_file)
+    keep_raw = kwargs.get("debug", False)
+    with stage("load"):
+        if wb is None:
+            with stage("read"):
+                wb = Xlsform(in_file)
+        form = OdkForm(wb, diagnostics, keep_raw)
+    count(conversions=1, rows=max(len(wb["survey"]) - 1, 0))
+    del wb  # Released once converted, unless kept by the caller.
 
     try:
-        output = None
+        form.language_index.validate(language)
+        compress = kwargs.pop("compress", None)
+        if kwargs.get("debug") == "sidecar" and archive is None and not outpath:
+            kwargs["debug"] = "inline"  # No file to write debug data next to.
+        sidecar = kwargs.get("debug") == "sidecar"
         output_format = kwargs["format"] if "format" in kwargs else "html"
         if output_format == "text":
-            output = form.to_text(lang=language, **kwargs)
-
-        elif output_format in ("html", "doc"):
-            output = form.to_html(lang=language, **kwargs)
-
-        if outpath:
-            if os.path.isdir(outpath) and not os.path.exists(outpath):
-                os.makedirs(outpath)
-            if os.path.isdir(outpath):
-                base_filename = os.path.basename(os.path.splitext(in_file)[0])
-                lang = "-" + language if language else ""
-                options_affix = (
-                    "-" + kwargs["template"]
-                    if "template" in kwargs
-                    and kwargs["template"] not in ("standard", "minimal")
-                    else ""
-                )
-                out_file = "{}{}{}{}.{}".format(
-                    outpath, base_filename, lang, options_affix, output_format
-                )
-
-                if isinstance(out_file, list):
-                    if out_file[0] == "/":
-                        out_file = out_file[1:]
-            else:
-                out_file = outpath
-            with open(out_file, mode="w", encoding="utf-8") as file:
-                file.write(output)
+            with stage("render"):
+                chunks = [form.to_text(lang=language, **kwargs)]
+        elif kwargs.get("compact"):  # Compaction needs the whole document.
+            with stage("render"):
+                chunks = [form.to_html(lang=language, **kwargs)]
+        else:
+            chunks = form.iter_html(lang=language, **kwargs)
+        chunks = timed_chunks(chunks)
+
+        if archive is not None:
+            name = get_out_name(in_file, language, **kwargs)
+            record = {
+                "source": os.path.basename(in_file),
+                "language": language,
+                "options": kwargs,
+            }
+            with stage("write"):
+                count(bytes=archive.write(name, chunks, **record)["size"])
+            if sidecar:
+                debug_data = form.iter_json(lang=language, **kwargs)
+                archive.write(get_debug_file(name), debug_data, **record)
+        elif outpath:
+            out_file = get_out_file(
+                in_file, language, outpath, compress=compress, **kwargs
+            )
+            write_out_file(out_file, chunks, compress)
             print(out_file)
+            if sidecar:
+                debug_file = get_debug_file(out_file, compress)
+                debug_data = form.iter_json(lang=language, **kwargs)
+                write_out_file(debug_file, debug_data, compress)
+                print(debug_file)
+        elif compress:
+            with open_out_file(sys.stdout.buffer, compress) as file:
+                file.writelines(chunks)
         else:
+            output = "".join(chunks)
             try:
                 print(output)
             except BrokenPipeError:  # If output is piped.
@@ -103,6 +164,126 @@ def convert_file(in_file, language=None, outpath=None, **kwargs):
             raise InvalidLanguageException(msg)
     except OdkException as err:
         raise OdkException(err)
+    if diagnostics is None:
+        form.diagnostics.emit()
+    return form.diagnostics
+
+
+def get_out_name(in_file, language, **kwargs):
+    """Get file name of a converted form, from its source file and options.
+
+    Args:
+        in_file (str): Path to load source file.
+        language (str or None): Language to render form.
+        **format (str): File format to be output.
+        **template (str): Template of bundled options.
+
+    Returns:
+        str: File name, without directory.
+    """
+    output_format = kwargs["format"] if "format" in kwargs else "html"
+    base_filename = os.path.basename(os.path.splitext(in_file)[0])
+    lang = "-" + language if language else ""
+    options_affix = (
+        "-" + kwargs["template"]
+        if "template" in kwargs and kwargs["template"] not in ("standard", "minimal")
+        else ""
+    )
+    return "{}{}{}.{}".format(base_filename, lang, options_affix, output_format)
+
+
+def get_out_file(in_file, language, outpath, **kwargs):
+    """Get path of file to save a converted form to.
+
+    Args:
+        in_file (str): Path to load source file.
+        language (str or None): Language to render form.
+        outpath (str): Path to save converted file. If a directory, the file
+            name is generated from the source file name and options.
+        **format (str): File format to be output.
+        **template (str): Template of bundled options.
+        **compress (str): One of COMPRESSION_FORMATS, the suffix of which is
+            added to the path.
+
+    Returns:
+        str: Path of output file.
+    """
+    if os.path.isdir(outpath) and not os.path.exists(outpath):
+        os.makedirs(outpath)
+    if os.path.isdir(outpath):
+        out_file = outpath + get_out_name(in_file, language, **kwargs)
+
+        if isinstance(out_file, list):
+            if out_file[0] == "/":
+                out_file = out_file[1:]
+    else:
+        out_file = outpath
+    if kwargs.get("compress"):
+        suffix = COMPRESSION_FORMATS[kwargs["compress"]][1]
+        if not out_file.endswith(suffix):
+            out_file += suffix
+    return out_file
+
+
+def get_debug_file(out_file, compress=None):
+    """Get path of the file to save debug data of a converted form to.
+
+    Args:
+        out_file (str): Path of the converted file.
+        compress (str or None): One of COMPRESSION_FORMATS, the suffix of
+            which is kept last.
+
+    Returns:
+        str: Path of debug file, e.g. 'form.html.json.gz' for 'form.html.gz'.
+    """
+    suffix = COMPRESSION_FORMATS[compress][1] if compress else ""
+    if suffix and out_file.endswith(suffix):
+        out_file = out_file[: -len(suffix)]
+    return out_file + ".json" + suffix
+
+
+def write_out_file(out_file, chunks, compress=None):
+    """Write a converted form to a file, piece by piece.
+
+    If writing fails, e.g. on an error while rendering, no partial file is
+    left behind.
+
+    Args:
+        out_file (str): Path of output file.
+        chunks (iterable): Pieces of the converted form, as from
+            OdkForm.iter_html().
+        compress (str or None): One of COMPRESSION_FORMATS.
+    """
+    from ppp.metrics import count, stage
+
+    try:
+        with stage("write"), open_out_file(out_file, compress) as file:
+            file.writelines(chunks)
+    except BaseException:
+        if os.path.exists(out_file):
+            os.remove(out_file)
+        raise
+    count(bytes=os.path.getsize(out_file))
+
+
+def open_out_file(out_file, compress=None):
+    """Open a file to write a converted form to.
+
+    Args:
+        out_file (str or file): Path of output file, or, if compressing, a
+            binary stream, e.g. sys.stdout.buffer.
+        compress (str or None): One of COMPRESSION_FORMATS, to compress what
+            is written as it is written.
+
+    Returns:
+        file: Text stream, which encodes as UTF-8.
+    """
+    if not compress:
+        return open(out_file, mode="w", encoding="utf-8")
+    from importlib import import_module
+
+    module = import_module(COMPRESSION_FORMATS[compress][0])
+    return module.open(out_file, mode="wt", encoding="utf-8")
 
 
 def enumerate_combos(dict_with_lists):
@@ -141,25 +322,198 @@ def run(files, languages=[None], outpath=None, **kwargs):
 
     Args:
         files (list): Path to load source file.
-        languages (list): Languages to render forms.
+        languages (list): Languages to render forms. If ALL_LANGUAGES_TOKEN
+            is among them, each form is rendered in every language it has.
         output_format (str): File format to be output.
         outpath (str): Path of file name to save converted file if 1 file,
             else path to directory for multiple files, in which case file names
             will be automatically generated.
-        **debug (bool): Debugging on or off.
+        **debug (str): One of DEBUG_MODES, or None for debugging off.
         **highlight (bool): Highlighting on or off.
+        **assets (bool): If saving to a directory, write the stylesheet and
+            logo of each style once to its assets directory, and link to them
+            from 'html' documents rather than inline them into each.
+        **compress (str): One of COMPRESSION_FORMATS, to compress output
+            files as they are written.
+        **archive (str): Path of a zip archive to write all converted files
+            into, with a manifest of their options and hashes, instead of to
+            outpath. Assets, if requested, are written into the archive.
+        **progress (bool): Display the progress of the conversions, with
+            ETA, and a summary of the run at the end, on STDERR.
+        **metrics (str): Path of file to write a summary of the run to, as
+            JSON, or in the Prometheus text format if it ends with
+            PROMETHEUS_SUFFIX. See ConversionMetrics.summary().
+        **profile (int): Number of the most costly elements of each form
+            to report on STDERR, as timed by RenderProfiler.
+        **memprofile (int): Number of the top allocation sites of each stage
+            of each conversion to report on STDERR, with the peak and retained
+            memory of the stage, as profiled by MemoryProfiler.
+        **trace (str): Path of file to write a trace of the conversions to,
+            with spans of each conversion and its stages, as a ChromeTrace.
+
+    Returns:
+        dict: Paths of files mapped to warnings found while converting them,
+        as from OdkDiagnostics.to_list(). Each warning is printed once per
+        file, however many languages and combinations it is converted in.
     """
+    from pmix import Xlsform
+    from ppp.archive import OutputArchive
+    from ppp.config import write_assets
+    from ppp.metrics import ConversionMetrics, Progress, count, stage
+    from ppp.memprofile import MemoryProfiler
+    from ppp.profiler import RenderProfiler
+    from ppp.trace import ChromeTrace, conversion_tags
+    from ppp.odkdiagnostics import OdkDiagnostics
+    from ppp.odklanguageindex import OdkLanguageIndex
+
     _outpath = outpath
     _kwargs = copy(kwargs)
+    assets = _kwargs.pop("assets", False)
+    archive_path = _kwargs.pop("archive", None)
+    show_progress = _kwargs.pop("progress", False)
+    metrics_path = _kwargs.pop("metrics", None)
+    profile = _kwargs.pop("profile", None)
+    memprofile = _kwargs.pop("memprofile", None)
+    trace_path = _kwargs.pop("trace", None)
     combos = enumerate_combos(_kwargs)
-    num_output = num_args(files) * num_args(languages) * num_args(combos)
+    # The languages of a form are only known once it is read, so with
+    # ALL_LANGUAGES_TOKEN, it counts as 1 conversion per combination until
+    # then, and files are always created.
+    expand = ALL_LANGUAGES_TOKEN in languages
+    num_output = len(files) * num_args(combos) * (1 if expand else num_args(languages))
+    many = num_output > 1 or expand
 
-    if num_output > 1 or outpath:
+    if many or outpath or archive_path:
         print("Creating files.")
 
-    for file in files:
-        if num_output > 1 and not outpath:
-            _outpath = os.path.dirname(file) + "/"
-        for language in languages:
-            for combo in combos:
-                convert_file(file, language, outpath=_outpath, **combo)
+    warnings = {}
+    asset_urls = {}
+    archive = OutputArchive(archive_path) if archive_path else None
+    progress = Progress(num_output) if show_progress else None
+    metrics = ConversionMetrics()
+    trace = ChromeTrace()
+    # Stages are only observed if their metrics or trace are requested.
+    measuring = metrics if show_progress or metrics_path else nullcontext()
+    tracing = trace if trace_path else nullcontext()
+    try:
+        with measuring, tracing:
+            for file in files:
+                if many and not outpath:
+                    _outpath = os.path.dirname(file) + "/"
+                diagnostics = OdkDiagnostics()
+                wb, file_languages = None, languages
+                if expand:  # Read once, to list its languages and convert it.
+                    with stage("read", form=os.path.basename(file)):
+                        wb = Xlsform(file)
+                    file_languages = OdkLanguageIndex.survey_languages(wb) or [None]
+                    if progress:
+                        progress.add((len(file_languages) - 1) * num_args(combos))
+                for language in file_languages:
+                    for combo in combos:
+                        html = combo.get("format", "html") == "html"
+                        style = combo["style"] if "style" in combo else "default"
+                        if assets and archive and html:
+                            combo = {**combo, "assets": archive.add_assets(style)}
+                        elif assets and html and os.path.isdir(_outpath or ""):
+                            key = (_outpath, style)
+                            if key not in asset_urls:
+                                asset_urls[key] = write_assets(style, _outpath)
+                            combo = {**combo, "assets": asset_urls[key]}
+                        profiler = RenderProfiler(file)
+                        memprofiler = MemoryProfiler(memprofile)
+                        with profiler if profile else nullcontext():
+                            with memprofiler if memprofile else nullcontext():
+                                with stage(
+                                    "convert", **conversion_tags(file, language, combo)
+                                ):
+                                    convert_file(
+                                        file,
+                                        language,
+                                        _outpath,
+                                        diagnostics,
+                                        archive,
+                                        wb,
+                                        **combo
+                                    )
+                        if profile:
+                            profiler.report(top=profile)
+                        if memprofile:
+                            memprofiler.report(
+                                "{} ({})".format(file, language or "default")
+                            )
+                        if progress:
+                            progress.update(os.path.basename(file))
+                count(forms=1)
+                diagnostics.emit()
+                warnings[file] = diagnostics.to_list()
+    finally:
+        if archive:
+            archive.close()
+        if progress:
+            progress.close()
+    if archive:
+        print(archive_path)
+    if show_progress:
+        metrics.report()
+    if metrics_path:
+        metrics.write(metrics_path)
+    if trace_path:
+        trace.write(trace_path)
+    return warnings
+
+
+def check_file(in_file, languages=[None]):
+    """Check the structure of a form without rendering it.
+
+    Args:
+        in_file (str): Path to load source file.
+        languages (list): Languages to check.
+
+    Returns:
+        dict: Report of the file, whether it is 'ok', its 'errors', and its
+        'warnings', as from OdkDiagnostics.to_list(). Warnings do not make
+        a file not 'ok'.
+    """
+    from pmix import Xlsform
+    from ppp.odkform import OdkForm
+    from ppp.odkdiagnostics import OdkDiagnostics
+
+    diagnostics = OdkDiagnostics()
+    try:
+        wb = Xlsform(in_file)
+    # pylint: disable=broad-except
+    except Exception as err:  # Unreadable files are reported, as any error.
+        errors = [OdkForm.error_record(err)]
+    else:
+        errors = OdkForm.check(wb, languages, diagnostics)
+    return {
+        "file": in_file,
+        "languages": languages,
+        "ok": not errors,
+        "errors": errors,
+        "warnings": diagnostics.to_list(),
+    }
+
+
+def check(files, languages=[None], outpath=None):
+    """Check the structure of n files in n languages and report as JSON.
+
+    Args:
+        files (list): Paths to load source files.
+        languages (list): Languages to check.
+        outpath (str): Path of file to save report to. If not supplied, the
+            report is printed.
+
+    Returns:
+        list: Reports of each file, as from check_file().
+    """
+    import json
+
+    reports = [check_file(x, languages) for x in files]
+    output = json.dumps(reports, indent=2, ensure_ascii=False)
+    if outpath:
+        with open(outpath, mode="w", encoding="utf-8") as file:
+            file.write(output)
+    else:
+        print(output)
+    return reports
@@ -0,0 +1,299 @@
+"""Convert XLSForms from asyncio code, e.g. async web servers.
+
+Reading workbooks and rendering forms block, so they run in a bounded pool
+of threads, and at most a set number of conversions run at once; others
+wait their turn. Workbooks are cached by content hash, so that concurrent
+and repeated conversions of the same upload read it once.
+
+Classes
+- AsyncConverter: Executor, back-pressure, and workbook cache of conversions.
+
+Functions
+- render_whole: Render output which is not rendered in chunks.
+- get_converter: Get the converter of the module-level functions.
+- stream: Convert a form, yielding chunks of output as they are rendered.
+- convert: Convert a form.
+- convert_many: Convert n forms concurrently.
+"""
+import asyncio
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from weakref import WeakKeyDictionary
+
+CONVERTER = None
+
+
+def render_whole(render, **kwargs):
+    """Render output which is not rendered in chunks, on first iteration.
+
+    Args:
+        render: Method rendering the output, e.g. OdkForm.to_text.
+        **kwargs: Its arguments.
+
+    Yields:
+        str: The output.
+    """
+    yield render(**kwargs)
+
+
+class AsyncConverter:
+    """Class to run conversions from asyncio code.
+
+    Attributes:
+        executor (ThreadPoolExecutor): Threads to read and render forms in.
+        max_conversions (int): Number of conversions to run at once.
+        cache_size (int): Number of workbooks to keep.
+        workbooks (OrderedDict): Content hashes of source files mapped to
+            futures of their workbooks, least recently used first.
+    """
+
+    def __init__(self, max_workers=4, max_conversions=None, cache_size=16):
+        """Initialize a converter.
+
+        Args:
+            max_workers (int): Number of threads to read and render forms in.
+            max_conversions (int): Number of conversions to run at once.
+                Defaults to max_workers.
+            cache_size (int): Number of workbooks to keep.
+        """
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.max_conversions = max_conversions if max_conversions else max_workers
+        self.cache_size = cache_size
+        self.workbooks = OrderedDict()
+        self._semaphores = WeakKeyDictionary()
+
+    def __repr__(self):
+        """Print representation of instance."""
+        return "<AsyncConverter (conversions: {}, workbooks: {})>".format(
+            self.max_conversions, len(self.workbooks)
+        )
+
+    @property
+    def semaphore(self):
+        """asyncio.Semaphore: Limit of conversions of the running loop."""
+        loop = asyncio.get_event_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.max_conversions)
+        return self._semaphores[loop]
+
+    async def run(self, func, *args):
+        """Run a blocking function in the executor.
+
+        Args:
+            func: The function.
+            *args: Its arguments.
+
+        Returns:
+            The return of the function.
+        """
+        return await asyncio.get_event_loop().run_in_executor(
+            self.executor, func, *args
+        )
+
+    @staticmethod
+    def hash_file(path):
+        """Get the content hash of a file.
+
+        Args:
+            path (str): Path of file.
+
+        Returns:
+            str: Hex digest.
+        """
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 16), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    async def load(self, in_file):
+        """Read a workbook, or get it from the cache.
+
+        Concurrent loads of files with the same content share a single read.
+        Failed reads are not cached.
+
+        Args:
+            in_file (str): Path to load source file.
+
+        Returns:
+            Xlsform: The workbook.
+        """
+        from pmix import Xlsform
+
+        key = await self.run(self.hash_file, in_file)
+        if key in self.workbooks:
+            self.workbooks.move_to_end(key)
+        else:
+            self.workbooks[key] = asyncio.ensure_future(self.run(Xlsform, in_file))
+            while len(self.workbooks) > self.cache_size:
+                self.workbooks.popitem(last=False)
+        future = self.workbooks[key]
+        try:
+            return await asyncio.shield(future)
+        except Exception:
+            if self.workbooks.get(key) is future:
+                del self.workbooks[key]
+            raise
+
+    @staticmethod
+    def open_form(wb, language, diagnostics):
+        """Convert a workbook to a form in a language.
+
+        Args:
+            wb (Xlsform): The workbook.
+            language (str or None): Language to render form.
+            diagnostics (OdkDiagnostics): Collection to add warnings to.
+
+        Returns:
+            OdkForm: The form.
+
+        Raises:
+            InvalidLanguageException: If the form has no such language.
+        """
+        from ppp.odkform import OdkForm
+
+        form = OdkForm(wb, diagnostics)
+        form.language_index.validate(language)
+        return form
+
+    @staticmethod
+    def next_chunk(chunks):
+        """Render the next chunk of output.
+
+        Conversions render in the template environment of their own style,
+        so chunks of conversions in different styles can render at once.
+
+        Args:
+            chunks (iterator): Chunks of output, as from OdkForm.iter_html().
+
+        Returns:
+            str: The chunk, or None if there are no more.
+        """
+        return next(chunks, None)
+
+    async def stream(self, in_file, language=None, diagnostics=None, **kwargs):
+        """Convert a form, yielding chunks of output as they are rendered.
+
+        Args:
+            in_file (str): Path to load source file.
+            language (str or None): Language to render form.
+            diagnostics (OdkDiagnostics): Collection to add warnings to.
+            **kwargs: Options, as for convert_file(). Defaults to 'html'
+                format.
+
+        Yields:
+            str: Chunks of output.
+        """
+        from ppp.odkdiagnostics import OdkDiagnostics
+
+        kwargs = {"format": "html", **kwargs}
+        diagnostics = diagnostics if diagnostics is not None else OdkDiagnostics()
+        async with self.semaphore:
+            wb = await self.load(in_file)
+            form = await self.run(self.open_form, wb, language, diagnostics)
+            if kwargs["format"] == "text":
+                chunks = render_whole(form.to_text, lang=language)
+            elif kwargs.get("compact"):  # Compaction needs the whole document.
+                chunks = render_whole(form.to_html, lang=language, **kwargs)
+            else:
+                chunks = form.iter_html(lang=language, **kwargs)
+            while True:
+                chunk = await self.run(self.next_chunk, chunks)
+                if chunk is None:
+                    break
+                yield chunk
+
+    async def convert(self, in_file, language=None, diagnostics=None, **kwargs):
+        """Convert a form.
+
+        Args:
+            in_file (str): Path to load source file.
+            language (str or None): Language to render form.
+            diagnostics (OdkDiagnostics): Collection to add warnings to.
+            **kwargs: Options, as for stream().
+
+        Returns:
+            str: The output.
+        """
+        chunks = []
+        async for chunk in self.stream(in_file, language, diagnostics, **kwargs):
+            chunks.append(chunk)
+        return "".join(chunks)
+
+    async def convert_many(self, jobs, return_exceptions=False):
+        """Convert n forms concurrently, as many at once as allowed.
+
+        Args:
+            jobs (list): Conversions, dicts of source 'file', 'language', and
+                'options', as for convert_job().
+            return_exceptions (bool): Return errors as results, rather than
+                raise the first.
+
+        Returns:
+            list: Outputs of each conversion, in order.
+        """
+        return await asyncio.gather(
+            *(
+                self.convert(x["file"], x.get("language"), **x.get("options", {}))
+                for x in jobs
+            ),
+            return_exceptions=return_exceptions
+        )
+
+    def close(self):
+        """Shut down the executor."""
+        self.executor.shutdown(wait=False)
+
+
+def get_converter():
+    """Get the converter of the module-level functions, created on first use.
+
+    Returns:
+        AsyncConverter: The converter.
+    """
+    global CONVERTER
+    if CONVERTER is None:
+        CONVERTER = AsyncConverter()
+    return CONVERTER
+
+
+def stream(in_file, language=None, **kwargs):
+    """Convert a form, yielding chunks of output as they are rendered.
+
+    Args:
+        in_file (str): Path to load source file.
+        language (str or None): Language to render form.
+        **kwargs: Options, as for AsyncConverter.stream().
+
+    Returns:
+        async iterator: Chunks of output.
+    """
+    return get_converter().stream(in_file, language, **kwargs)
+
+
+async def convert(in_file, language=None, **kwargs):
+    """Convert a form.
+
+    Args:
+        in_file (str): Path to load source file.
+        language (str or None): Language to render form.
+        **kwargs: Options, as for AsyncConverter.stream().
+
+    Returns:
+        str: The output.
+    """
+    return await get_converter().convert(in_file, language, **kwargs)
+
+
+async def convert_many(jobs, return_exceptions=False):
+    """Convert n forms concurrently.
+
+    Args:
+        jobs (list): Conversions, as for AsyncConverter.convert_many().
+        return_exceptions (bool): Return errors as results.
+
+    Returns:
+        list: Outputs of each conversion, in order.
+    """
+    return await get_converter().convert_many(jobs, return_exceptions)
@@ -0,0 +1,103 @@
+"""Module for the OutputArchive class."""
+import hashlib
+import json
+import zipfile
+
+from ppp.config import read_asset
+from ppp.definitions.constants import (
+    ARCHIVE_MANIFEST_NAME,
+    ASSETS_DIRNAME,
+    STYLE_ASSETS,
+)
+
+
+class OutputArchive:
+    """Class to write converted forms into a zip archive as they are rendered.
+
+    Each converted form is streamed into its own entry, so no temporary files
+    are written. On closing, a manifest of the entries, the options each was
+    converted with, and hashes of their contents is added as
+    ARCHIVE_MANIFEST_NAME.
+
+    Attributes:
+        path (str): Path of the zip archive.
+        zip (zipfile.ZipFile): The archive, open for writing.
+        entries (list): Manifest records of the entries written.
+        assets (dict): Styles mapped to URLs of their assets in the archive,
+            as from add_assets().
+    """
+
+    def __init__(self, path):
+        """Initialize an archive, replacing any file at the path.
+
+        Args:
+            path (str): Path of the zip archive.
+        """
+        self.path = path
+        self.zip = zipfile.ZipFile(path, mode="w", compression=zipfile.ZIP_DEFLATED)
+        self.entries = []
+        self.assets = {}
+
+    def __repr__(self):
+        """Print representation of instance."""
+        return "<OutputArchive '{}' (entries: {})>".format(
+            self.path, len(self.entries)
+        )
+
+    def __enter__(self):
+        """Enter context."""
+        return self
+
+    def __exit__(self, *args):
+        """Write manifest and close archive on exiting context."""
+        self.close()
+
+    def write(self, name, chunks, **record):
+        """Write a converted form to an entry, piece by piece.
+
+        Args:
+            name (str): Name of the entry.
+            chunks (iterable): Pieces of the converted form, as from
+                OdkForm.iter_html().
+            **record: Details of the conversion for the manifest, e.g.
+                'source', 'language' and 'options'.
+
+        Returns:
+            dict: The manifest record of the entry.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        with self.zip.open(name, mode="w") as entry:
+            for chunk in chunks:
+                data = chunk.encode("utf-8")
+                digest.update(data)
+                size += len(data)
+                entry.write(data)
+        record = {"name": name, **record, "size": size, "sha256": digest.hexdigest()}
+        self.entries.append(record)
+        return record
+
+    def add_assets(self, style):
+        """Add the assets of a style to the archive, once.
+
+        Args:
+            style (str): The style, e.g. 'default'.
+
+        Returns:
+            str: URL of the assets directory relative to entries at the root
+            of the archive, ending with '/'.
+        """
+        if style not in self.assets:
+            url = "{}/{}/".format(ASSETS_DIRNAME, style)
+            for name in STYLE_ASSETS[style]:
+                self.zip.writestr(url + name, read_asset(style, name))
+            self.assets[style] = url
+        return self.assets[style]
+
+    def close(self):
+        """Write the manifest and close the archive."""
+        if self.zip.fp is None:  # Already closed.
+            return
+        manifest = json.dumps(self.entries, indent=2, ensure_ascii=False)
+        self.zip.writestr(ARCHIVE_MANIFEST_NAME, manifest)
+        self.zip.close()
@@ -0,0 +1,250 @@
+"""Convert XLSForms as listed in batch manifests.
+
+A manifest is a JSON list of jobs, or an object with such a list as 'jobs'.
+Each job names a source 'file' and, optionally, its 'languages', 'formats',
+'templates' and 'styles', as lists or single values, its 'outpath'
+directory, and other 'options', as for run(), e.g. {"highlight": true}.
+Relative paths are relative to the manifest.
+
+Functions
+- read_manifest: Expand the jobs of a manifest into single conversions.
+- convert_jobs: Convert a workbook with each of its conversions.
+- convert_job: Run a single conversion, reporting errors.
+- batch: Run the conversions of n manifests, largest forms first.
+"""
+import json
+import os
+import time
+from contextlib import redirect_stdout
+from itertools import repeat
+from sys import stderr
+
+from ppp import convert_file, enumerate_combos, get_out_file
+from ppp.definitions.constants import ALL_LANGUAGES_TOKEN
+from ppp.metrics import stage
+from ppp.trace import ChromeTrace, conversion_tags, traced
+
+# Keys of manifest jobs mapped to the conversion options they list, and the
+# values listed if a job has no such key, if any.
+JOB_LISTS = {
+    "languages": ("language", [None]),
+    "formats": ("format", ["html"]),
+    "templates": ("template", []),
+    "styles": ("style", []),
+}
+
+
+def job_key(job):
+    """Get a key which identical conversions have in common.
+
+    Args:
+        job (dict): A conversion, as from read_manifest().
+
+    Returns:
+        str: JSON of the conversion.
+    """
+    return json.dumps(job, sort_keys=True)
+
+
+def read_manifest(path):
+    """Expand the jobs of a manifest into single conversions.
+
+    Args:
+        path (str): Path of manifest.
+
+    Returns:
+        list: Conversions, each a dict of source 'file', 'language',
+        'outpath' directory, and 'options'. Identical conversions are
+        listed once.
+    """
+    with open(path, encoding="utf-8") as file:
+        manifest = json.load(file)
+    jobs = manifest["jobs"] if isinstance(manifest, dict) else manifest
+    base_dir = os.path.dirname(os.path.abspath(path))
+    conversions = {}
+    for job in jobs:
+        in_file = os.path.join(base_dir, job["file"])
+        outpath = os.path.join(base_dir, job.get("outpath", os.path.dirname(in_file)))
+        lists = {
+            option: value if isinstance(value, list) else [value]
+            for key, (option, default) in JOB_LISTS.items()
+            for value in [job.get(key, default)]
+            if value != []
+        }
+        for combo in enumerate_combos({**lists, **job.get("options", {})}):
+            language = combo.pop("language")
+            conversion = {
+                "file": in_file,
+                "language": language,
+                "outpath": os.path.join(outpath, ""),
+                "options": combo,
+            }
+            conversions.setdefault(job_key(conversion), conversion)
+    return list(conversions.values())
+
+
+def convert_jobs(in_file, jobs):
+    """Convert a workbook with each of its conversions.
+
+    The workbook is read once. Each conversion gets a new form, as rendering
+    alters components. Errors are reported, rather than raised.
+
+    Args:
+        in_file (str): Path to load source file.
+        jobs (list): Conversions of the file, as from read_manifest().
+
+    Returns:
+        list: Results of each conversion: the conversion, its 'out_file',
+        whether it is 'ok', its 'errors', 'warnings', and 'seconds' taken.
+    """
+    from pmix import Xlsform
+    from ppp.odkdiagnostics import OdkDiagnostics
+    from ppp.odkform import OdkForm
+
+    start = time.perf_counter()
+    try:
+        with stage("read", form=os.path.basename(in_file)):
+            wb = Xlsform(in_file)
+    # pylint: disable=broad-except
+    except Exception as err:  # Unreadable files are reported, as any error.
+        error = OdkForm.error_record(err)
+        seconds = round(time.perf_counter() - start, 3)
+        return [
+            {
+                **x,
+                "out_file": None,
+                "ok": False,
+                "errors": [error],
+                "warnings": [],
+                "seconds": seconds,
+            }
+            for x in jobs
+        ]
+    if any(x["language"] == ALL_LANGUAGES_TOKEN for x in jobs):
+        languages = OdkForm(wb).language_index.languages or [None]
+        expanded = {}
+        for job in jobs:
+            all_languages = job["language"] == ALL_LANGUAGES_TOKEN
+            for language in languages if all_languages else [job["language"]]:
+                conversion = {**job, "language": language}
+                expanded.setdefault(job_key(conversion), conversion)
+        jobs = list(expanded.values())
+
+    results = []
+    diagnostics = OdkDiagnostics()
+    for job in jobs:
+        job_diagnostics = OdkDiagnostics()
+        results.append(convert_job(job, wb, job_diagnostics))
+        diagnostics.extend(job_diagnostics)
+    diagnostics.emit()
+    return results
+
+
+def convert_job(job, wb=None, diagnostics=None):
+    """Run a single conversion. Errors are reported, rather than raised.
+
+    Args:
+        job (dict): A conversion, as from read_manifest().
+        wb (Xlsform): The workbook of the source file, if already read.
+        diagnostics (OdkDiagnostics): Collection to add warnings to. If not
+            supplied, they are only reported.
+
+    Returns:
+        dict: The conversion, its 'out_file', whether it is 'ok', its
+        'errors', 'warnings', and 'seconds' taken.
+    """
+    from ppp.odkdiagnostics import OdkDiagnostics
+    from ppp.odkform import OdkForm
+
+    start = time.perf_counter()
+    in_file, language, options = job["file"], job["language"], job["options"]
+    diagnostics = diagnostics if diagnostics is not None else OdkDiagnostics()
+    result = {**job, "out_file": None, "ok": True, "errors": []}
+    try:
+        os.makedirs(job["outpath"], exist_ok=True)
+        tags = conversion_tags(in_file, language, options)
+        with redirect_stdout(stderr), stage("convert", **tags):
+            convert_file(
+                in_file, language, job["outpath"], diagnostics, wb=wb, **options
+            )
+        result["out_file"] = get_out_file(in_file, language, job["outpath"], **options)
+    # pylint: disable=broad-except
+    except Exception as err:
+        result["ok"] = False
+        result["errors"].append(OdkForm.error_record(err))
+    result["warnings"] = diagnostics.to_list()
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def batch(manifests, outpath=None, workers=None, trace=None):
+    """Run the conversions of n manifests, and report their results as JSON.
+
+    Conversions are grouped by source file, so that each workbook is read
+    once. Files are converted in order of estimated cost, largest first, so
+    that with several workers the longest conversions do not come last. The
+    cost of a file is estimated as its size, which grows with its number of
+    rows, times its number of conversions, which grows with its languages.
+
+    Args:
+        manifests (list): Paths of manifests.
+        outpath (str): Path of file to save report to. If not supplied, the
+            report is printed.
+        workers (int): Number of processes to convert files in. If not
+            supplied, files are converted in this process.
+        trace (str): Path of file to write a trace of the conversions to, as
+            a ChromeTrace, with spans of each file, conversion and stage, in
+            the process they ran in.
+
+    Returns:
+        dict: Report of the conversions, their 'results', as from
+        convert_jobs(), grouped by file in manifest order, whether all are
+        'ok', and the 'seconds' taken.
+    """
+    start = time.perf_counter()
+    conversions = {}
+    for manifest in manifests:
+        for job in read_manifest(manifest):
+            conversions.setdefault(job_key(job), job)
+    by_file = {}
+    for job in conversions.values():
+        by_file.setdefault(job["file"], []).append(job)
+
+    def cost(in_file):
+        """Estimate the cost of converting a file with all its conversions."""
+        size = os.path.getsize(in_file) if os.path.exists(in_file) else 0
+        return size * len(by_file[in_file])
+
+    files = sorted(by_file, key=cost, reverse=True)
+    func, args = convert_jobs, [files, [by_file[x] for x in files]]
+    if trace:  # Each file is traced in the process it is converted in.
+        tags = [{"form": os.path.basename(x)} for x in files]
+        func, args = traced, [repeat("file"), tags, repeat(convert_jobs), *args]
+    if workers and workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=min(workers, len(files))) as executor:
+            file_results = list(executor.map(func, *args))
+    else:
+        file_results = list(map(func, *args))
+    if trace:
+        chrome_trace = ChromeTrace()
+        for _, events in file_results:
+            chrome_trace.extend(events)
+        chrome_trace.write(trace)
+        file_results = [x[0] for x in file_results]
+
+    results = [x for in_file in by_file for x in file_results[files.index(in_file)]]
+    report = {
+        "manifests": manifests,
+        "ok": all(x["ok"] for x in results),
+        "seconds": round(time.perf_counter() - start, 3),
+        "results": results,
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if outpath:
+        with open(outpath, mode="w", encoding="utf-8") as file:
+            file.write(output)
+    else:
+        print(output)
+    return report
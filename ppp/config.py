@@ -1,7 +1,16 @@
 """Configuration settings for PPP package."""
+from base64 import b64encode
+from functools import lru_cache
 from jinja2 import Environment, PackageLoader
+import os
 import re
 
+from ppp.definitions.constants import ASSETS_DIRNAME, NODE_TEMPLATES, STYLE_ASSETS
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "templates")
+# Style of renderings without a 'style' option, as set by set_template_style().
+TEMPLATE_STYLE = "default"
+
 
 def question_number(question_num, max_length=4):
     """Splitting question number.
@@ -50,9 +59,13 @@ def question_number(question_num, max_length=4):
     return " ".join(pieces)
 
 
+@lru_cache(maxsize=None)
 def get_template_env(template):
     """Get Jinja2 template environment.
 
+    Each environment is created once, and shared by all renderings in its
+    style, in any thread.
+
     Args:
         template (string): The template chosen.
 
@@ -66,3 +79,129 @@ def get_template_env(template):
     )
     env.filters["question_number"] = question_number
     return env
+
+
+def set_template_style(style):
+    """Set the style of renderings without a 'style' option.
+
+    Args:
+        style (str): The style, e.g. 'default'.
+    """
+    global TEMPLATE_STYLE
+    TEMPLATE_STYLE = style
+
+
+def template_style(style=None):
+    """Get the style of a rendering.
+
+    Args:
+        style (str): The 'style' option of the rendering, if any.
+
+    Returns:
+        str: The style, or the one set by set_template_style() if None.
+    """
+    return style if style else TEMPLATE_STYLE
+
+
+def render_env(style=None):
+    """Get the template environment of a rendering.
+
+    Renderings get their environment from their own options, rather than
+    from a global, so that renderings in different styles can run in
+    several threads at once.
+
+    Args:
+        style (str): The 'style' option of the rendering, if any.
+
+    Returns:
+        jinja2.Environment: The environment of the style, as from
+        get_template_env().
+    """
+    return get_template_env(template_style(style))
+
+
+@lru_cache(maxsize=None)
+def read_asset(style, name):
+    """Read an asset of a style.
+
+    Args:
+        style (str): The style, e.g. 'default'.
+        name (str): File name of the asset, one of STYLE_ASSETS[style].
+
+    Returns:
+        bytes: Contents of the file.
+    """
+    with open(os.path.join(TEMPLATES_DIR, style, name), "rb") as file:
+        return file.read()
+
+
+@lru_cache(maxsize=None)
+def asset_data_uri(style, name, media_type="image/png"):
+    """Get an asset of a style as a data URI, to inline it into a document.
+
+    Args:
+        style (str): The style, e.g. 'default'.
+        name (str): File name of the asset.
+        media_type (str): Media type of the asset.
+
+    Returns:
+        str: The data URI.
+    """
+    data = b64encode(read_asset(style, name)).decode("ascii")
+    return "data:{};base64,{}".format(media_type, data)
+
+
+def write_assets(style, outpath):
+    """Write the assets of a style to the assets directory of a directory.
+
+    Args:
+        style (str): The style, e.g. 'default'.
+        outpath (str): Directory which documents are saved to.
+
+    Returns:
+        str: URL of the assets directory relative to documents in outpath,
+        ending with '/'.
+    """
+    directory = os.path.join(outpath, ASSETS_DIRNAME, style)
+    os.makedirs(directory, exist_ok=True)
+    for name in STYLE_ASSETS[style]:
+        with open(os.path.join(directory, name), "wb") as file:
+            file.write(read_asset(style, name))
+    return "{}/{}/".format(ASSETS_DIRNAME, style)
+
+
+def iter_nodes(env, nodes, backend="templates", **kwargs):
+    """Render nodes piece by piece, as for render_nodes().
+
+    Args:
+        env (jinja2.Environment): The environment of chosen template.
+        nodes (list): Tuples of macro name and dict of macro arguments.
+        backend (str): One of RENDER_BACKENDS.
+        **kwargs: Context of the templates.
+
+    Yields:
+        str: Pieces of the rendering, in order.
+    """
+    if backend == "document":
+        yield from env.get_template("document.html").generate(nodes=nodes, **kwargs)
+        return
+    for name, args in nodes:
+        yield env.get_template(NODE_TEMPLATES[name]).render(**{**kwargs, **args})
+
+
+def render_nodes(env, nodes, backend="templates", **kwargs):
+    """Render nodes, the macro calls which form components are rendered as.
+
+    Args:
+        env (jinja2.Environment): The environment of chosen template.
+        nodes (list): Tuples of macro name and dict of macro arguments, as
+            from the to_nodes() methods of form components.
+        backend (str): 'templates' renders each node with its own template,
+            as from NODE_TEMPLATES. 'document' renders all nodes with a single
+            invocation of 'document.html', which calls the macros in a loop.
+        **kwargs: Context of the templates, e.g. 'format' and 'highlight'.
+
+    Returns:
+        str: Concatenated rendering of nodes.
+    """
+    return "".join(iter_nodes(env, nodes, backend, **kwargs))
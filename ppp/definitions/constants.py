@@ -8,6 +8,28 @@ LANGUAGE_DEPENDENT_FIELDS (tuple): Fields for which values can vary by
 TRUNCATABLE_FIELDS (tuple): Fields that should be limited to a specific
     length. Current limit is 100 chars, which is somewhat arbitrary but
     turns out good in converted forms.
+DEPENDENCY_FIELDS (tuple): Logic fields in which references to other
+    variables, of the form '${name}', make a variable depend on another.
+NODE_TEMPLATES (dict): Names of the macros in 'macros.html' which form
+    components are rendered with, mapped to the templates which render each
+    macro on its own, for the 'templates' render backend.
+RENDER_BACKENDS (tuple): 'templates' renders each node of a form with its
+    own template. 'document' renders all nodes with a single template.
+STYLE_ASSETS (dict): Styles mapped to the files in their template
+    directory which are inlined into html documents, or, with the 'assets'
+    option, written once to the ASSETS_DIRNAME directory of the output
+    directory and linked to from each document.
+COMPRESSION_FORMATS (dict): Compression formats for output files mapped to
+    the standard library module which writes them and their file suffix.
+DEBUG_MODES (tuple): 'sidecar' writes debug data to a JSON file next to
+    each converted file. 'inline' embeds it in the converted file, to be
+    printed in the JavaScript console.
+ARCHIVE_MANIFEST_NAME (str): Name of the entry of a zip archive of
+    converted forms which lists the other entries.
+PROMETHEUS_SUFFIX (str): Suffix of metrics files which are written in the
+    Prometheus text format, rather than as JSON.
+BLOCK_TAGS (tuple): HTML tags around which whitespace is not rendered, and
+    so is removed from compact output.
 """
 ODK_SUPERGLOBALS = (
     "start",
@@ -46,7 +68,61 @@ LANGUAGE_DEPENDENT_FIELDS_NONMEDIA_FIELDS = (
 LANGUAGE_DEPENDENT_FIELDS = LANGUAGE_DEPENDENT_FIELDS_NONMEDIA_FIELDS + MEDIA_FIELDS
 RELEVANCE_FIELD_TOKENS = ("relevant", "relevance")
 TRUNCATABLE_FIELDS = ("constraint",) + RELEVANCE_FIELD_TOKENS
+DEPENDENCY_FIELDS = RELEVANCE_FIELD_TOKENS + (
+    "calculation",
+    "constraint",
+    "choice_filter",
+)
+NODE_TEMPLATES = {
+    "content_tr_base": "content/content-tr-base.html",
+    "group_opener": "content/group/group-opener.html",
+    "group_closer": "content/group/group-closer.html",
+    "group_spacing": "content/group/group-spacing.html",
+    "repeat_opener": "content/repeat/repeat-opener.html",
+    "repeat_closer": "content/repeat/repeat-closer.html",
+    "odk_table": "content/table/table.html",
+}
+RENDER_BACKENDS = ("templates", "document")
+STYLE_ASSETS = {"default": ("style.css", "logo.png"), "old": ("style.css",)}
+ASSETS_DIRNAME = "assets"
+COMPRESSION_FORMATS = {
+    "gzip": ("gzip", ".gz"),
+    "bz2": ("bz2", ".bz2"),
+    "xz": ("lzma", ".xz"),
+}
+ARCHIVE_MANIFEST_NAME = "manifest.json"
+DEBUG_MODES = ("sidecar", "inline")
+PROMETHEUS_SUFFIX = ".prom"
+BLOCK_TAGS = (
+    "html",
+    "head",
+    "body",
+    "title",
+    "meta",
+    "link",
+    "div",
+    "p",
+    "br",
+    "hr",
+    "h1",
+    "h2",
+    "h3",
+    "h4",
+    "h5",
+    "h6",
+    "table",
+    "thead",
+    "tbody",
+    "tfoot",
+    "tr",
+    "td",
+    "th",
+    "ul",
+    "ol",
+    "li",
+)
 MULTI_ARGUMENT_CONVERSION_OPTIONS = ("template", "format", "language")
+ALL_LANGUAGES_TOKEN = "all"
 PPP_REPLACEMENTS_FIELDS = ("label",) + RELEVANCE_FIELD_TOKENS
 CHOICE_NAME_VARIATIONS = ("name", "value")
 TEMPLATES = {
@@ -1,5 +1,19 @@
 """Utils."""
-from ppp.definitions.constants import EXCLUSION_TOKEN, TEMPLATES
+import re
+
+from ppp.definitions.constants import BLOCK_TAGS, EXCLUSION_TOKEN, TEMPLATES
+
+PRESERVED_ELEMENTS_PATTERN = re.compile(
+    r"(<(?:script|style|pre|textarea)\b.*?</(?:script|style|pre|textarea)\s*>)",
+    re.DOTALL | re.IGNORECASE,
+)
+INVISIBLE_ELEMENT_PATTERN = re.compile(r"<(?:script|style)\b", re.IGNORECASE)
+# Conditional comments, '<!--[if ...]>', are read by MS Word.
+HTML_COMMENT_PATTERN = re.compile(r"<!--(?!\[if).*?-->", re.DOTALL)
+WHITESPACE_PATTERN = re.compile(r"\s+")
+BLOCK_TAG_PATTERN = re.compile(
+    r"\s*(</?(?:{})\b[^>]*>)\s*".format("|".join(BLOCK_TAGS)), re.IGNORECASE
+)
 
 
 def exclusion(item, settings):
@@ -58,3 +72,34 @@ def exclusion(item, settings):
             raise KeyError(msg)
         else:
             return exclude
+
+
+def compact_html(html):
+    """Strip insignificant whitespace and comments from HTML.
+
+    Runs of whitespace are collapsed to a single space, and whitespace next
+    to block-level tags, where it is not rendered, is removed. The contents
+    of 'script', 'style', 'pre' and 'textarea' elements are left as is.
+
+    Args:
+        html (str): HTML document or fragment.
+
+    Returns:
+        str: Compacted HTML.
+    """
+    parts = PRESERVED_ELEMENTS_PATTERN.split(html)
+    output = []
+    # Split parts alternate between text and preserved elements.
+    for i, part in enumerate(parts):
+        if i % 2:
+            output.append(part)
+            continue
+        text = HTML_COMMENT_PATTERN.sub("", part)
+        text = WHITESPACE_PATTERN.sub(" ", text)
+        text = BLOCK_TAG_PATTERN.sub(r"\1", text)
+        if i > 0 and INVISIBLE_ELEMENT_PATTERN.match(parts[i - 1]):
+            text = text.lstrip()
+        if i < len(parts) - 1 and INVISIBLE_ELEMENT_PATTERN.match(parts[i + 1]):
+            text = text.rstrip()
+        output.append(text)
+    return "".join(output)
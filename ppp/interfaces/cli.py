@@ -2,11 +2,16 @@
 # -*- coding: utf-8 -*-
 """Command Line Interface."""
 from argparse import ArgumentParser
-from sys import stderr
+from sys import stderr, exit as sys_exit
 from copy import copy
 
-from ppp import run
-from ppp.definitions.constants import SUPPORTED_FORMATS
+from ppp import run, check
+from ppp.definitions.constants import (
+    COMPRESSION_FORMATS,
+    PROMETHEUS_SUFFIX,
+    RENDER_BACKENDS,
+    SUPPORTED_FORMATS,
+)
 from ppp.definitions.abstractions import chain
 from ppp.definitions.error import OdkException, OdkFormError
 
@@ -60,7 +65,8 @@ def _non_template_optional_fields(parser):
         "Language to write the paper version in. If not specified, the "
         "'default_language' in the 'settings' worksheet is used. If that "
         "is not specified and more than one language is in the XLSForm, the "
-        "language that comes first alphabetically will be used."
+        "language that comes first alphabetically will be used. Use 'all' "
+        "for every language in each XLSForm."
     )
     parser.add_argument("-l", "--language", nargs="+", help=language_help)
 
@@ -91,6 +97,28 @@ def _non_template_optional_fields(parser):
         default="default",
         help=style_help,
     )
+    # Render backend
+    #   type='single selection', default:'templates'
+    backend_help = (
+        "How to render the survey. 'templates' renders each component with "
+        "its own template. 'document' renders the whole survey in a single "
+        "template, which is faster for large forms. Output is the same."
+    )
+    parser.add_argument(
+        "-b",
+        "--backend",
+        choices=RENDER_BACKENDS,
+        default="templates",
+        help=backend_help,
+    )
+    # Parallel rendering
+    #   type='int', default:None
+    workers_help = (
+        "Number of processes to render the sections of each survey in, "
+        "split at section headers and top-level groups. Speeds up rendering "
+        "of large forms on multiple cores. Output is the same."
+    )
+    parser.add_argument("-j", "--workers", type=int, metavar="N", help=workers_help)
     return parser
 
 
@@ -191,11 +219,25 @@ def _cli_only_fields(parser):
         ArgumentParser: Argeparse object.
     """
     debug_help = (
-        "Turns on debug mode. Currently only works for 'html' format. Only"
-        " feature of debug mode currently is that it prints a stringified "
-        "JSON representation of survey to the JavaScript console."
+        "Turns on debug mode. Writes the rows of the survey and the converted "
+        "form as JSON to a file next to each converted file, named like it "
+        "with a '.json' suffix. If printing to STDOUT, acts as -D/--debug-inline."
+    )
+    parser.add_argument(
+        "-d", "--debug", action="store_const", const="sidecar", help=debug_help
+    )
+    debug_inline_help = (
+        "Turns on debug mode, printing a stringified JSON representation of "
+        "survey to the JavaScript console. Only works for 'html' format."
+    )
+    parser.add_argument(
+        "-D",
+        "--debug-inline",
+        dest="debug",
+        action="store_const",
+        const="inline",
+        help=debug_inline_help,
     )
-    parser.add_argument("-d", "--debug", action="store_true", help=debug_help)
 
     # Survey Form Component Highlighting
     highlighting_help = (
@@ -206,6 +248,14 @@ def _cli_only_fields(parser):
         "-H", "--highlight", action="store_true", help=highlighting_help
     )
 
+    # Compact output
+    compact_help = (
+        "Compact output. Whitespace which is not rendered is removed, and, "
+        "in 'html' format, stylesheet classes are used instead of repeated "
+        "inline styles. Renders the same as the default output."
+    )
+    parser.add_argument("-k", "--compact", action="store_true", help=compact_help)
+
     # Out path
     out_help = (
         "Path (including file name) to save converted file if 1 file, "
@@ -214,6 +264,131 @@ def _cli_only_fields(parser):
         "is not supplied, then STDOUT is used."
     )
     parser.add_argument("-o", "--outpath", help=out_help)
+
+    # Assets
+    assets_help = (
+        "When saving html files to a directory, writes the stylesheet and "
+        "logo once to an 'assets' folder in it, and links to them from each "
+        "file, rather than including them in every file."
+    )
+    parser.add_argument("-a", "--assets", action="store_true", help=assets_help)
+
+    # Compression
+    compress_help = (
+        "Compresses output files as they are written, adding the suffix of "
+        "the compression format to their names. No uncompressed copy is "
+        "written. If -o/--outpath is not supplied, compressed output is "
+        "written to STDOUT."
+    )
+    parser.add_argument(
+        "-z", "--compress", choices=list(COMPRESSION_FORMATS), help=compress_help
+    )
+
+    # Archive
+    archive_help = (
+        "Path of a zip archive to write all converted files into, as they are "
+        "rendered, instead of to -o/--outpath. The archive includes a "
+        "'manifest.json' listing the options and SHA-256 hash of each file."
+    )
+    parser.add_argument("-A", "--archive", metavar="PATH", help=archive_help)
+
+    # Progress
+    progress_help = (
+        "Displays the progress of the conversions on STDERR, with the time "
+        "each took and an ETA, and at the end a summary of forms and rows "
+        "converted per second, bytes written, time per stage, and cache hit "
+        "rates. Uses tqdm if it is installed."
+    )
+    parser.add_argument("-P", "--progress", action="store_true", help=progress_help)
+
+    # Metrics
+    metrics_help = (
+        "Path of a file to write a summary of the run to, as JSON, or in "
+        "the Prometheus text format if it ends with '{}', e.g. for the "
+        "textfile collector of the node exporter.".format(PROMETHEUS_SUFFIX)
+    )
+    parser.add_argument("-M", "--metrics", metavar="PATH", help=metrics_help)
+
+    # Profile
+    profile_help = (
+        "Times the preparation and rendering of each prompt, group, repeat "
+        "and table, and reports the N most costly elements of each form on "
+        "STDERR, with their row numbers, number of choices and number of "
+        "non-empty columns. N is 20 by default."
+    )
+    parser.add_argument(
+        "-R",
+        "--profile",
+        nargs="?",
+        type=int,
+        const=20,
+        metavar="N",
+        help=profile_help,
+    )
+
+    memprofile_help = (
+        "Traces memory allocations, and reports the peak and retained memory "
+        "of each stage of each conversion on STDERR: reading the workbook, "
+        "getting choices, converting the survey, numbering questions, and "
+        "rendering or writing, with the N top allocation sites of each. N is "
+        "5 by default. Slows conversions down."
+    )
+    parser.add_argument(
+        "-m",
+        "--memprofile",
+        nargs="?",
+        type=int,
+        const=5,
+        metavar="N",
+        help=memprofile_help,
+    )
+
+    trace_help = (
+        "Writes a trace of the conversions to PATH, as Chrome trace events, "
+        "with a span of each conversion and of its stages, in the process it "
+        "ran in, tagged with its form, language, format and template. Open "
+        "it in a trace viewer, such as Perfetto or chrome://tracing, to see "
+        "how conversions are scheduled across -j/--workers processes."
+    )
+    parser.add_argument("-T", "--trace", metavar="PATH", help=trace_help)
+
+    # Check
+    check_help = (
+        "Only checks the XlsForm(s) for errors, in each language, without "
+        "converting them. All errors found are reported as JSON, to STDOUT "
+        "or to -o/--outpath. Exits with status 1 if any errors are found."
+    )
+    parser.add_argument("-c", "--check", action="store_true", help=check_help)
+
+    # Batch
+    batch_help = (
+        "Reads the positional arguments as batch manifests, JSON lists of "
+        "jobs of a source file and its languages, formats, templates, "
+        "styles, outpath, and other options, and runs each distinct "
+        "conversion once. Each XlsForm is read once, and the largest are "
+        "converted first, in -j/--workers processes. A report of each "
+        "conversion is written as JSON to STDOUT or to -o/--outpath. Exits "
+        "with status 1 if any conversion failed."
+    )
+    parser.add_argument("-B", "--batch", action="store_true", help=batch_help)
+
+    # Watch
+    watch_help = (
+        "Keeps running, converting the XlsForm(s) again every time they are "
+        "saved. Only the parts of the form which changed are rendered again. "
+        "Optionally takes the number of seconds between checks for changes, "
+        "which is 1 by default. If -o/--outpath is not supplied, files are "
+        "saved next to the XlsForm(s)."
+    )
+    parser.add_argument(
+        "-w",
+        "--watch",
+        nargs="?",
+        type=float,
+        const=1.0,
+        metavar="SECONDS",
+        help=watch_help,
+    )
     return parser
 
 
@@ -261,15 +436,83 @@ def cli():
         )
         raise OdkFormError(msg)
 
+    if args.check:
+        reports = check(
+            files=list(args.xlsxfiles),
+            languages=list(args.language) if args.language else [None],
+            outpath=args.outpath,
+        )
+        sys_exit(0 if all(x["ok"] for x in reports) else 1)
+
+    if args.batch:
+        from ppp.batch import batch
+
+        report = batch(
+            manifests=list(args.xlsxfiles),
+            outpath=args.outpath,
+            workers=args.workers,
+            trace=args.trace,
+        )
+        sys_exit(0 if report["ok"] else 1)
+
+    if args.watch:
+        unsupported = [
+            flag
+            for flag, value in (
+                ("-z/--compress", args.compress),
+                ("-a/--assets", args.assets),
+                ("-A/--archive", args.archive),
+                ("-j/--workers", args.workers),
+                ("-P/--progress", args.progress),
+                ("-M/--metrics", args.metrics),
+                ("-R/--profile", args.profile),
+                ("-m/--memprofile", args.memprofile),
+                ("-T/--trace", args.trace),
+            )
+            if value
+        ]
+        if unsupported:
+            parser.error(
+                "-w/--watch cannot be used with {}.".format(", ".join(unsupported))
+            )
+
     try:
+        if args.watch:
+            from ppp.watch import watch
+
+            watch(
+                files=list(args.xlsxfiles),
+                languages=list(args.language) if args.language else [None],
+                format=args.format,
+                debug=args.debug,
+                highlight=args.highlight,
+                compact=args.compact,
+                template=args.template,
+                style=args.style,
+                backend=args.backend,
+                outpath=args.outpath,
+                interval=args.watch,
+            )
+            return
         run(
             files=list(args.xlsxfiles),
             languages=[l for l in args.language] if args.language else [None],
             format=args.format,
             debug=args.debug,
             highlight=args.highlight,
+            compact=args.compact,
+            assets=args.assets,
+            compress=args.compress,
+            archive=args.archive,
+            progress=args.progress,
+            metrics=args.metrics,
+            profile=args.profile,
+            memprofile=args.memprofile,
+            trace=args.trace,
             template=args.template,
             style=args.style,
+            backend=args.backend,
+            workers=args.workers,
             outpath=args.outpath,
         )
     except OdkException as err:
@@ -0,0 +1,196 @@
+"""Profile the memory of conversions, stage by stage, with tracemalloc.
+
+Classes
+- MemoryProfiler: Peak and retained memory, and top allocation sites, of
+  each stage of conversions.
+"""
+import tracemalloc
+from sys import stderr
+
+from ppp.metrics import StageObserver
+
+# Stages which are profiled, in the order conversions run them. Chunks of
+# output rendered while they are written count towards 'write'.
+PROFILED_STAGES = ("read", "choices", "survey", "numbering", "render", "write")
+
+
+class MemoryProfiler(StageObserver):
+    """Class to profile the memory of conversions, stage by stage.
+
+    Traces allocations with tracemalloc while active. For each stage in
+    PROFILED_STAGES, the peak memory above that at its start, and the memory
+    it retained at its end, are recorded. A snapshot is taken after each
+    stage, and the allocation sites which grew the most since the previous
+    snapshot are recorded with it. Snapshots are taken between stages, so
+    that they do not count towards them. Snapshots of large forms take
+    seconds, so they are only taken if allocation sites are to be recorded.
+
+    Attributes:
+        top (int): Number of allocation sites to record per stage. If 0,
+            only peak and retained memory are recorded.
+        stages (list): Records of stages, in order: 'stage' name, 'peak'
+            and 'retained' bytes, and top allocation 'sites'.
+        peak (int): Peak bytes traced, above those traced on activation.
+        retained (int): Bytes traced on deactivation, above those traced on
+            activation.
+    """
+
+    def __init__(self, top=5):
+        """Initialize a profiler.
+
+        Args:
+            top (int): Number of allocation sites to record per stage.
+        """
+        self.top = top
+        self.stages = []
+        self.peak = 0
+        self.retained = 0
+        self._started = False
+        self._start = 0
+        self._sites = {}
+        self._stack = []
+
+    def __repr__(self):
+        """Print representation of instance."""
+        return "<MemoryProfiler (stages: {}, peak: {})>".format(
+            len(self.stages), self.peak
+        )
+
+    def __enter__(self):
+        """Start tracing allocations, if not already, and profiling."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started = True
+        self._sites = self.sites()
+        tracemalloc.reset_peak()
+        self._start = tracemalloc.get_traced_memory()[0]
+        return super().__enter__()
+
+    def __exit__(self, *args):
+        """Stop profiling, and tracing allocations if started on entering."""
+        super().__exit__(*args)
+        current, peak = tracemalloc.get_traced_memory()
+        self.peak = max(self.peak, peak - self._start)
+        self.retained = current - self._start
+        self._sites = {}
+        if self._started:
+            tracemalloc.stop()
+            self._started = False
+
+    def sites(self):
+        """Take a snapshot of the memory allocated by each site.
+
+        Allocations of profiling are left out. Sites are filtered after
+        grouping traces by them, which is much faster than filtering traces.
+
+        Returns:
+            dict: Files and line numbers of sites mapped to the bytes and
+            number of blocks allocated there. Empty if top is 0.
+        """
+        if not self.top:
+            return {}
+        sites = {}
+        for stat in tracemalloc.take_snapshot().statistics("lineno"):
+            frame = stat.traceback[0]
+            if frame.filename not in (tracemalloc.__file__, __file__):
+                sites[(frame.filename, frame.lineno)] = (stat.size, stat.count)
+        return sites
+
+    def start_stage(self, name, tags):
+        """Record memory at the start of a stage.
+
+        Args:
+            name (str): Name of the stage.
+            tags (dict): Details of the stage.
+        """
+        streamed = any(x[0] == "write" for x in self._stack)
+        if name not in PROFILED_STAGES or streamed:
+            self._stack.append((name, None))
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        self.peak = max(self.peak, peak - self._start)
+        tracemalloc.reset_peak()
+        self._stack.append((name, current))
+
+    def end_stage(self, name, seconds, self_seconds, tags):
+        """Record peak and retained memory of a stage, and take a snapshot.
+
+        Args:
+            name (str): Name of the stage.
+            seconds (float): Seconds spent in the stage.
+            self_seconds (float): Seconds spent in the stage, but not in
+                stages nested in it.
+            tags (dict): Details of the stage.
+        """
+        start = self._stack.pop()[1]
+        if start is None:
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        self.peak = max(self.peak, peak - self._start)
+        sites = self.sites()
+        diff = []
+        for key, (size, n) in sites.items():
+            prev_size, prev_n = self._sites.get(key, (0, 0))
+            diff.append((size - prev_size, n - prev_n) + key)
+        diff.sort(reverse=True)
+        self._sites = sites
+        self.stages.append(
+            {
+                "stage": name,
+                "peak": peak - start,
+                "retained": current - start,
+                "sites": [
+                    {"site": "{}:{}".format(path, line), "size": size, "count": n}
+                    for size, n, path, line in diff[: self.top]
+                    if size > 0
+                ],
+            }
+        )
+        tracemalloc.reset_peak()
+
+    def summary(self):
+        """Get the profile of the conversions.
+
+        Returns:
+            dict: 'peak' and 'retained' bytes, and records of 'stages'.
+        """
+        return {"peak": self.peak, "retained": self.retained, "stages": self.stages}
+
+    def report(self, title="", file=stderr):
+        """Print the profile for people.
+
+        Args:
+            title (str): What was profiled, e.g. the source file.
+            file (file): Stream to print to.
+        """
+
+        def mib(size):
+            """Format bytes as MiB."""
+            return "{:.2f}".format(size / 2 ** 20)
+
+        print(
+            "Memory of {}: peak {} MiB, retained {} MiB.".format(
+                title, mib(self.peak), mib(self.retained)
+            ),
+            file=file,
+        )
+        line = "{:<10} {:>9} {:>9}  {}"
+        print(
+            line.format("stage", "peak", "retained", "top allocation sites"),
+            file=file,
+        )
+        for record in self.stages:
+            sites = [
+                "{} MiB {}".format(mib(x["size"]), x["site"]) for x in record["sites"]
+            ]
+            print(
+                line.format(
+                    record["stage"],
+                    mib(record["peak"]),
+                    mib(record["retained"]),
+                    sites[0] if sites else "",
+                ),
+                file=file,
+            )
+            for site in sites[1:]:
+                print(line.format("", "", "", site), file=file)
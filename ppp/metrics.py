@@ -0,0 +1,445 @@
+"""Measure conversions: progress, throughput, and time per stage.
+
+Code being measured marks its stages with stage(), and its counts with
+count(). Both do nothing unless an observer, e.g. a ConversionMetrics, is
+active in the current context, so conversions which are not measured do not
+pay for it.
+
+Classes
+- StageObserver: Base class of observers of stages and counts.
+- ConversionMetrics: Counts, stage times, and cache hit rates of a run.
+- Progress: Progress display of the conversions of a run, with ETA.
+
+Functions
+- stage: Time a stage of a conversion.
+- count: Add to the counts of a conversion.
+- timed_chunks: Time the rendering of chunks of output.
+- cached_functions: Cached functions of the package, by name.
+"""
+import json
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sys import stderr
+
+from ppp.definitions.constants import PROMETHEUS_SUFFIX
+
+# Observers of stages and counts in the current context, innermost last.
+STAGE_OBSERVERS = ContextVar("stage_observers", default=())
+# Seconds spent in stages nested in the current stage, if in one.
+CURRENT_STAGE = ContextVar("current_stage", default=None)
+
+
+@contextmanager
+def stage(name, **tags):
+    """Time a stage of a conversion, e.g. 'load', 'render' or 'write'.
+
+    Time spent in stages nested in a stage is not counted towards its own
+    time, e.g. rendering chunks of output while writing them.
+
+    Args:
+        name (str): Name of the stage.
+        **tags: Details of the stage, e.g. the 'file' converted.
+    """
+    observers = STAGE_OBSERVERS.get()
+    if not observers:
+        yield
+        return
+    nested = [0.0]
+    token = CURRENT_STAGE.set(nested)
+    for observer in observers:
+        observer.start_stage(name, tags)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        CURRENT_STAGE.reset(token)
+        for observer in reversed(observers):
+            observer.end_stage(name, seconds, seconds - nested[0], tags)
+        outer = CURRENT_STAGE.get()
+        if outer is not None:
+            outer[0] += seconds
+
+
+def count(**counts):
+    """Add to the counts of a conversion.
+
+    E.g. count(rows=10) adds 10 to the rows of the conversion.
+
+    Args:
+        **counts (int): Names of counts mapped to numbers to add.
+    """
+    for observer in STAGE_OBSERVERS.get():
+        observer.add(**counts)
+
+
+def timed_chunks(chunks):
+    """Time the rendering of chunks of output, as the 'render' stage.
+
+    Args:
+        chunks (iterable): Chunks of output, as from OdkForm.iter_html().
+
+    Yields:
+        str: The chunks.
+    """
+    if not STAGE_OBSERVERS.get():
+        yield from chunks
+        return
+    chunks = iter(chunks)
+    while True:
+        with stage("render"):
+            chunk = next(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def cached_functions():
+    """Get the cached functions of the package, by name.
+
+    Returns:
+        dict: Names mapped to functions decorated with lru_cache.
+    """
+    from ppp.config import asset_data_uri, get_template_env, read_asset
+    from ppp.odklanguageindex import OdkLanguageIndex
+    from ppp.odkprompt import OdkPrompt
+
+    return {
+        "template_env": get_template_env,
+        "asset": read_asset,
+        "asset_data_uri": asset_data_uri,
+        "question_number": OdkPrompt.find_question_number,
+        "language_column": OdkLanguageIndex.parse_column,
+    }
+
+
+class StageObserver:
+    """Base class of observers of the stages and counts of conversions.
+
+    An observer observes the conversions run in the context it is active
+    in, from entering it as a context manager until exiting it.
+    """
+
+    _token = None
+
+    def __enter__(self):
+        """Start observing conversions in the current context."""
+        self._token = STAGE_OBSERVERS.set(STAGE_OBSERVERS.get() + (self,))
+        return self
+
+    def __exit__(self, *args):
+        """Stop observing conversions."""
+        STAGE_OBSERVERS.reset(self._token)
+
+    def start_stage(self, name, tags):
+        """Observe the start of a stage.
+
+        Args:
+            name (str): Name of the stage.
+            tags (dict): Details of the stage.
+        """
+
+    def end_stage(self, name, seconds, self_seconds, tags):
+        """Observe the end of a stage.
+
+        Args:
+            name (str): Name of the stage.
+            seconds (float): Seconds spent in the stage.
+            self_seconds (float): Seconds spent in the stage, but not in
+                stages nested in it.
+            tags (dict): Details of the stage.
+        """
+
+    def add(self, **counts):
+        """Observe counts.
+
+        Args:
+            **counts (int): Names of counts mapped to numbers to add.
+        """
+
+
+class ConversionMetrics(StageObserver):
+    """Class to measure the conversions of a run.
+
+    Measures conversions run in the context it is active in, from entering
+    it as a context manager until exiting it.
+
+    Attributes:
+        counts (dict): Counts of 'forms' converted, 'conversions', survey
+            'rows' converted, and 'bytes' written to files.
+        stages (dict): Names of stages mapped to seconds spent in them.
+        caches (dict): Names of cached functions mapped to their hits and
+            misses while active.
+        seconds (float): Seconds active.
+    """
+
+    def __init__(self):
+        """Initialize metrics."""
+        self.counts = {"forms": 0, "conversions": 0, "rows": 0, "bytes": 0}
+        self.stages = {}
+        self.caches = {}
+        self.seconds = 0.0
+        self._start = None
+        self._cache_info = {}
+
+    def __repr__(self):
+        """Print representation of instance."""
+        return "<ConversionMetrics (conversions: {}, seconds: {:.3f})>".format(
+            self.counts["conversions"], self.seconds
+        )
+
+    def __enter__(self):
+        """Start measuring conversions in the current context."""
+        super().__enter__()
+        self._cache_info = {
+            name: func.cache_info() for name, func in cached_functions().items()
+        }
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        """Stop measuring conversions."""
+        self.seconds += time.perf_counter() - self._start
+        super().__exit__(*args)
+        for name, func in cached_functions().items():
+            info, start = func.cache_info(), self._cache_info[name]
+            self.caches[name] = {
+                "hits": info.hits - start.hits,
+                "misses": info.misses - start.misses,
+            }
+
+    def add(self, **counts):
+        """Add to counts.
+
+        Args:
+            **counts (int): Names of counts mapped to numbers to add.
+        """
+        for name, number in counts.items():
+            self.counts[name] = self.counts.get(name, 0) + number
+
+    def end_stage(self, name, seconds, self_seconds, tags):
+        """Add the time spent in a stage, but not in stages nested in it.
+
+        Args:
+            name (str): Name of the stage.
+            seconds (float): Seconds spent in the stage.
+            self_seconds (float): Seconds spent in the stage, but not in
+                stages nested in it.
+            tags (dict): Details of the stage.
+        """
+        self.add_time(name, self_seconds)
+
+    def add_time(self, name, seconds):
+        """Add to the time spent in a stage.
+
+        Args:
+            name (str): Name of the stage.
+            seconds (float): Seconds to add.
+        """
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def summary(self):
+        """Get a summary of the run.
+
+        Returns:
+            dict: Counts, 'seconds' taken, 'forms_per_second' and
+            'rows_per_second', 'stages' mapped to seconds, and 'caches'
+            mapped to their hits, misses, and 'hit_rate'.
+        """
+        seconds = self.seconds if self.seconds else float("inf")
+        caches = {
+            name: {
+                **cache,
+                "hit_rate": round(cache["hits"] / (cache["hits"] + cache["misses"]), 3)
+                if cache["hits"] + cache["misses"]
+                else None,
+            }
+            for name, cache in self.caches.items()
+        }
+        return {
+            **self.counts,
+            "seconds": round(self.seconds, 3),
+            "forms_per_second": round(self.counts["forms"] / seconds, 3),
+            "rows_per_second": round(self.counts["rows"] / seconds, 3),
+            "stages": {name: round(x, 3) for name, x in self.stages.items()},
+            "caches": caches,
+        }
+
+    def to_json(self):
+        """Get the summary of the run as JSON.
+
+        Returns:
+            str: JSON of summary().
+        """
+        return json.dumps(self.summary(), indent=2)
+
+    def to_prometheus(self):
+        """Get the summary of the run in the Prometheus text format.
+
+        Returns:
+            str: Metrics of summary(), prefixed with 'ppp_', e.g. for the
+            textfile collector of the node exporter.
+        """
+        summary = self.summary()
+        lines = []
+
+        def metric(name, kind, description, samples):
+            """Add a metric, with samples of labels and values."""
+            lines.append("# HELP ppp_{} {}".format(name, description))
+            lines.append("# TYPE ppp_{} {}".format(name, kind))
+            for labels, value in samples:
+                lines.append("ppp_{}{} {}".format(name, labels, value))
+
+        for name in self.counts:
+            description = "Number of {} of the last run.".format(name)
+            metric(name, "gauge", description, [("", summary[name])])
+        metric("seconds", "gauge", "Duration of the last run.", [("", self.seconds)])
+        metric(
+            "stage_seconds",
+            "gauge",
+            "Seconds spent in each stage of the last run.",
+            [('{{stage="{}"}}'.format(k), v) for k, v in self.stages.items()],
+        )
+        for key in ("hits", "misses"):
+            metric(
+                "cache_" + key,
+                "gauge",
+                "Cache {} of the last run.".format(key),
+                [('{{cache="{}"}}'.format(k), v[key]) for k, v in self.caches.items()],
+            )
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Write the summary of the run to a file.
+
+        The file is replaced at once, so that a collector which reads it
+        never reads it half written.
+
+        Args:
+            path (str): Path of file. If it ends with PROMETHEUS_SUFFIX, the
+                summary is written in the Prometheus text format, else as
+                JSON.
+        """
+        if path.endswith(PROMETHEUS_SUFFIX):
+            output = self.to_prometheus()
+        else:
+            output = self.to_json()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, mode="w", encoding="utf-8") as file:
+            file.write(output)
+        os.replace(tmp_path, path)
+
+    def report(self, file=stderr):
+        """Print a summary of the run for people.
+
+        Args:
+            file (file): Stream to print to.
+        """
+        summary = self.summary()
+        print(
+            "Converted {} forms in {} conversions in {:.2f}s: {:.2f} forms/s, "
+            "{:.0f} rows/s, {} bytes written.".format(
+                summary["forms"],
+                summary["conversions"],
+                self.seconds,
+                summary["forms_per_second"],
+                summary["rows_per_second"],
+                summary["bytes"],
+            ),
+            file=file,
+        )
+        stages = ", ".join(
+            "{} {:.2f}s".format(k, v) for k, v in summary["stages"].items()
+        )
+        print("Time per stage: {}.".format(stages), file=file)
+        caches = ", ".join(
+            "{} {:.0%}".format(k, v["hit_rate"])
+            for k, v in summary["caches"].items()
+            if v["hit_rate"] is not None
+        )
+        print("Cache hit rates: {}.".format(caches), file=file)
+
+
+class Progress:
+    """Class to display the progress of the conversions of a run.
+
+    Uses tqdm if it is installed, else prints a line per conversion.
+
+    Attributes:
+        total (int): Number of conversions.
+        done (int): Number of conversions done.
+        file (file): Stream progress is displayed on.
+        start (float): Time the run started.
+        bar (tqdm): Progress bar, if tqdm is installed.
+    """
+
+    def __init__(self, total, file=stderr):
+        """Initialize a progress display.
+
+        Args:
+            total (int): Number of conversions.
+            file (file): Stream to display progress on.
+        """
+        self.total = total
+        self.done = 0
+        self.file = file
+        self.start = time.perf_counter()
+        self._item_start = self.start
+        try:
+            from tqdm import tqdm
+        except ImportError:
+            self.bar = None
+        else:
+            self.bar = tqdm(total=total, file=file, unit="form")
+
+    def __repr__(self):
+        """Print representation of instance."""
+        return "<Progress ({}/{})>".format(self.done, self.total)
+
+    def __enter__(self):
+        """Enter context."""
+        return self
+
+    def __exit__(self, *args):
+        """Close display on exiting context."""
+        self.close()
+
+    def add(self, n):
+        """Add conversions to the total, e.g. once the languages of a form are read.
+
+        Args:
+            n (int): Number of conversions.
+        """
+        self.total += n
+        if self.bar is not None:
+            self.bar.total = self.total
+            self.bar.refresh()
+
+    def update(self, name):
+        """Report that a conversion is done.
+
+        Args:
+            name (str): Name of the conversion, e.g. its source file.
+        """
+        now = time.perf_counter()
+        item_seconds = now - self._item_start
+        self._item_start = now
+        self.done += 1
+        if self.bar is not None:
+            self.bar.set_postfix_str("{} {:.2f}s".format(name, item_seconds))
+            self.bar.update()
+            return
+        eta = (now - self.start) / self.done * (self.total - self.done)
+        print(
+            "[{}/{}] {} {:.2f}s, ETA {:.0f}s".format(
+                self.done, self.total, name, item_seconds, eta
+            ),
+            file=self.file,
+        )
+
+    def close(self):
+        """Close the display."""
+        if self.bar is not None:
+            self.bar.close()
@@ -8,6 +8,10 @@ class OdkAbstractFormElement:
         """Initialize the XLSForm calculate, a single row."""
         self.row = row
 
+    def to_nodes(self, *args, **kwargs):
+        """Get the nodes to render the element with."""
+        return []
+
     def to_html(self, *args, **kwargs):
         """Convert to html."""
         return ""
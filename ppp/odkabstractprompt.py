@@ -1,5 +1,5 @@
 """Module for the OdkPrompt class."""
-from ppp.config import get_template_env
+from ppp.config import render_env, render_nodes
 from ppp.definitions.constants import (
     TRUNCATABLE_FIELDS,
     LANGUAGE_DEPENDENT_FIELDS,
@@ -11,14 +11,6 @@ from ppp.definitions.constants import (
 )
 from ppp.odkabstractformelement import OdkAbstractFormElement
 
-TEMPLATE_ENV = None
-
-
-def set_template_env(template):
-    """Set template env."""
-    global TEMPLATE_ENV
-    TEMPLATE_ENV = get_template_env(template)
-
 
 class OdkAbstractPrompt(OdkAbstractFormElement):
     """Class to represent a single ODK prompt from an XLSForm.
@@ -262,7 +254,7 @@ class OdkAbstractPrompt(OdkAbstractFormElement):
         Returns:
             dict: The text from all parts of the prompt.
         """
-        prompt = self._set_descriptive_metadata(self.row)
+        prompt = self._set_descriptive_metadata(dict(self.row))
         prompt = self._reformat_default_lang_vars(prompt, lang)
         prompt = self._truncate_fields(prompt)
         prompt = self._reformat_double_line_breaks(prompt)
@@ -295,6 +287,21 @@ class OdkAbstractPrompt(OdkAbstractFormElement):
             kwargs["language"] = lang
         return kwargs
 
+    def to_nodes(self, lang, **kwargs):
+        """Get the nodes to render the prompt with.
+
+        Args:
+            lang (str): The language.
+            **kwargs: Arbitrary keyword arguments delegated detailedy to
+            to_dict().
+
+        Returns:
+            list: A single node, a tuple of macro name and macro arguments.
+        """
+        settings = self.html_options(lang=lang, **kwargs)
+        question = self.to_dict(lang=lang, **settings)
+        return [("content_tr_base", {"question": question})]
+
     def to_html(self, lang, **kwargs):
         """Convert to html.
 
@@ -307,8 +314,6 @@ class OdkAbstractPrompt(OdkAbstractFormElement):
             str: A rendered html template.
         """
         settings = self.html_options(lang=lang, **kwargs)
-        question = self.to_dict(lang=lang, **settings)
-        # pylint: disable=no-member
-        return TEMPLATE_ENV.get_template("content/content-tr-base.html").render(
-            question=question, **settings
+        return render_nodes(
+            render_env(kwargs.get("style")), self.to_nodes(lang, **kwargs), **settings
         )
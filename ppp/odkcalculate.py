@@ -18,9 +18,9 @@ class OdkCalculate(OdkAbstractPrompt):
         super().__init__(row)
         self.renderable = renderable
 
-    def to_html(self, lang, **kwargs):
-        """Overriding to_html"""
+    def to_nodes(self, lang, **kwargs):
+        """Overriding to_nodes"""
         if self.renderable:
-            return super(OdkCalculate, self).to_html(lang, **kwargs)
+            return super(OdkCalculate, self).to_nodes(lang, **kwargs)
         else:
-            return ""
+            return []
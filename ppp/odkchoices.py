@@ -1,14 +1,26 @@
 """Module for the OdkChoices class."""
-from ppp.definitions.error import InvalidLanguageException
+import hashlib
+from weakref import WeakValueDictionary
+
+from ppp.definitions.error import InvalidLanguageException, OdkChoicesError
 from ppp.definitions.constants import CHOICE_NAME_VARIATIONS
 
+# Content hashes of shared choice lists mapped to them, while in use by any
+# form of the process, as from OdkChoices.intern().
+CHOICES_POOL = WeakValueDictionary()
+
 
 class OdkChoices:
     """A class to represent a choice list defined in an XLSForm.
 
+    Choice lists are shared by the forms of a process which have identical
+    lists, as by intern(). Shared lists cannot be changed, so that their
+    labels in each language are cached.
+
     Attributes:
         list_name (str): The name of the choice list.
-        data (list): A list of choice options for the choice list.
+        data (list): A list of choice options for the choice list. A tuple if
+            the list is shared.
 
     """
 
@@ -20,6 +32,40 @@ class OdkChoices:
         """
         self.list_name = list_name
         self.data = []
+        self._labels = {}
+
+    @staticmethod
+    def intern(list_name, rows):
+        """Get the shared choice list of a list name and its choice rows.
+
+        Identical choice lists, e.g. of yes and no, are the same instance for
+        every form of the process which has them, so that they are stored,
+        and their labels found, once. Cells which are blank, other than
+        labels and names, do not make lists differ.
+
+        Args:
+            list_name (str): The name of the choice list.
+            rows (list): Choice rows, as dicts.
+
+        Returns:
+            OdkChoices: The shared choice list.
+        """
+        rows = tuple(
+            {
+                k: v
+                for k, v in row.items()
+                if v or k.startswith("label") or k in CHOICE_NAME_VARIATIONS
+            }
+            for row in rows
+        )
+        content = repr((list_name, [sorted(x.items()) for x in rows]))
+        key = hashlib.sha1(content.encode("utf-8")).hexdigest()
+        choices = CHOICES_POOL.get(key)
+        if choices is None:
+            choices = OdkChoices(list_name)
+            choices.data = rows
+            choices = CHOICES_POOL.setdefault(key, choices)
+        return choices
 
     def __repr__(self):
         """Print representation of instance."""
@@ -34,12 +80,37 @@ class OdkChoices:
 
         Args:
             choice (dict): A single choice row.
+
+        Raises:
+            OdkChoicesError: If the choice list is shared.
         """
+        if isinstance(self.data, tuple):
+            msg = "Choice list '{}' is shared, and cannot be changed.".format(
+                self.list_name
+            )
+            raise OdkChoicesError(msg)
         self.data.append(choice)
+        self._labels = {}
 
     def labels(self, lang=""):
         """Get the labels for this choice list in the desired language.
 
+        Args:
+            lang (str): The language in which to return the choice labels.
+
+        Returns:
+            list: Correctly ordered list of choice labels.
+
+        Raises:
+            InvalidLanguageException
+        """
+        if lang not in self._labels:
+            self._labels[lang] = tuple(self._find_labels(lang))
+        return list(self._labels[lang])
+
+    def _find_labels(self, lang):
+        """Find the labels for this choice list in the desired language.
+
         Args:
             lang (str): The language in which to return the choice labels.
 
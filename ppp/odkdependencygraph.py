@@ -0,0 +1,179 @@
+"""Module for the OdkDependencyGraph class."""
+import json
+import re
+
+from ppp.definitions.constants import DEPENDENCY_FIELDS, ODK_SUPERGLOBALS
+
+VARIABLE_REF_PATTERN = re.compile(r"\${([^}\s]+)}")
+
+
+class OdkDependencyGraph:
+    """Class to represent references between variables of an XLSForm.
+
+    A variable depends on another variable when one of its logic fields,
+    i.e. 'relevant', 'calculation', 'constraint' or 'choice_filter',
+    contains a '${name}' reference to the other variable. Edges are stored in
+    both directions so that either kind of lookup is proportional to the
+    number of edges of the variable queried, rather than the size of the form.
+
+    Attributes:
+        nodes (dict): Variable names mapped to their 'type', in form order.
+        dependencies (dict): Variable names mapped to a dict of each variable
+            they reference and the fields in which they reference it.
+        dependents (dict): Variable names mapped to a dict of each variable
+            referencing them and the fields in which they are referenced.
+    """
+
+    def __init__(self):
+        """Initialize an empty graph."""
+        self.nodes = {}
+        self.dependencies = {}
+        self.dependents = {}
+
+    def __repr__(self):
+        """Print representation of instance."""
+        n_edges = sum(len(x) for x in self.dependencies.values())
+        return "<OdkDependencyGraph (nodes: {}, edges: {})>".format(
+            len(self.nodes), n_edges
+        )
+
+    def __contains__(self, name):
+        """Check if variable name is a node in the graph."""
+        return name in self.nodes
+
+    @staticmethod
+    def find_references(text):
+        """Find variable names referenced in a logic expression.
+
+        Args:
+            text (str): An XLSForm expression, e.g. "${age} > 15".
+
+        Returns:
+            list: Referenced variable names in order of first appearance,
+            excluding ODK superglobals.
+        """
+        refs = VARIABLE_REF_PATTERN.findall(text) if text else []
+        return [x for x in dict.fromkeys(refs) if x not in ODK_SUPERGLOBALS]
+
+    def add_row(self, row):
+        """Add a survey row and the references in its logic fields.
+
+        Rows without a name, such as 'end group' rows, are ignored.
+
+        Args:
+            row (dict): A row as a dictionary. Keys and values are strings.
+        """
+        name = row.get("name", "")
+        if not name or row.get("type", "").startswith("end "):
+            return
+        self.nodes.setdefault(name, row.get("type", ""))
+        for fld in DEPENDENCY_FIELDS:
+            for ref in self.find_references(row.get(fld, "")):
+                self.dependencies.setdefault(name, {}).setdefault(ref, [])
+                self.dependents.setdefault(ref, {}).setdefault(name, [])
+                if fld not in self.dependencies[name][ref]:
+                    self.dependencies[name][ref].append(fld)
+                    self.dependents[ref][name].append(fld)
+
+    def depends_on(self, name):
+        """Get the variables that a variable references.
+
+        Args:
+            name (str): Variable name.
+
+        Returns:
+            list: Variable names, in order of reference.
+        """
+        return list(self.dependencies.get(name, {}))
+
+    def dependents_of(self, name):
+        """Get the variables that reference a variable.
+
+        Args:
+            name (str): Variable name.
+
+        Returns:
+            list: Variable names, in form order.
+        """
+        return list(self.dependents.get(name, {}))
+
+    def affected_by(self, names):
+        """Get all variables directly or transitively dependent on variables.
+
+        Args:
+            names (iterable): Variable names, e.g. of changed rows.
+
+        Returns:
+            set: Names of all dependent variables, excluding those passed in
+            unless they depend on each other.
+        """
+        affected = set()
+        pending = list(names)
+        while pending:
+            for dependent in self.dependents.get(pending.pop(), {}):
+                if dependent not in affected:
+                    affected.add(dependent)
+                    pending.append(dependent)
+        return affected
+
+    def undefined_references(self):
+        """Get references to variables which are not defined in the form.
+
+        Returns:
+            dict: Undefined variable names mapped to the names referencing
+            them.
+        """
+        return {
+            k: list(v) for k, v in self.dependents.items() if k not in self.nodes
+        }
+
+    def to_dict(self):
+        """Get the dictionary representation of the graph.
+
+        Returns:
+            dict: 'nodes' and 'edges', where each edge is directed from the
+            dependent variable to the variable it references.
+        """
+        return {
+            "nodes": [{"name": k, "type": v} for k, v in self.nodes.items()],
+            "edges": [
+                {"source": name, "target": ref, "fields": fields}
+                for name, refs in self.dependencies.items()
+                for ref, fields in refs.items()
+            ],
+        }
+
+    def to_json(self, pretty=False):
+        """Get the JSON representation of the graph.
+
+        Args:
+            pretty (bool): Activates prettification, involving insertion of
+                several kinds of whitespace for readability.
+
+        Returns:
+            str: JSON of the dictionary representation.
+        """
+        return json.dumps(self.to_dict(), indent=2 if pretty else None)
+
+    def to_dot(self, title="dependencies"):
+        """Get the Graphviz DOT representation of the graph.
+
+        Args:
+            title (str): Name of the digraph.
+
+        Returns:
+            str: DOT source, edges labeled by field.
+        """
+        lines = ["digraph {} {{".format(json.dumps(title))]
+        for name in self.nodes:
+            lines.append("  {};".format(json.dumps(name)))
+        for edge in self.to_dict()["edges"]:
+            lines.append(
+                "  {} -> {} [label={}];".format(
+                    json.dumps(edge["source"]),
+                    json.dumps(edge["target"]),
+                    json.dumps(", ".join(edge["fields"])),
+                )
+            )
+        lines.append("}")
+        return "\n".join(lines)
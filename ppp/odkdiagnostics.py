@@ -0,0 +1,111 @@
+"""Module for the OdkDiagnostics class."""
+import json
+from sys import stderr
+
+
+class OdkDiagnostics:
+    """Class to collect warnings found while converting XLSForms.
+
+    Warnings are collected as they are found rather than printed, and printed
+    together by emit(). The same warning found in several rows, or again on
+    converting the same form in another language or with other options, is
+    kept once, with the numbers of all the rows it was found in.
+
+    Attributes:
+        records (dict): Warning messages mapped to records of their 'level',
+            'message' and 'rows', the worksheet row numbers it was found in.
+        emitted (set): Messages already printed by emit().
+    """
+
+    def __init__(self):
+        """Initialize an empty collection."""
+        self.records = {}
+        self.emitted = set()
+
+    def __repr__(self):
+        """Print representation of instance."""
+        return "<OdkDiagnostics (warnings: {})>".format(len(self.records))
+
+    def __len__(self):
+        """Get number of distinct warnings."""
+        return len(self.records)
+
+    def warn(self, message, row=None):
+        """Add a warning.
+
+        Args:
+            message (str): Description of the problem.
+            row (int): Row number in the worksheet, if applicable.
+        """
+        record = self.records.setdefault(
+            message, {"level": "warning", "message": message, "rows": []}
+        )
+        if row is not None and row not in record["rows"]:
+            record["rows"].append(row)
+
+    def extend(self, other):
+        """Add the warnings of another collection.
+
+        Args:
+            other (OdkDiagnostics): Warnings to add.
+        """
+        for record in other.records.values():
+            if not record["rows"]:
+                self.warn(record["message"])
+            for row in record["rows"]:
+                self.warn(record["message"], row)
+
+    @property
+    def warnings(self):
+        """list: Distinct warning messages, in the order found."""
+        return list(self.records)
+
+    def to_list(self):
+        """Get the list representation of the warnings.
+
+        Returns:
+            list: Records of each distinct warning, in the order found.
+        """
+        return list(self.records.values())
+
+    def to_json(self):
+        """Get the JSON representation of the warnings.
+
+        The JSON is safe to embed in an HTML <script> element.
+
+        Returns:
+            str: JSON of the list representation.
+        """
+        output = json.dumps(self.to_list(), ensure_ascii=False)
+        return output.replace("</", "<\\/")
+
+    @staticmethod
+    def format_record(record):
+        """Format a warning for printing.
+
+        Args:
+            record (dict): A record, as from to_list().
+
+        Returns:
+            str: The warning and the rows it was found in, if any.
+        """
+        rows = record["rows"]
+        where = (
+            " (row{} {})".format(
+                "s" if len(rows) > 1 else "", ", ".join(map(str, rows))
+            )
+            if rows
+            else ""
+        )
+        return "{}: {}{}".format(record["level"].capitalize(), record["message"], where)
+
+    def emit(self, file=None):
+        """Print the warnings not yet printed.
+
+        Args:
+            file: Stream to print to. Defaults to stderr.
+        """
+        for message, record in self.records.items():
+            if message not in self.emitted:
+                print(self.format_record(record), file=file if file else stderr)
+                self.emitted.add(message)
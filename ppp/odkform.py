@@ -1,34 +1,75 @@
 """Module for the OdkForm class."""
+import hashlib
 import os
 import re
 from sys import stderr
 
-from ppp.config import get_template_env
-from ppp.definitions.error import OdkFormError
-from ppp.definitions.constants import ODK_SUPERGLOBALS, RELEVANCE_FIELD_TOKENS
+from ppp.config import (
+    asset_data_uri,
+    iter_nodes,
+    render_env,
+    render_nodes,
+    set_template_style,
+    template_style,
+)
+from ppp.definitions.error import (
+    OdkException,
+    OdkFormError,
+    InvalidLanguageException,
+)
+from ppp.definitions.constants import (
+    ODK_SUPERGLOBALS,
+    RELEVANCE_FIELD_TOKENS,
+    ALL_LANGUAGES_TOKEN,
+    STYLE_ASSETS,
+)
 from ppp.odkcalculate import OdkCalculate
 from ppp.odkchoices import OdkChoices
 from ppp.odkcustomtype import OdkCustomType
-from ppp.odkgroup import OdkGroup, set_template_env as odkgroup_template
-from ppp.odkprompt import OdkPrompt, set_template_env as odkpromt_template
-from ppp.odkrepeat import OdkRepeat, set_template_env as odkrepeat_template
-from ppp.odktable import OdkTable, set_template_env as odktable_template
-from ppp.odkabstractprompt import set_template_env as odkabstractprompt_template
-from ppp.definitions.utils import exclusion
+from ppp.odkdependencygraph import OdkDependencyGraph
+from ppp.odkdiagnostics import OdkDiagnostics
+from ppp.odklanguageindex import OdkLanguageIndex
+from ppp.odkgroup import OdkGroup
+from ppp.odkprompt import OdkPrompt
+from ppp.odkrepeat import OdkRepeat
+from ppp.odktable import OdkTable
+from ppp.definitions.utils import compact_html, exclusion
+from ppp.metrics import stage
 from pmix import Xlsform
 
-TEMPLATE_ENV = None
-
 
 def set_template_env(template):
-    """Set template env."""
-    global TEMPLATE_ENV
-    TEMPLATE_ENV = get_template_env(template)
-    odkgroup_template(template)
-    odkpromt_template(template)
-    odkrepeat_template(template)
-    odktable_template(template)
-    odkabstractprompt_template(template)
+    """Set the style of renderings without a 'style' option.
+
+    Renderings with a 'style' option use the template environment of that
+    style, whatever is set here.
+
+    Args:
+        template (str): The style, e.g. 'default'.
+    """
+    set_template_style(template)
+
+
+def render_section(section, lang, kwargs, settings):
+    """Render a section of the top-level components of a questionnaire.
+
+    Module-level, so that it can be run in a worker process.
+
+    Args:
+        section (list): Tuples of the spacing nodes, the component, and its
+            keyword args, as for OdkForm._render_sections().
+        lang (str): The language.
+        kwargs (dict): Options, as for OdkForm.to_html().
+        settings (dict): Context of the templates.
+
+    Returns:
+        str: Rendering of the section.
+    """
+    nodes = []
+    for spacing, item, item_kwargs in section:
+        nodes += spacing
+        nodes += item.to_nodes(lang=lang, **kwargs, **item_kwargs)
+    return render_nodes(render_env(kwargs.get("style")), nodes, **settings)
 
 
 class OdkForm:
@@ -42,15 +83,23 @@ class OdkForm:
         ext_choices (dict): A list of rows from the 'external_choices'
             worksheet.
         metadata (dict): A dictionary of metadata for the original and
-            converted ODK forms.
+            converted ODK forms. The workbook itself is not kept, only its
+            'file_name' and 'path'.
         questionnaire (list): An ordered representation of the ODK form,
             comprised of OdkPrompt, OdkGroup, OdkRepeat, and OdkTable objects.
+        dependency_graph (OdkDependencyGraph): References between variables
+            in logic fields, built from the rows of the survey on first access.
+        language_index (OdkLanguageIndex): Languages of all worksheets, with
+            the number of non-empty cells of each language dependent column.
+        diagnostics (OdkDiagnostics): Warnings found while converting the
+            form, with their row numbers. Nothing is printed until its
+            emit() is called.
 
     custom_token_types: ['hidden', 'hidden string', 'hidden int',
         'hidden geopoint']
     """
 
-    def __init__(self, wb):
+    def __init__(self, wb, diagnostics=None, keep_raw=False):
         """Initialize the OdkForm.
 
         Create an instance of an ODK form, including survey representation,
@@ -58,6 +107,13 @@ class OdkForm:
 
         Args:
             wb (Xlsform): A Xlsform object meeting XLSForm specification.
+            diagnostics (OdkDiagnostics): Collection to add warnings to, e.g.
+                to share between conversions of the same form. A new one is
+                created if not supplied.
+            keep_raw (bool): Keep the rows of the 'survey' worksheet, for
+                debug output. Otherwise, they are read again from the file of
+                the workbook if needed, so that the workbook can be released
+                once converted.
 
         Raises:
             OdkformError: No ODK form is supplied.
@@ -65,20 +121,28 @@ class OdkForm:
         self.settings = wb.settings
         self.language = wb.form_language
 
-        self.title = self.get_title(settings=self.settings, wb=wb)
         self.metadata = {  # TODO Finish filling this out.
             "last_author": str(),
             "last_updated": str(),
             "changelog": None,
             "info": None,
-            "raw_data": wb,
+            "file_name": os.path.split(wb.filename)[1],
+            "path": os.path.abspath(wb.filename),
         }
-        self.choices = self.get_choices(wb, "choices")
-        self.ext_choices = self.get_choices(wb, "external_choices")
+        self.title = self.get_title(
+            settings=self.settings, file_name=self.metadata["file_name"]
+        )
+        self._raw_survey = self.read_raw_survey(wb) if keep_raw else None
+        self.language_index = OdkLanguageIndex()
+        self.language_index.add_settings(self.settings)
+        with stage("choices"):
+            self.choices = self.get_choices(wb, "choices", self.language_index)
+            self.ext_choices = self.get_choices(
+                wb, "external_choices", self.language_index
+            )
         self.metadata = {
             **self.metadata,
             **{
-                "file_name": os.path.split(wb.filename)[1],
                 "form_id": self.settings.get("form_id")
                 if self.settings.get("form_id")
                 else self.settings.get("id_string"),
@@ -93,25 +157,157 @@ class OdkForm:
             "round": self.metadata["round"](),
             "type_of_form": self.metadata["type_of_form"](),
         }
-        qre = self.convert_survey(wb, self.choices, self.ext_choices)
-        qre = OdkForm._add_question_iter_nums(qre)
+        self._dependency_graph = None
+        self.diagnostics = diagnostics if diagnostics is not None else OdkDiagnostics()
+        with stage("survey"):
+            qre = self.convert_survey(
+                wb,
+                self.choices,
+                self.ext_choices,
+                language_index=self.language_index,
+                diagnostics=self.diagnostics,
+            )
+        with stage("numbering"):
+            qre = OdkForm._add_question_iter_nums(qre)
         self.questionnaire = qre
 
     @classmethod
-    def from_file(cls, path):
+    def from_file(cls, path, diagnostics=None, keep_raw=False):
         """Create Odkform object from file in path.
 
         Args:
             path (str): The path for the source file of the ODK form,
                 typically an '.xlsx' file meeting the XLSForm specification.
+            diagnostics (OdkDiagnostics): Collection to add warnings to.
+            keep_raw (bool): Keep the rows of the 'survey' worksheet.
 
         Returns:
             Odkform
         """
         xlsform = Xlsform(path)
-        odkform = cls(xlsform)
+        odkform = cls(xlsform, diagnostics, keep_raw)
         return odkform
 
+    @staticmethod
+    def read_raw_survey(wb):
+        """Read the rows of the 'survey' worksheet of a workbook.
+
+        Args:
+            wb (Xlsform): A Xlsform object representing ODK form.
+
+        Returns:
+            list: Rows as dictionaries of header to cell value, as strings.
+        """
+        rows = iter(wb["survey"])
+        header = [str(x) for x in next(rows, [])]
+        return [{k: str(v) for k, v in zip(header, row)} for row in rows]
+
+    @property
+    def raw_survey(self):
+        """list: Rows of the 'survey' worksheet, as dictionaries of strings.
+
+        Unless kept on initialization, they are read again from the file of
+        the workbook on first access.
+        """
+        if self._raw_survey is None:
+            self._raw_survey = self.read_raw_survey(Xlsform(self.metadata["path"]))
+        return self._raw_survey
+
+    @property
+    def dependency_graph(self):
+        """OdkDependencyGraph: References between variables in logic fields.
+
+        Conversions do not need it, so it is only built on first access, from
+        every row of the survey, including those of context groups, which
+        are not kept as components.
+        """
+        if self._dependency_graph is None:
+            graph = OdkDependencyGraph()
+            for row in self.raw_survey:
+                graph.add_row(row)
+            self._dependency_graph = graph
+        return self._dependency_graph
+
+    @property
+    def warnings(self):
+        """list: Distinct warning messages found while converting the form."""
+        return self.diagnostics.warnings
+
+    @staticmethod
+    def check(wb, languages=(None,), diagnostics=None):
+        """Check the structure of an XLSForm without rendering it.
+
+        All errors are collected, rather than only the first. This covers
+        choice worksheets, conversion of every survey row, and the labels of
+        every choice list in use, in each language.
+
+        Args:
+            wb (Xlsform): A Xlsform object representing ODK form.
+            languages (list): Languages to check. None stands for the default
+                language of the form, and ALL_LANGUAGES_TOKEN for all
+                languages of the form.
+            diagnostics (OdkDiagnostics): If supplied, warnings are added
+                to it.
+
+        Returns:
+            list: Errors found, as from error_record().
+        """
+        errors = []
+        choices = {}
+        language_index = OdkLanguageIndex()
+        for ws in ("choices", "external_choices"):
+            try:
+                choices[ws] = OdkForm.get_choices(wb, ws, language_index)
+            except OdkException as err:
+                errors.append(OdkForm.error_record(err))
+                choices[ws] = {}
+        qre = OdkForm.convert_survey(
+            wb,
+            choices["choices"],
+            choices["external_choices"],
+            errors=errors,
+            language_index=language_index,
+            diagnostics=diagnostics,
+        )
+        if ALL_LANGUAGES_TOKEN in languages:
+            languages = language_index.languages or [None]
+        for language in languages:
+            try:
+                language_index.validate(language)
+            except InvalidLanguageException as err:
+                errors.append(OdkForm.error_record(err))
+
+        choice_lists = {}
+        for item in OdkForm.iter_components(qre):
+            if getattr(item, "choices", None):
+                choice_lists[id(item.choices)] = item.choices
+        for choice_list in choice_lists.values():
+            try:
+                choice_list.choice_langs()
+            except InvalidLanguageException as err:
+                errors.append(OdkForm.error_record(err))
+            for language in languages:
+                try:
+                    choice_list.labels(language if language else wb.form_language)
+                except InvalidLanguageException as err:
+                    errors.append(OdkForm.error_record(err))
+        return errors
+
+    @staticmethod
+    def iter_components(prompt_list):
+        """Iterate through form components, including nested ones.
+
+        Args:
+            prompt_list (list): A list of objects representing form components.
+
+        Yields:
+            Each component, followed by the components nested in it, if any.
+        """
+        for item in prompt_list:
+            yield item
+            if isinstance(item, (OdkGroup, OdkRepeat, OdkTable)):
+                yield from OdkForm.iter_components(item.data)
+
     @staticmethod
     def get_settings(wb):
         """Get the XLSForm settings as a settings_dict.
@@ -135,23 +331,26 @@ class OdkForm:
         return settings_dict
 
     @staticmethod
-    def get_choices(wb, ws):
+    def get_choices(wb, ws, language_index=None):
         """Extract choices from an XLSForm.
 
         Args:
             wb (Xlsform): A Xlsform object representing ODK form.
             ws (Worksheet): One of 'choices' or 'external_choices'.
+            language_index (OdkLanguageIndex): If supplied, the header and
+                every row are added to it.
 
         Returns:
             dict: A dictionary of choice list names with list of choices
-                options for each list.
+                options for each list. Lists identical to those of other
+                forms are shared with them, as by OdkChoices.intern().
 
         Raises:
             OdkformError: Catches instances where list specified in the
                 'survey' worksheet, but the list does not appear in the
                 designated 'choices' or 'external_choices' worksheet.
         """
-        formatted_choices = {}
+        rows = {}
         try:
             choices = wb[ws]
             header = [str(x) for x in choices[0]]
@@ -159,30 +358,30 @@ class OdkForm:
             if "list_name" not in header:
                 msg = 'Column "list_name" not found in {} tab'.format(ws)
                 raise OdkFormError(msg)
+            if language_index is not None:
+                language_index.add_header(ws, header)
 
             for i, row in enumerate(choices):
                 if i == 0:
                     continue
                 dict_row = {str(k): str(v) for k, v in zip(header, row)}
                 list_name = dict_row["list_name"]
-                if list_name in formatted_choices:
-                    formatted_choices[list_name].add(dict_row)
-                elif list_name:  # Not "else:" because possibly blank rows.
-                    odkchoices = OdkChoices(list_name)
-                    odkchoices.add(dict_row)
-                    formatted_choices[list_name] = odkchoices
+                if language_index is not None and list_name:
+                    language_index.add_row(ws, dict_row)
+                if list_name:  # Possibly blank rows.
+                    rows.setdefault(list_name, []).append(dict_row)
         except (KeyError, IndexError):  # Worksheet does not exist.
             pass
-        return formatted_choices
+        return {name: OdkChoices.intern(name, x) for name, x in rows.items()}
 
     @staticmethod
-    def get_title(settings, wb, lang=None):
+    def get_title(settings, file_name, lang=None):
         """Get questionnaire title.
 
         Args:
         settings (dict): A dictionary represetnation of the original 'settings'
             worksheet of an ODK XLSForm.
-        wb (Workbook): A Workbook object representing an XLSForm.
+        file_name (str): File name of the XLSForm, the title if none is set.
         lang (str): The requested render language of the form.
 
         Returns:
@@ -193,8 +392,7 @@ class OdkForm:
             try1 = settings.get("ppp_form_title" + "::" + lang)
             try2 = settings.get("ppp_form_title" + ":" + lang)
             lookup_title = try1 if try1 else try2
-        backup_title = os.path.split(wb.filename)[1]
-        return settings.get(lookup_title, backup_title)
+        return settings.get(lookup_title, file_name)
 
     @staticmethod
     def _get_name_to_q_num_map(prompt_list):
@@ -287,30 +485,82 @@ class OdkForm:
         q_text = (q.to_text(lang) for q in self.questionnaire)
         sep = "\n\n" + "=" * 52 + "\n\n"
         result = sep.join(q_text)
-        return title_box + sep + result + sep  # TODO: Finish below to_dict or
-
-    # TODO: change debug feature. If fixed, change to_json to
-    # TODO: call dump return of this method instead of raw data.
-
-    # def to_dict(self, lang):
-    #     """Get the dictionary representation of an entire XLSForm.
-    #
-    #     Args:
-    #         lang (str): The language.
-    #
-    #     Returns:
-    #         dict: A detailed dictionary representation of the XLSForm.
-    #
-    #     """
-    #     lang = lang if lang \
-    #         else self.languages['language_list']['default_language']
-    #     html_questionnaire = {
-    #         'title': self.title,
-    #         'questions': []
-    #     }
-    #     for item in self.questionnaire:
-    #         html_questionnaire['questions'].append(item.to_dict(lang))
-    #     return html_questionnaire
+        return title_box + sep + result + sep
+
+    def to_dict(self, lang=None, **kwargs):
+        """Get the dictionary representation of an entire XLSForm.
+
+        Prompts are represented as from their to_dict() methods, which format
+        them for rendering, so this is best called after rendering.
+
+        Args:
+            lang (str): The language.
+            **kwargs: Options, as for to_html().
+
+        Returns:
+            dict: 'title', 'metadata', and 'questionnaire', the converted
+            components of the form, groups and repeats with their 'data'.
+        """
+        language = lang if lang else self.language
+        return {
+            "title": self.get_title(
+                settings=self.settings, file_name=self.metadata["file_name"], lang=lang
+            ),
+            "metadata": self.metadata,
+            "questionnaire": [
+                self._component_to_dict(x, language, **kwargs)
+                for x in self.questionnaire
+            ],
+        }
+
+    @staticmethod
+    def _component_to_dict(item, lang, **kwargs):
+        """Get the dictionary representation of a form component.
+
+        Args:
+            item: A form component, e.g. OdkPrompt or OdkGroup.
+            lang (str): The language.
+            **kwargs: Options, as for to_html().
+
+        Returns:
+            dict: The 'component' class name and its fields.
+        """
+        component = {"component": type(item).__name__}
+        if isinstance(item, (OdkGroup, OdkRepeat, OdkTable)):
+            if item.row:
+                component["name"] = item.row.get("name")
+            component["data"] = [
+                OdkForm._component_to_dict(x, lang, **kwargs) for x in item.data
+            ]
+        elif hasattr(item, "to_dict"):
+            component.update(item.to_dict(lang, **kwargs))
+        else:
+            component.update(item.row)
+        return component
+
+    def iter_json(self, lang=None, **kwargs):
+        """Encode debug data of an XLSForm as JSON, piece by piece.
+
+        The rows of the 'survey' worksheet are encoded one at a time, one per
+        line, followed by the converted form, as from to_dict().
+
+        Args:
+            lang (str): The language.
+            **kwargs: Options, as for to_html().
+
+        Yields:
+            str: Pieces of a JSON object of 'survey' and 'form'.
+        """
+        import json
+
+        yield '{"survey": ['
+        for i, row in enumerate(self.raw_survey):
+            yield ("," if i else "") + "\n" + json.dumps(row, ensure_ascii=False)
+        yield '\n],\n"form": '
+        yield json.dumps(
+            self.to_dict(lang, **kwargs), ensure_ascii=False, default=str, indent=2
+        )
+        yield "}\n"
 
     def to_json(self, pretty=False):
         """Get the JSON representation of raw ODK form.
@@ -324,23 +574,16 @@ class OdkForm:
         """
         import json
 
-        raw_survey = []
-        header = self.metadata["raw_data"]["survey"][0]
-        for i, row in enumerate(self.metadata["raw_data"]["survey"]):
-            if i == 0:
-                continue
-            raw_survey.append({str(k): str(v) for k, v in zip(header, row)})
-
         if pretty:
-            return json.dumps(raw_survey, indent=2)
-        return json.dumps(raw_survey)
+            return json.dumps(self.raw_survey, indent=2)
+        return json.dumps(self.raw_survey)
 
     @staticmethod
-    def _add_question_iter_nums(obj, data={"qnum": "", "i": 0}, depth=0):
+    def _add_question_iter_nums(obj, data=None, depth=0):
         """Add iteration numbers to unique question prompts.
 
-        Possible improvements: Make it so that this doesn't depend on
-        OdkPrompt._extract_question_numbers.
+        Question numbers are those of the default language, as extracted
+        from labels when each OdkPrompt was initialized.
 
         Args:
             obj (list): From either: OdkForm.questionnaire (a list of objects
@@ -350,7 +593,7 @@ class OdkForm:
             each new question number. In this case, a question number is
             rigidly considered "new" if it is not exactly equal to whatever
             was considered to be the immediately preceding question number
-            in the form.
+            in the form. Starts anew if not supplied.
             depth (int): Recursion depth. Starts at 0. Increments by 1 each
             time this function recurses, which happens every time an OdkRepeat
             or OdkGroup is encountered.
@@ -358,14 +601,16 @@ class OdkForm:
         Returns:
             list: OdkForm.questionnaire with new 'i' values included.
         """
+        if data is None:
+            data = {"qnum": "", "i": 0}
         for i, element in enumerate(obj):
             if any(isinstance(element, x) for x in (OdkRepeat, OdkGroup, OdkTable)):
                 element.data, data = OdkForm._add_question_iter_nums(
                     element.data, data, depth + 1
                 )
             elif isinstance(element, OdkPrompt):
-                element.row = OdkPrompt.extract_question_numbers(element.row)
-                qnum = element.row["question_number"]
+                qnum = element.question_number()
+                element.row["question_number"] = qnum
                 if qnum not in (data["qnum"], ""):
                     data["i"] += 1
                     data["qnum"] = qnum
@@ -376,34 +621,114 @@ class OdkForm:
             return obj
         return obj, data
 
-    def to_html(self, lang=None, **kwargs):
+    @staticmethod
+    def _fingerprint_state(item):
+        """Get the state of a form component which determines its rendering.
+
+        Args:
+            item: Object of type OdkPrompt, OdkGroup, OdkRepeat, OdkTable,
+                OdkCalculate or OdkCustomType.
+
+        Returns:
+            tuple: Class name, row, choice options, and nested components.
+        """
+        choices = getattr(item, "choices", None)
+        nested = item.data if isinstance(item, (OdkGroup, OdkRepeat, OdkTable)) else ()
+        return (
+            type(item).__name__,
+            getattr(item, "row", None),
+            getattr(item, "renderable", None),
+            choices.data if choices else None,
+            [OdkForm._fingerprint_state(x) for x in nested],
+        )
+
+    @staticmethod
+    def _fingerprint(item):
+        """Get a content hash of a form component before it is rendered.
+
+        Args:
+            item: Object of type OdkPrompt, OdkGroup, OdkRepeat, OdkTable,
+                OdkCalculate or OdkCustomType.
+
+        Returns:
+            str: Hex digest that changes whenever the rendering could change.
+        """
+        state = repr(OdkForm._fingerprint_state(item))
+        return hashlib.sha1(state.encode("utf-8")).hexdigest()
+
+    def to_html(self, lang=None, fragment_cache=None, **kwargs):
         """Get the JSON representation of an entire XLSForm.
 
         Args:
             lang (str): The language.
+            fragment_cache (dict): If supplied, rendered top-level components
+                are looked up in and stored to it by content hash, so that
+                only components which changed since a previous render of the
+                same options are rendered again. Entries not used by this
+                render are dropped.
             **highlight (bool): For color highlighting of various components
 
-            **debug (bool): For inclusion of debug information to be printed
-                in the JavaScript console.
+            **debug (bool or str): True or 'inline' for inclusion of debug
+                information to be printed in the JavaScript console. Other
+                DEBUG_MODES are left to the caller, e.g. 'sidecar' for
+                iter_json() to be written to a file of its own.
+            **assets (str): URL of a directory with the assets of the style,
+                e.g. the logo, as from write_assets(), to link to them rather
+                than inline them. Only applies to 'html' format.
+            **compact (bool): Stylesheet classes in place of inline styles,
+                in 'html' format, and no insignificant whitespace.
+            **backend (str): One of RENDER_BACKENDS. 'templates', the
+                default, renders each component with its own templates.
+                'document' renders the whole questionnaire with one template.
+            **workers (int): Number of processes to render sections of the
+                questionnaire in, as split by _starts_section(). Output is
+                the same as rendering them in order. Not used with a
+                fragment_cache.
 
         Returns:
             str: A detailed HTML representation of the XLSForm.
         """
+        html_questionnaire = "".join(
+            self.iter_html(lang=lang, fragment_cache=fragment_cache, **kwargs)
+        )
+        if kwargs.get("compact"):
+            html_questionnaire = compact_html(html_questionnaire)
+        return html_questionnaire
+
+    def iter_html(self, lang=None, fragment_cache=None, **kwargs):
+        """Render an entire XLSForm piece by piece, as for to_html().
+
+        Pieces are yielded as they are rendered, so that they can be written
+        out without the whole document being held in memory. Compaction needs
+        the whole document, so the 'compact' option is left to to_html().
+
+        Args:
+            lang (str): The language.
+            fragment_cache (dict): Rendered top-level components, as for
+                to_html(). Updated once all pieces are yielded.
+            **kwargs: Options, as for to_html().
+
+        Yields:
+            str: Pieces of the HTML representation, in order.
+        """
         render_calculates = True
         language = lang if lang else self.language
-        debug = True if "debug" in kwargs and kwargs["debug"] else False
-        html_questionnaire = ""
+        debug = kwargs.get("debug") in (True, "inline")
+        workers = kwargs.pop("workers", None)
         qre = self.questionnaire
         if "template" not in kwargs:
             kwargs["template"] = "standard"
         if kwargs["template"] == "standard":
-            name_to_q_nums = OdkForm._get_name_to_q_num_map(qre)
-            qre = OdkForm._set_name_refs_to_q_nums(qre, name_to_q_nums)
+            with stage("names"):
+                name_to_q_nums = OdkForm._get_name_to_q_num_map(qre)
+                qre = OdkForm._set_name_refs_to_q_nums(qre, name_to_q_nums)
             # render_calculates = False
         data = {
             "header": {
                 "title": self.get_title(
-                    settings=self.settings, wb=self.metadata["raw_data"], lang=lang
+                    settings=self.settings,
+                    file_name=self.metadata["file_name"],
+                    lang=lang,
                 )
             },
             "footer": {"data": self.to_json(pretty=True) if debug else "false"},
@@ -411,52 +736,149 @@ class OdkForm:
         }
 
         # - Render Header
+        # Documents in other formats than 'html' are self-contained.
+        if kwargs["format"] != "html":
+            kwargs.pop("assets", None)
+        style = kwargs["style"] if "style" in kwargs else "default"
+        logo = None
+        if "logo.png" in STYLE_ASSETS.get(style, ()):
+            logo = (
+                kwargs["assets"] + "logo.png"
+                if kwargs.get("assets")
+                else asset_data_uri(style, "logo.png")
+            )
+        env = render_env(kwargs.get("style"))
         # pylint: disable=no-member
-        header = TEMPLATE_ENV.get_template("header.html").render(
+        header = env.get_template("header.html").render(
             data=data["header"],
             render_image=False if kwargs["format"] == "doc" else True,
+            logo=logo,
             **kwargs,
             settings=kwargs
         )
-        # pylint: disable=no-member
-        grp_spc = TEMPLATE_ENV.get_template("content/group/group-spacing.html").render()
-        html_questionnaire += header
+        yield header
 
         # - Render Body
+        # Nodes are rendered together, unless rendered components are cached,
+        # or sections are rendered in parallel.
+        settings = OdkPrompt.html_options(lang=language, **kwargs)
+        options_key = repr((language, sorted(kwargs.items())))
+        parallel = fragment_cache is None and workers and workers > 1
+        fragments = {}
+        nodes = []
+        sections = []
         prev_item = None
         for index, item in enumerate(data["questionnaire"]):
             if exclusion(item=item, settings=kwargs):
                 continue
             if isinstance(item, OdkCalculate):
                 item.renderable = render_calculates
+            spacing = []
             if prev_item is not None and isinstance(item, OdkGroup):
-                html_questionnaire += grp_spc
+                spacing.append(("group_spacing", {}))
             elif isinstance(prev_item, OdkGroup) and not isinstance(item, OdkGroup):
-                html_questionnaire += grp_spc
+                spacing.append(("group_spacing", {}))
+            item_kwargs = {}
             if (
                 isinstance(item, OdkPrompt)
                 and item.is_section_header
                 and isinstance(data["questionnaire"][index + 1], OdkGroup)
             ):
-                html_questionnaire += item.to_html(
-                    lang=language, **kwargs, bottom_border=True
-                )
+                item_kwargs["bottom_border"] = True
+            if parallel:
+                if not sections or OdkForm._starts_section(item, prev_item):
+                    sections.append([])
+                sections[-1].append((spacing, item, item_kwargs))
+            elif fragment_cache is None:
+                nodes += spacing
+                nodes += item.to_nodes(lang=language, **kwargs, **item_kwargs)
             else:
-                html = item.to_html(lang=language, **kwargs)
-                html_questionnaire += html
+                key = (self._fingerprint(item), options_key, repr(item_kwargs))
+                html = fragment_cache.get(key)
+                if html is None:
+                    item_nodes = item.to_nodes(lang=language, **kwargs, **item_kwargs)
+                    html = render_nodes(env, item_nodes, **settings)
+                fragments[key] = html
+                yield from iter_nodes(env, spacing, **settings)
+                yield html
             prev_item = item
+        if sections:
+            yield from self._render_sections(
+                sections, workers, language, kwargs, settings
+            )
+        yield from iter_nodes(env, nodes, **settings)
+        if fragment_cache is not None:
+            fragment_cache.clear()
+            fragment_cache.update(fragments)
 
         # pylint: disable=no-member
-        footer = TEMPLATE_ENV.get_template("footer.html").render(
-            info=None,
-            warnings="false",  # to-do: no warnings yet
+        footer = env.get_template("footer.html").render(
+            info="false",
+            warnings=self.diagnostics.to_json() if self.diagnostics else "false",
             data=data["footer"]["data"],
             **kwargs,
             settings=kwargs
         )
-        html_questionnaire += footer
+        yield footer
 
-        return html_questionnaire
+    @staticmethod
+    def _starts_section(item, prev_item):
+        """Check if a top-level component starts a section of the form.
+
+        Sections start at section headers, i.e. prompts named 'sect_*', and at
+        top-level groups, unless the group follows a section header.
+
+        Args:
+            item: A top-level form component.
+            prev_item: The previous top-level form component rendered.
+
+        Returns:
+            bool: True if a new section starts with the component.
+        """
+        if isinstance(item, OdkPrompt) and item.is_section_header:
+            return True
+        return isinstance(item, OdkGroup) and not (
+            isinstance(prev_item, OdkPrompt) and prev_item.is_section_header
+        )
+
+    @staticmethod
+    def _render_sections(sections, workers, lang, kwargs, settings):
+        """Render sections of the questionnaire in a pool of processes.
+
+        Each process renders a whole section at a time, as by
+        render_section(), in the style of the form. If a ChromeTrace is
+        active, the rendering of each section is traced in its process.
+
+        Args:
+            sections (list): Lists of the spacing nodes, component, and
+                keyword args of each top-level component of a section.
+            workers (int): Maximum number of processes.
+            lang (str): The language.
+            kwargs (dict): Options, as for to_html().
+            settings (dict): Context of the templates, as from html_options().
+
+        Yields:
+            str: Renderings of sections, in order.
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        from itertools import repeat
+        from ppp.trace import active_trace, traced
+
+        n = len(sections)
+        trace = active_trace()
+        with ProcessPoolExecutor(
+            max_workers=min(workers, n),
+            initializer=set_template_style,
+            initargs=(template_style(kwargs.get("style")),),
+        ) as executor:
+            args = (sections, [lang] * n, [kwargs] * n, [settings] * n)
+            if trace is None:
+                yield from executor.map(render_section, *args)
+                return
+            calls = (repeat("section"), repeat(trace.tags()), repeat(render_section))
+            for html, events in executor.map(traced, *calls, *args):
+                trace.extend(events)
+                yield html
 
     @staticmethod
     def parse_select_type(row, choices, ext_choices):
@@ -478,13 +900,17 @@ class OdkForm:
             A dictionary with the simple information about this prompt.
 
         Raises:
-            OdkFormError: If the row is not select_[one|multiple](_external)?
+            OdkFormError: If the row is not select_[one|multiple](_external)?,
+                or has no list name.
             KeyError: If the select question's choice list is not found.
         """
         simple_row = {"token_type": "prompt"}
         simple_type = "select_one"
         row_type = row["type"]
-        list_name = row_type.split(maxsplit=1)[1]
+        parts = row_type.split(maxsplit=1)
+        if len(parts) < 2:
+            raise OdkFormError("Select type '{}' has no list name.".format(row_type))
+        list_name = parts[1]
 
         try:
             if row_type.startswith("select_one_external "):
@@ -602,7 +1028,92 @@ class OdkForm:
 
     # pylint: disable=too-many-branches
     @staticmethod
-    def convert_survey(wb, choices, ext_choices):
+    def add_token(context, token, dict_row):
+        """Add the component described by a parsed row to the context.
+
+        Args:
+            context (ConversionContext): The context of the conversion.
+            token (dict): simple_row information from parse_type().
+            dict_row (dict): A row as a dictionary. Keys and values are strings.
+
+        Returns:
+            The component made of the row, e.g. an OdkPrompt, or None if the
+            row only closes or opens a context.
+
+        Raises:
+            OdkFormError: If the parsing rules are broken based on the
+                current context.
+            OdkChoicesError: If a select prompt has no choices.
+        """
+        if token["token_type"] == "prompt":
+            dict_row["simple_type"] = token["simple_type"]
+            choice_list = token["choice_list"]
+            this_prompt = OdkPrompt(dict_row, choice_list)
+            context.add_prompt(this_prompt)
+            return this_prompt
+        elif token["token_type"] == "calculate":
+            dict_row["simple_type"] = token["simple_type"]
+            this_calculate = OdkCalculate(dict_row)
+            context.add_calculate(this_calculate)
+            return this_calculate
+        elif token["token_type"] == "begin group":
+            this_group = OdkGroup(dict_row)
+            context.add_group(this_group)
+            return this_group
+        elif token["token_type"] == "context group":
+            # Possibly make an OdkGroup here...
+            context.add_context_group()
+        elif token["token_type"] == "end group":
+            context.end_group()
+        elif token["token_type"] == "begin repeat":
+            this_repeat = OdkRepeat(dict_row)
+            context.add_repeat(this_repeat)
+            return this_repeat
+        elif token["token_type"] == "end repeat":
+            context.end_repeat()
+        elif token["token_type"] == "table":
+            dict_row["simple_type"] = token["simple_type"]
+            choice_list = token["choice_list"]
+            this_prompt = OdkPrompt(dict_row, choice_list)
+            context.add_table(this_prompt)
+            return this_prompt
+        elif token["token_type"] == "custom":
+            this_custom = OdkCustomType(dict_row)
+            context.add_custom_type(this_custom)
+            return this_custom
+        else:
+            # TODO: Make an error?
+            pass
+        return None
+
+    @staticmethod
+    def error_record(err, row_num=None, row=None):
+        """Describe an error found in a form for reporting.
+
+        Args:
+            err (Exception): The error.
+            row_num (int): Row number in worksheet, if applicable.
+            row (dict): The row, if applicable.
+
+        Returns:
+            dict: Row number, variable name, error type, and message.
+        """
+        return {
+            "row": row_num,
+            "name": row.get("name", "") if row else "",
+            "error": type(err).__name__,
+            "message": str(err),
+        }
+
+    @staticmethod
+    def convert_survey(
+        wb,
+        choices,
+        ext_choices,
+        errors=None,
+        language_index=None,
+        diagnostics=None,
+    ):
         """Convert rows and strings of a workbook into object components.
 
         Main types are:
@@ -618,6 +1129,19 @@ class OdkForm:
 
         Args:
             wb (Xlsform): A Xlsform object representing an XLSForm.
+            choices (dict): A dictionary with list_names as keys. Represents
+                the choices found in 'choices' tab.
+            ext_choices (dict): A dictionary with list_names as keys.
+                Represents choices found in 'external_choices' tab.
+            errors (list): If supplied, errors are appended to it, as from
+                error_record(), instead of raised, and conversion continues
+                with the next row. Unexpected errors of rows, a survey with no
+                'type' column, and groups and repeats left open at the end of
+                the survey are reported too.
+            language_index (OdkLanguageIndex): If supplied, the header and
+                every row are added to it.
+            diagnostics (OdkDiagnostics): If supplied, warnings about rows
+                are added to it, with their row numbers.
 
         Returns:
             list: A list of objects representing form components.
@@ -626,7 +1150,8 @@ class OdkForm:
             OdkformError: Handle several errors, including: mismatched groups
                 or repeat groups, errors when appending to groups or repeat
                 groups, erroneously formed tables, duplicate context group
-                names, and groups nested within a field-list group.
+                names, groups nested within a field-list group, and a survey
+                with no 'type' column.
         """
         context = OdkForm.ConversionContext()
         survey, header = None, None
@@ -637,45 +1162,48 @@ class OdkForm:
             pass
 
         if survey and header:
+            if language_index is not None:
+                language_index.add_header("survey", [str(x) for x in header])
+            if "type" not in [str(x) for x in header]:
+                err = OdkFormError("Worksheet 'survey' has no 'type' column.")
+                if errors is None:
+                    raise err
+                errors.append(OdkForm.error_record(err))
+                survey = [header]  # No row can be converted.
             for i, row in enumerate(survey):
                 if i == 0:
                     continue
                 dict_row = {str(k): str(v) for k, v in zip(header, row)}
-                token = OdkForm.parse_type(dict_row, choices, ext_choices)
-
-                if token["token_type"] == "prompt":
-                    dict_row["simple_type"] = token["simple_type"]
-                    choice_list = token["choice_list"]
-                    this_prompt = OdkPrompt(dict_row, choice_list)
-                    context.add_prompt(this_prompt)
-                elif token["token_type"] == "calculate":
-                    dict_row["simple_type"] = token["simple_type"]
-                    this_calculate = OdkCalculate(dict_row)
-                    context.add_calculate(this_calculate)
-                elif token["token_type"] == "begin group":
-                    this_group = OdkGroup(dict_row)
-                    context.add_group(this_group)
-                elif token["token_type"] == "context group":
-                    # Possibly make an OdkGroup here...
-                    context.add_context_group()
-                elif token["token_type"] == "end group":
-                    context.end_group()
-                elif token["token_type"] == "begin repeat":
-                    this_repeat = OdkRepeat(dict_row)
-                    context.add_repeat(this_repeat)
-                elif token["token_type"] == "end repeat":
-                    context.end_repeat()
-                elif token["token_type"] == "table":
-                    dict_row["simple_type"] = token["simple_type"]
-                    choice_list = token["choice_list"]
-                    this_prompt = OdkPrompt(dict_row, choice_list)
-                    context.add_table(this_prompt)
-                elif token["token_type"] == "custom":
-                    this_custom = OdkCustomType(dict_row)
-                    context.add_custom_type(this_custom)
-                else:
-                    # TODO: Make an error?
-                    pass
+                if language_index is not None:
+                    language_index.add_row("survey", dict_row)
+                try:
+                    token = OdkForm.parse_type(dict_row, choices, ext_choices)
+                    component = OdkForm.add_token(context, token, dict_row)
+                    if diagnostics is not None:
+                        if isinstance(component, OdkPrompt):
+                            row_warnings = component.warnings
+                        elif isinstance(component, (OdkGroup, OdkRepeat)):
+                            # Groups do not parse their question numbers.
+                            row_warnings = OdkPrompt.get_question_numbers(dict_row)[1]
+                        else:
+                            row_warnings = []
+                        for warning in row_warnings:
+                            diagnostics.warn(warning, i + 1)
+                # pylint: disable=broad-except
+                except Exception as err:  # Unexpected errors are reported too.
+                    if errors is None:
+                        raise
+                    errors.append(OdkForm.error_record(err, i + 1, dict_row))
+
+        if errors is not None:
+            unclosed = context.group_stack + [
+                x for x in context.pending_stack if isinstance(x, OdkRepeat)
+            ]
+            for item in unclosed:
+                kind = "repeat" if isinstance(item, OdkRepeat) else "group"
+                msg = "Found begin {0} but no end {0}.".format(kind)
+                row = item.row if item else None
+                errors.append(OdkForm.error_record(OdkFormError(msg), row=row))
 
         return context.result
 
@@ -790,10 +1318,10 @@ class OdkForm:
 
             """
             if self.pending_stack:
-                last_pending = self.pending_stack.pop()
-                if not isinstance(last_pending, OdkGroup):
+                if not isinstance(self.pending_stack[-1], OdkGroup):
                     msg = "Found end group but no group in pending stack"
                     raise OdkFormError(msg)
+                last_pending = self.pending_stack.pop()
                 last_pending.add_pending()
                 if self.pending_stack:
                     self.pending_stack[-1].add(last_pending)
@@ -853,9 +1381,8 @@ class OdkForm:
 
             """
             if self.pending_stack:
-                last_pending = self.pending_stack.pop()
-                if isinstance(last_pending, OdkRepeat):
-                    self.result.append(last_pending)
+                if isinstance(self.pending_stack[-1], OdkRepeat):
+                    self.result.append(self.pending_stack.pop())
                 else:
                     msg = "Found end repeat but no repeat in pending stack."
                     raise OdkFormError(msg)
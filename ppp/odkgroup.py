@@ -1,20 +1,10 @@
 """Module for the OdkGroup class."""
-# from ppp.config import TEMPLATE_ENV
-from ppp.config import get_template_env
-from ppp.odkprompt import OdkPrompt, set_template_env as odkpromt_template
-from ppp.odktable import OdkTable, set_template_env as odktable_template
+from ppp.config import render_env, render_nodes
+from ppp.profiler import profiled
+from ppp.odkprompt import OdkPrompt
+from ppp.odktable import OdkTable
 from ppp.definitions.utils import exclusion
 
-TEMPLATE_ENV = None
-
-
-def set_template_env(template):
-    """Set template env."""
-    global TEMPLATE_ENV
-    TEMPLATE_ENV = get_template_env(template)
-    odktable_template(template)
-    odkpromt_template(template)
-
 
 class OdkGroup:
     """Class to represent a field-list group in XLSForm.
@@ -106,27 +96,23 @@ class OdkGroup:
         group_text = sep.join(obj_texts)
         return group_text
 
-    def to_html(self, lang, **kwargs):
-        """Convert group components to html and return concatenation.
+    @profiled
+    def to_nodes(self, lang, **kwargs):
+        """Get the nodes to render group components with.
 
         Args:
             lang (str): The language.
 
         Returns:
-            str: A rendered html concatenation of component templates.
+            list: Tuples of macro name and macro arguments.
         """
-        html = ""
-        # pylint: disable=no-member
-
-        # - Render header
-        html += TEMPLATE_ENV.get_template("content/group/group-opener.html").render(
-            **kwargs, settings=kwargs
-        )
+        # - Header
+        nodes = [("group_opener", {})]
         header = self.format_header(self.row)
 
-        html += OdkPrompt(header).to_html(lang, **kwargs)
+        nodes += OdkPrompt(header).to_nodes(lang, **kwargs)
 
-        # - Render body
+        # - Body
         for i in self.data:
             row = i.data[0] if isinstance(i, OdkTable) else i
             if exclusion(item=row, settings=kwargs):
@@ -135,15 +121,26 @@ class OdkGroup:
             if isinstance(i, OdkPrompt):
                 i.row["in_repeat"] = self.in_repeat
                 i.row["in_group"] = True
-                html += i.to_html(lang, **kwargs)
+                nodes += i.to_nodes(lang, **kwargs)
             elif isinstance(i, OdkTable):
                 i.in_repeat = self.in_repeat
-                html += i.to_html(lang, **kwargs)
+                nodes += i.to_nodes(lang, **kwargs)
 
-        # - Render footer
-        # pylint: disable=no-member
-        html += TEMPLATE_ENV.get_template("content/group/group-closer.html").render(
-            **kwargs, settings=kwargs
-        )
+        # - Footer
+        nodes.append(("group_closer", {}))
+
+        return nodes
 
-        return html
+    def to_html(self, lang, **kwargs):
+        """Convert group components to html and return concatenation.
+
+        Args:
+            lang (str): The language.
+
+        Returns:
+            str: A rendered html concatenation of component templates.
+        """
+        settings = OdkPrompt.html_options(lang=lang, **kwargs)
+        return render_nodes(
+            render_env(kwargs.get("style")), self.to_nodes(lang, **kwargs), **settings
+        )
@@ -0,0 +1,215 @@
+"""Module for the OdkLanguageIndex class."""
+from functools import lru_cache
+
+from ppp.definitions.constants import (
+    LANGUAGE_DEPENDENT_FIELDS,
+    LANGUAGE_PERTINENT_WORKSHEETS,
+    PPP_REPLACEMENTS_FIELDS,
+    SYNTAX,
+)
+from ppp.definitions.error import InvalidLanguageException
+
+# Longest first, so that e.g. 'media::image::English' is not read as 'media'.
+INDEXED_FIELDS = tuple(
+    sorted(
+        LANGUAGE_DEPENDENT_FIELDS
+        + tuple("ppp_" + x for x in PPP_REPLACEMENTS_FIELDS)
+        + ("ppp_form_title",),
+        key=len,
+        reverse=True,
+    )
+)
+DELIMITERS = sorted(SYNTAX["xlsforms"]["language_field_delimiters"], key=len)[::-1]
+
+
+class OdkLanguageIndex:
+    """Class to index the languages of an XLSForm across its worksheets.
+
+    Columns of language dependent fields, e.g. 'label::English' or
+    'hint:Français', are indexed by field and language when the header of a
+    worksheet is read, and their non-empty cells are counted as rows are read.
+    A column without a language, e.g. 'label', is indexed under the default
+    language, ''.
+
+    Attributes:
+        worksheets (dict): Worksheet names mapped to 'rows', the number of
+            rows read, and 'columns', column names mapped to their 'field',
+            'language', and 'filled', the number of non-empty cells.
+    """
+
+    def __init__(self):
+        """Initialize an empty index."""
+        self.worksheets = {}
+
+    def __repr__(self):
+        """Print representation of instance."""
+        return "<OdkLanguageIndex {}>".format(self.languages)
+
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def parse_column(column):
+        """Split a column name into field and language.
+
+        Args:
+            column (str): Column name from a worksheet header.
+
+        Returns:
+            tuple: (field, language), where language is '' for the default
+            language, or None if the column is not language dependent.
+        """
+        for field in INDEXED_FIELDS:
+            if column == field:
+                return field, ""
+            for delimiter in DELIMITERS:
+                if column.startswith(field + delimiter):
+                    return field, column[len(field + delimiter) :]
+        return None
+
+    @staticmethod
+    def survey_languages(wb):
+        """Get the languages of a workbook from the header of its survey.
+
+        Much cheaper than converting the form, when only its languages are
+        needed.
+
+        Args:
+            wb (Xlsform): A Xlsform object representing ODK form.
+
+        Returns:
+            list: Languages which the form can be rendered in, as by languages.
+        """
+        index = OdkLanguageIndex()
+        try:
+            index.add_header("survey", [str(x) for x in wb["survey"][0]])
+        except (KeyError, IndexError):  # No survey, or an empty one, found.
+            pass
+        return index.languages
+
+    def add_header(self, ws, header):
+        """Index the language dependent columns of a worksheet.
+
+        Args:
+            ws (str): Name of worksheet.
+            header (list): Column names.
+        """
+        columns = {}
+        for column in header:
+            parsed = self.parse_column(column)
+            if parsed:
+                columns[column] = {
+                    "field": parsed[0],
+                    "language": parsed[1],
+                    "filled": 0,
+                }
+        self.worksheets[ws] = {"rows": 0, "columns": columns}
+
+    def add_row(self, ws, dict_row):
+        """Count the non-empty language dependent cells of a row.
+
+        Args:
+            ws (str): Name of worksheet, of which the header was added.
+            dict_row (dict): A row as a dictionary. Keys and values are strings.
+        """
+        sheet = self.worksheets[ws]
+        sheet["rows"] += 1
+        for column, info in sheet["columns"].items():
+            if dict_row.get(column):
+                info["filled"] += 1
+
+    def add_settings(self, settings):
+        """Index the 'settings' worksheet, which has a single row.
+
+        Args:
+            settings (dict): Form settings.
+        """
+        self.add_header("settings", list(settings))
+        self.add_row("settings", {k: str(v) if v else "" for k, v in settings.items()})
+
+    def field_languages(self, ws, field):
+        """Get the languages of a field in a worksheet.
+
+        Args:
+            ws (str): Name of worksheet.
+            field (str): Field name, e.g. 'label'.
+
+        Returns:
+            list: Alphabetized list of languages, '' being the default.
+        """
+        columns = self.worksheets.get(ws, {}).get("columns", {}).values()
+        return sorted({x["language"] for x in columns if x["field"] == field})
+
+    @property
+    def languages(self):
+        """list: Languages which a form can be rendered in.
+
+        These are the languages of the 'label' field in the 'survey', other
+        than the default language.
+        """
+        return [x for x in self.field_languages("survey", "label") if x]
+
+    @property
+    def all_languages(self):
+        """list: Languages found in any column of any worksheet."""
+        langs = set()
+        for sheet in self.worksheets.values():
+            langs |= {x["language"] for x in sheet["columns"].values()}
+        return sorted(x for x in langs if x)
+
+    def completeness(self, language):
+        """Get translation completeness of each field in a language.
+
+        Args:
+            language (str): The language. '' for the default language.
+
+        Returns:
+            dict: Worksheet names mapped to dicts of field names mapped to
+            [number of non-empty cells, number of rows].
+        """
+        result = {}
+        for ws, sheet in self.worksheets.items():
+            fields = {}
+            for info in sheet["columns"].values():
+                if info["language"] == language:
+                    fields[info["field"]] = [info["filled"], sheet["rows"]]
+            if fields:
+                result[ws] = fields
+        return result
+
+    def validate(self, language):
+        """Check that a form can be rendered in a language.
+
+        Args:
+            language (str or None): The language. None or '' for the default
+                language, which is always valid.
+
+        Raises:
+            InvalidLanguageException: If the 'survey' has no labels in the
+                language, or a choices worksheet has labels in other
+                languages but not this one.
+        """
+        if not language:
+            return
+        missing = []
+        if language not in self.languages:
+            missing.append("survey")
+        for ws in LANGUAGE_PERTINENT_WORKSHEETS[1:]:
+            langs = self.field_languages(ws, "label")
+            if any(langs) and language not in langs:
+                missing.append(ws)
+        if missing:
+            msg = (
+                "InvalidLanguageException: "
+                "Language '{}' not found in worksheet(s): {}.\n"
+                "Languages available: {}".format(
+                    language, ", ".join(missing), ", ".join(self.languages)
+                )
+            )
+            raise InvalidLanguageException(msg)
+
+    def to_dict(self):
+        """Get the dictionary representation of the index.
+
+        Returns:
+            dict: Languages and worksheets.
+        """
+        return {"languages": self.languages, "worksheets": self.worksheets}
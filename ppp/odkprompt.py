@@ -1,9 +1,10 @@
 """Module for the OdkPrompt class."""
-from sys import stderr
+from functools import lru_cache
 import re
 import textwrap
 
-from ppp.config import get_template_env
+from ppp.config import render_env, render_nodes
+from ppp.profiler import profiled
 from ppp.definitions.constants import (
     MEDIA_FIELDS,
     TRUNCATABLE_FIELDS,
@@ -15,14 +16,17 @@ from ppp.definitions.constants import (
     PPP_REPLACEMENTS_FIELDS,
 )
 from ppp.definitions.error import OdkException, OdkChoicesError
+from ppp.odklanguageindex import OdkLanguageIndex
 
-TEMPLATE_ENV = None
-
-
-def set_template_env(template):
-    """Set template env."""
-    global TEMPLATE_ENV
-    TEMPLATE_ENV = get_template_env(template)
+# A question number, e.g. '201a', followed by '.', whitespace and a letter.
+QUESTION_NUMBER_PATTERN = re.compile(
+    r"^(?=.*\d)[a-zA-Z0-9._\-](.+?)\.[ \n\t](.+?)[a-zA-Z]."
+)
+# A question number, followed by '.' and a letter without whitespace between.
+QUESTION_NUMBER_NO_SPACE_PATTERN = re.compile(
+    r"^(?=.*\d)[a-zA-Z0-9._\-](.+?)\.[a-zA-Z]."
+)
+NO_SPACE_WARNING = "Question number {} does not have a space after '.'"
 
 
 class OdkPrompt:
@@ -36,6 +40,9 @@ class OdkPrompt:
         odktype (str): The value corresponding to the prompts ODK type.
         is_section_header (bool): Designates whether or not the prompt is a
             section header.
+        question_numbers (dict): Label languages, '' being the default,
+            mapped to the question number at the start of the label.
+        warnings (list): Warnings about the prompt found on initialization.
 
     Class Attributes:
         select_types (tuple): Prompt types which can accept data and include a
@@ -74,6 +81,7 @@ class OdkPrompt:
         self.choices = choices
         self.odktype = self.row["simple_type"]
         self.is_section_header = True if self.row["name"].startswith("sect_") else False
+        self.question_numbers, self.warnings = self.get_question_numbers(row)
         if self.odktype in OdkPrompt.select_types and self.choices is None:
             msg = "No choices found for prompt '{}' of type '{}'.".format(
                 self.row["name"], self.odktype
@@ -265,18 +273,125 @@ class OdkPrompt:
                     prompt[x] = ""
         return prompt
 
+    @staticmethod
+    def label_text(label):
+        """Get the text of a label.
+
+        Args:
+            label (str or list): A label, which OdkPrompt may have converted
+                into a list of paragraphs.
+
+        Returns:
+            str: The label, or its first paragraph.
+
+        Raises:
+            OdkException: If the label is of another type.
+        """
+        if isinstance(label, str):
+            return label
+        if isinstance(label, list):
+            return label[0]
+        msg = (
+            "Unsure how to handle label with type {} in the following "
+            "label.\n\n{}.".format(type(label).__name__, label)
+        )
+        raise OdkException(msg)
+
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def find_question_number(label):
+        """Find the question number at the start of a label.
+
+        Looks for a substring that matches a 'question number pattern', which
+        is (1) a 'question number' (can include letters and some other special
+        characters), followed by (2) a period, followed by (3) 1 or more
+        spaces, followed by (4) a letter. If there is none, looks for the same
+        without (3). Results are memoized, as the same labels are looked up by
+        every form component, conversion and language which uses them.
+
+        Args:
+            label (str): The label.
+
+        Returns:
+            tuple: (question number, i.e. the text matching (1), or '' if not
+            found, True if the question number is not followed by a space)
+        """
+        # TODO: Won't need if better regexp. Current one matches sentences with
+        # multiple spaces and include a number in them.
+        arbitrary_character_threshold = 20
+        text = label[0:arbitrary_character_threshold]
+        no_space = False
+        match = QUESTION_NUMBER_PATTERN.search(text)
+        if not match:
+            match = QUESTION_NUMBER_NO_SPACE_PATTERN.search(text)
+            no_space = bool(match)
+        if not match:
+            return "", False
+
+        q_number = match.group(0)  # gets the first match
+        # removes . and anything to the right of it from q_number
+        for i in range(len(q_number)):
+            if q_number[-i] == ".":
+                q_number = q_number[0:-i]
+                break
+        return q_number, no_space
+
+    @staticmethod
+    def get_question_numbers(row):
+        """Get the question numbers of the labels of a row in each language.
+
+        Args:
+            row (dict): Dictionary representation of prompt.
+
+        Returns:
+            tuple: (dict of label languages, '' being the default, mapped to
+            question numbers, in order of columns; list of warnings)
+
+        Raises:
+            OdkException: If a label is neither a string nor a list.
+        """
+        numbers, warnings = {}, []
+        for column, label in row.items():
+            parsed = OdkLanguageIndex.parse_column(column)
+            if not parsed or parsed[0] != "label" or parsed[1] in numbers:
+                continue
+            q_number, no_space = OdkPrompt.find_question_number(
+                OdkPrompt.label_text(label) if label else ""
+            )
+            numbers[parsed[1]] = q_number
+            if no_space and NO_SPACE_WARNING.format(q_number) not in warnings:
+                warnings.append(NO_SPACE_WARNING.format(q_number))
+        return numbers, warnings
+
+    def question_number(self, lang=None):
+        """Get the question number of the prompt in a language.
+
+        As forms have always numbered questions, a label without a question
+        number in the language takes that of the default or English label.
+
+        Args:
+            lang (str): The language.
+
+        Returns:
+            str: The question number of the label in the language, else of the
+            label in the default language, else in English, else in the
+            language of the first label column. '' if there is none.
+        """
+        numbers = self.question_numbers
+        if lang and numbers.get(lang):
+            return numbers[lang]
+        for default in ("", "English"):
+            if default in numbers:
+                return numbers[default]
+        return next(iter(numbers.values()), "")
+
     @staticmethod
     def extract_question_numbers(prompt):
         """Extracts question no. from label field and sets to question_number.
 
-        First, it standardizes the label it's searching through to a string, as
-        it is possible for OdkPrompt to have converted the label into a 'list'
-        object. Then, it uses a regexp (regular expression) to look for a
-        substring that matches a 'question number pattern', which is (1) a
-        'question number' (can include letters and some other special
-        characters), followed by (2) a period, followed by (3) 1 or more
-        spaces, followed by (4) a letter. After this, it then sets the question
-        number to be equal to the text matching (1) as just described.
+        The label searched is 'label', else 'label::English', else the first
+        label in another language. Forms do not need to call this, as prompts
+        extract the question numbers of all of their labels on initialization.
 
         Args:
             prompt (dict): Dictionary representation of prompt.
@@ -284,14 +399,9 @@ class OdkPrompt:
         Returns
             dict: Reformatted representation.
         """
-        # TODO: Won't need if better regexp. Current one matches sentences with
-        # multiple spaces and include a number in them.
-        arbitrary_character_threshold = 20
-        warning = ""
         prompt["question_number"] = (
             prompt["question_number"] if "question_number" in prompt else ""
         )
-        # This could be better. Doesn't get at default language.
         lang_labels = [x for x in prompt if x.startswith("label:")]
         label = (
             prompt["label"]
@@ -300,44 +410,9 @@ class OdkPrompt:
             if "label::English" in prompt
             else prompt[lang_labels[0]]
         )
-        label_type = type(label).__name__
-        if label_type == "str":
-            label = label
-        elif label_type == "list":
-            label = label[0]
-        else:
-            msg = (
-                "Unsure how to handle label with type {} in the following "
-                "label.\n\n{}.".format(label_type, label)
-            )
-            raise OdkException(msg)
-
-        match = re.search(
-            r"^(?=.*\d)[a-zA-Z0-9._\-](.+?)\.[ \n\t](.+?)[a-zA-Z].",
-            label[0:arbitrary_character_threshold],
-        )
-        # Tries to match with space after '.'. If not, looks for w/ no space.
-        if not match:
-            match = re.search(
-                r"^(?=.*\d)[a-zA-Z0-9._\-](.+?)\.[a-zA-Z].",
-                label[0:arbitrary_character_threshold],
-            )
-            if match:
-                warning = (
-                    "Warning: Question number {} does not have a space " "after '.'"
-                )
-
-        if match:
-            q_number = match.group(0)  # gets the first match
-            # removes . and anything to the right of it from q_number
-            for i in range(len(q_number)):
-                if q_number[-i] == ".":
-                    q_number = q_number[0:-i]
-                    break
+        q_number = OdkPrompt.find_question_number(OdkPrompt.label_text(label))[0]
+        if q_number:
             prompt["question_number"] = q_number
-        if warning:
-            print(warning.format(prompt["question_number"]), file=stderr)
-
         return prompt
 
     @staticmethod
@@ -571,6 +646,7 @@ class OdkPrompt:
         result = "\n\n".join(text)
         return result
 
+    @profiled
     def to_dict(self, lang, **kwargs):
         """Get the text representation of the detailed prompt.
 
@@ -580,16 +656,18 @@ class OdkPrompt:
                 is necessary for section headers followed by a group.
 
         Returns:
-            dict: The text from all parts of the prompt.
+            dict: The text from all parts of the prompt. The row of the
+            prompt is left as is, so that it can be called more than once,
+            e.g. for debug data after rendering.
         """
-        prompt = OdkPrompt._format_media_labels(self.row)
+        prompt = OdkPrompt._format_media_labels(dict(self.row))
         prompt = OdkPrompt._set_grouped_media_field(prompt)
         prompt = OdkPrompt._set_descriptive_metadata(prompt)
         prompt = OdkPrompt._reformat_default_lang_vars(prompt, lang)
         prompt = OdkPrompt._truncate_fields(prompt)
         prompt = OdkPrompt._reformat_double_line_breaks(prompt)
         prompt = OdkPrompt._streamline_constraint_message(prompt)
-        prompt = OdkPrompt.extract_question_numbers(prompt)
+        prompt["question_number"] = self.question_number(lang)
         if "style" in kwargs and kwargs["style"] != "old":
             prompt = OdkPrompt._remove_question_nums_from_labels(prompt)
 
@@ -623,6 +701,22 @@ class OdkPrompt:
             kwargs["language"] = lang
         return kwargs
 
+    @profiled
+    def to_nodes(self, lang, **kwargs):
+        """Get the nodes to render the prompt with.
+
+        Args:
+            lang (str): The language.
+            **kwargs: Arbitrary keyword arguments delegated detailedy to
+            to_dict().
+
+        Returns:
+            list: A single node, a tuple of macro name and macro arguments.
+        """
+        settings = self.html_options(lang=lang, **kwargs)
+        question = self.to_dict(lang=lang, **settings)
+        return [("content_tr_base", {"question": question})]
+
     def to_html(self, lang, **kwargs):
         """Convert to html.
 
@@ -635,8 +729,6 @@ class OdkPrompt:
             str: A rendered html template.
         """
         settings = self.html_options(lang=lang, **kwargs)
-        question = self.to_dict(lang=lang, **settings)
-        # pylint: disable=no-member
-        return TEMPLATE_ENV.get_template("content/content-tr-base.html").render(
-            question=question, **settings
+        return render_nodes(
+            render_env(kwargs.get("style")), self.to_nodes(lang, **kwargs), **settings
         )
@@ -1,24 +1,13 @@
 """Module for the OdkRepeat class."""
 import textwrap
 
-# from ppp.config import TEMPLATE_ENV
-from ppp.config import get_template_env
-from ppp.odkgroup import OdkGroup, set_template_env as odkgroup_template
-from ppp.odkprompt import OdkPrompt, set_template_env as odkpromt_template
-from ppp.odktable import OdkTable, set_template_env as odktable_template
+from ppp.config import render_env, render_nodes
+from ppp.profiler import profiled
+from ppp.odkgroup import OdkGroup
+from ppp.odkprompt import OdkPrompt
+from ppp.odktable import OdkTable
 from ppp.definitions.utils import exclusion
 
-TEMPLATE_ENV = None
-
-
-def set_template_env(template):
-    """Set template env"""
-    global TEMPLATE_ENV
-    TEMPLATE_ENV = get_template_env(template)
-    odkgroup_template(template)
-    odkpromt_template(template)
-    odktable_template(template)
-
 
 class OdkRepeat:
     """Class to represent repeat construct from XLSForm.
@@ -44,8 +33,8 @@ class OdkRepeat:
         return "<OdkRepeat {}: {}>".format(self.row["name"], self.data)
 
     @staticmethod
-    def render_header(i, lang, **kwargs):
-        """Render repeat group header.
+    def header_nodes(i, lang, **kwargs):
+        """Get the nodes to render repeat group header with.
 
         A repeat group header consists of some opening html tags, followed by
         an OdkPrompt with a few extra attributes.
@@ -53,34 +42,17 @@ class OdkRepeat:
         Args:
             i (dict): A dictionary row representing first row of repeat group.
             lang (str): The language.
-
-
             **kwargs: Keyword arguments.
 
         Returns:
-            str: A rendered html representation of repeat group header.
+            list: Tuples of macro name and macro arguments.
         """
-        # pylint: disable=no-member
-        html = TEMPLATE_ENV.get_template("content/repeat/repeat-opener.html").render(
-            **kwargs, settings=kwargs
-        )
+        nodes = [("repeat_opener", {})]
         i["simple_type"] = i["type"]
         i["in_repeat"] = True
         i["is_repeat_header"] = True
-        html += OdkPrompt(i).to_html(lang, **kwargs, settings=kwargs)
-        return html
-
-    @staticmethod
-    def render_footer():
-        """Render repeat group footer.
-
-        A repeat group footer consists of some closing html tags.
-
-        Returns:
-            str: A rendered html representation of repeat group footer.
-        """
-        # pylint: disable=no-member
-        return TEMPLATE_ENV.get_template("content/repeat/repeat-closer.html").render()
+        nodes += OdkPrompt(i).to_nodes(lang, **kwargs)
+        return nodes
 
     def add(self, obj):
         """Add XLSForm object to repeat.
@@ -107,38 +79,51 @@ class OdkRepeat:
         wrapped = textwrap.indent(repeat_text, "|  ", lambda x: True)
         return wrapped
 
-    def to_html(self, lang, **kwargs):
-        """Convert repeat group components to html and return concatenation.
+    @profiled
+    def to_nodes(self, lang, **kwargs):
+        """Get the nodes to render repeat group components with.
 
         Args:
             lang (str): The language.
-
-
             **kwargs: Keyword arguments.
 
         Returns:
-            str: A rendered html concatenation of component templates.
+            list: Tuples of macro name and macro arguments.
         """
-        html = ""
-
-        # - Render header
-        html += self.render_header(self.row, lang, **kwargs)
+        # - Header
+        nodes = self.header_nodes(self.row, lang, **kwargs)
 
-        # - Render body
+        # - Body
         for i in self.data:
             if exclusion(item=i, settings=kwargs):
                 continue
 
             if isinstance(i, OdkPrompt):
                 i.row["in_repeat"] = True
-                html += i.to_html(lang, **kwargs)
+                nodes += i.to_nodes(lang, **kwargs)
             elif isinstance(i, OdkGroup):
                 i.in_repeat = True
-                html += i.to_html(lang, **kwargs)
+                nodes += i.to_nodes(lang, **kwargs)
             elif isinstance(i, OdkTable):
                 i.in_repeat = True
-                # - Render footer
-                html += i.to_html(lang, **kwargs)
-        html += self.render_footer()
+                nodes += i.to_nodes(lang, **kwargs)
+
+        # - Footer
+        nodes.append(("repeat_closer", {}))
+
+        return nodes
 
-        return html
+    def to_html(self, lang, **kwargs):
+        """Convert repeat group components to html and return concatenation.
+
+        Args:
+            lang (str): The language.
+            **kwargs: Keyword arguments.
+
+        Returns:
+            str: A rendered html concatenation of component templates.
+        """
+        settings = OdkPrompt.html_options(lang=lang, **kwargs)
+        return render_nodes(
+            render_env(kwargs.get("style")), self.to_nodes(lang, **kwargs), **settings
+        )
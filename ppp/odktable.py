@@ -1,18 +1,10 @@
 """Module for the OdkTable class."""
-# from ppp.config import TEMPLATE_ENV
-from ppp.config import get_template_env
+from ppp.config import render_env, render_nodes
+from ppp.profiler import profiled
 from ppp.definitions.utils import exclusion
 
 # from ppp.definitions.error import OdkformError
 
-TEMPLATE_ENV = None
-
-
-def set_template_env(template):
-    """Set template env"""
-    global TEMPLATE_ENV
-    TEMPLATE_ENV = get_template_env(template)
-
 
 class OdkTable:
     """Class to represent a single ODK table from an XLSForm.
@@ -65,19 +57,27 @@ class OdkTable:
     def set_header_and_contents(self, lang, **kwargs):
         """Set header and contents of table.
 
+        Rows of the prompts are formatted into new rows, rather than in
+        place, so that the table can be formatted more than once, e.g. for
+        debug data after rendering.
+
         Args:
             lang (str): The language.
             **kwargs: Keyword arguments
+
+        Returns:
+            list: Formatted rows of the header and contents, in order.
         """
         for i in self.data:
             i.row["in_group"] = True
-            i.row = self.format_row(prompt=i, lang=lang, **kwargs)
+        rows = [self.format_row(prompt=i, lang=lang, **kwargs) for i in self.data]
         self.header = self.data[0]
         self.contents = self.data[1:]
 
         # - De-list labels
-        for con in self.contents:
-            con.row["label"] = con.row["label"][0] if con.row["label"] else ""
+        for row in rows[1:]:
+            row["label"] = row["label"][0] if row["label"] else ""
+        return rows
 
     # Temporary noinspection until method is added.
     # noinspection PyUnusedLocal
@@ -126,30 +126,45 @@ class OdkTable:
         result = "ODK TABLE TEXT"  # Placeholder
         return result
 
-    def to_html(self, lang, **kwargs):
-        """Convert to html.
+    @profiled
+    def to_nodes(self, lang, **kwargs):
+        """Get the nodes to render the table with.
 
         Args:
             lang (place): The language.
-            highlighting (bool): Displays highlighted sub-sections if True.
             **kwargs: Keyword arguments.
 
         Returns:
-            str: A rendered html template.
+            list: A single node, a tuple of macro name and macro arguments.
         """
-        # - Render header
-        self.set_header_and_contents(lang, **kwargs)
+        # - Header
+        rows = self.set_header_and_contents(lang, **kwargs)
         table = list()
-        table.append(self.header.row)
+        table.append(rows[0])
 
-        # - Render body
-        for i in self.contents:
+        # - Body
+        for i, row in zip(self.contents, rows[1:]):
             if exclusion(item=i, settings=kwargs):
                 continue
 
-            table.append(i.row)
+            table.append(row)
+
+        return [("odk_table", {"table": table})]
 
-        # pylint: disable=no-member
-        return TEMPLATE_ENV.get_template("content/table/table.html").render(
-            table=table, lang=lang, **kwargs, settings=kwargs
+    def to_html(self, lang, **kwargs):
+        """Convert to html.
+
+        Args:
+            lang (place): The language.
+            highlighting (bool): Displays highlighted sub-sections if True.
+            **kwargs: Keyword arguments.
+
+        Returns:
+            str: A rendered html template.
+        """
+        return render_nodes(
+            render_env(kwargs.get("style")),
+            self.to_nodes(lang, **kwargs),
+            lang=lang,
+            **kwargs
         )
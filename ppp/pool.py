@@ -0,0 +1,296 @@
+"""Convert untrusted XLSForms in worker processes with limits.
+
+Classes
+- ConversionPool: Worker processes which run conversions with a wall-clock
+  timeout and a memory limit for each, and are recycled after n jobs.
+
+Functions
+- work: Loop of a worker process.
+"""
+import multiprocessing
+import os
+import time
+from multiprocessing.connection import wait
+
+try:
+    # noinspection PyUnresolvedReferences
+    import resource
+except ImportError:  # Not available on Windows, where memory is not limited.
+    resource = None
+
+from ppp.batch import convert_job
+from ppp.trace import ChromeTrace, conversion_tags
+
+
+def work(conn, memory_limit=None, max_jobs=None, trace=False):
+    """Run conversions received from a connection, until told to stop.
+
+    Modules needed for conversion are imported before the process reports
+    that it is ready, so that importing them does not count towards the
+    timeout or memory limit of its first job.
+
+    Args:
+        conn (Connection): Connection to receive jobs, as for convert_job(),
+            from, and to send their results to. None stops the loop.
+        memory_limit (int): Maximum bytes of address space of the process.
+        max_jobs (int): Number of jobs after which the process exits.
+        trace (bool): Trace the stages of each job, and send their events
+            with its result, as 'trace'.
+    """
+    import ppp.odkform  # noqa: F401  # pylint: disable=unused-import
+
+    if memory_limit and resource:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    conn.send("ready")
+    n_jobs = 0
+    while not max_jobs or n_jobs < max_jobs:
+        job = conn.recv()
+        if job is None:
+            break
+        if trace:
+            with ChromeTrace() as job_trace:
+                result = convert_job(job)
+            result["trace"] = job_trace.events
+        else:
+            result = convert_job(job)
+        conn.send(result)
+        n_jobs += 1
+    conn.close()
+
+
+class ConversionPool:
+    """Class to run conversions in worker processes, with limits.
+
+    Each conversion runs in a worker process. One which takes longer than
+    the timeout is stopped by killing its process. One which exceeds the
+    memory limit fails with a MemoryError in its process. In either case,
+    and if a process dies, the conversion gets a failure result, as from
+    convert_job(), and the process is replaced, so that other conversions
+    are not affected. Processes are also replaced after max_jobs jobs, to
+    release memory which a conversion left behind.
+
+    Attributes:
+        workers (int): Number of worker processes.
+        timeout (float): Seconds of wall-clock time a conversion may take.
+        memory_limit (int): Bytes of address space a worker process may
+            use. Only applies where the 'resource' module is available.
+        max_jobs (int): Number of jobs after which a worker process is
+            replaced.
+        processes (dict): Connections to idle worker processes mapped to
+            their process and number of jobs run.
+        trace (ChromeTrace): Trace to add a span of each job, in the worker
+            process it ran in, and of its stages to.
+    """
+
+    def __init__(
+        self, workers=1, timeout=None, memory_limit=None, max_jobs=None, trace=None
+    ):
+        """Initialize a pool. Processes are started as jobs need them.
+
+        Args:
+            workers (int): Number of worker processes.
+            timeout (float): Seconds of wall-clock time a conversion may take.
+                None for no limit.
+            memory_limit (int): Bytes of address space a worker process may
+                use. None for no limit.
+            max_jobs (int): Number of jobs after which a worker process is
+                replaced. None to keep processes while they are sound.
+            trace (ChromeTrace): Trace to add spans of jobs to, if any.
+        """
+        self.workers = workers
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.max_jobs = max_jobs
+        self.trace = trace
+        self.processes = {}
+
+    def __repr__(self):
+        """Print representation of instance."""
+        return "<ConversionPool (workers: {}, timeout: {}, memory_limit: {})>".format(
+            self.workers, self.timeout, self.memory_limit
+        )
+
+    def __enter__(self):
+        """Enter context."""
+        return self
+
+    def __exit__(self, *args):
+        """Stop worker processes on exiting context."""
+        self.close()
+
+    def _start(self):
+        """Start a worker process.
+
+        Returns:
+            Connection: Connection to the process.
+        """
+        conn, child_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(
+            target=work,
+            args=(child_conn, self.memory_limit, self.max_jobs, bool(self.trace)),
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        conn.recv()  # Ready.
+        self.processes[conn] = [process, 0]
+        return conn
+
+    def _stop(self, conn, kill=False):
+        """Stop a worker process.
+
+        Args:
+            conn (Connection): Connection to the process.
+            kill (bool): Kill the process, e.g. if it is busy, rather than
+                ask it to exit.
+        """
+        process = self.processes.pop(conn)[0]
+        if kill:
+            process.kill()
+        else:
+            try:
+                conn.send(None)
+            except OSError:  # Process already exited.
+                pass
+        process.join()
+        conn.close()
+
+    @staticmethod
+    def failure(job, error, message, seconds):
+        """Get the result of a conversion which did not finish.
+
+        Args:
+            job (dict): The conversion, as for convert_job().
+            error (str): Type of error, e.g. 'TimeoutError'.
+            message (str): Description of the error.
+            seconds (float): Seconds taken.
+
+        Returns:
+            dict: Result, as from convert_job().
+        """
+        return {
+            **job,
+            "out_file": None,
+            "ok": False,
+            "errors": [{"row": None, "name": "", "error": error, "message": message}],
+            "warnings": [],
+            "seconds": round(seconds, 3),
+        }
+
+    def _trace_job(self, job, result, process, started):
+        """Add the span of a job, and those of its stages, to the trace.
+
+        Args:
+            job (dict): The conversion, as for convert_job().
+            result (dict): Its result. Events of its stages are popped.
+            process (Process): Worker process it ran in.
+            started (float): Time it was sent, from time.monotonic().
+        """
+        events = result.pop("trace", [])
+        if self.trace is None:
+            return
+        self.trace.extend(events)
+        tags = conversion_tags(job["file"], job["language"], job["options"])
+        errors = [x["error"] for x in result["errors"]]
+        self.trace.add_span(
+            "job",
+            started,
+            time.monotonic() - started,
+            pid=process.pid,
+            ok=result["ok"],
+            errors=errors,
+            **tags
+        )
+
+    def map(self, jobs):
+        """Run conversions, each in a worker process.
+
+        Args:
+            jobs (list): Conversions, as for convert_job().
+
+        Returns:
+            list: Results of each conversion, in order, as from
+            convert_job().
+        """
+        results = [None] * len(jobs)
+        pending = list(enumerate(jobs))[::-1]
+        busy = {}  # Connections mapped to index of job and time started.
+        while pending or busy:
+            while pending and len(busy) < self.workers:
+                idle = [x for x in self.processes if x not in busy]
+                conn = idle[0] if idle else self._start()
+                index, job = pending.pop()
+                conn.send(job)
+                self.processes[conn][1] += 1
+                busy[conn] = (index, time.monotonic())
+            deadline = (
+                min(x[1] for x in busy.values()) + self.timeout
+                if self.timeout
+                else None
+            )
+            wait_time = max(0, deadline - time.monotonic()) if deadline else None
+            for conn in wait(list(busy), timeout=wait_time):
+                index, started = busy.pop(conn)
+                process = self.processes[conn][0]
+                try:
+                    results[index] = conn.recv()
+                except EOFError:  # Process died, e.g. killed for its memory.
+                    process.join()
+                    message = "Worker process exited with code {}.".format(
+                        process.exitcode
+                    )
+                    results[index] = self.failure(
+                        jobs[index],
+                        "WorkerError",
+                        message,
+                        time.monotonic() - started,
+                    )
+                    self._trace_job(jobs[index], results[index], process, started)
+                    self._stop(conn, kill=True)
+                    continue
+                self._trace_job(jobs[index], results[index], process, started)
+                errors = [x["error"] for x in results[index]["errors"]]
+                if "MemoryError" in errors or (
+                    self.max_jobs and self.processes[conn][1] >= self.max_jobs
+                ):
+                    self._stop(conn, kill="MemoryError" in errors)
+            now = time.monotonic()
+            for conn, (index, started) in list(busy.items()):
+                if self.timeout and now - started >= self.timeout:
+                    del busy[conn]
+                    process = self.processes[conn][0]
+                    self._stop(conn, kill=True)
+                    message = "Conversion took longer than {} seconds.".format(
+                        self.timeout
+                    )
+                    results[index] = self.failure(
+                        jobs[index], "TimeoutError", message, now - started
+                    )
+                    self._trace_job(jobs[index], results[index], process, started)
+        return results
+
+    def convert(self, in_file, language=None, outpath=None, **kwargs):
+        """Run a conversion in a worker process.
+
+        Args:
+            in_file (str): Path to load source file.
+            language (str or None): Language to render form.
+            outpath (str): Path of directory to save converted file to.
+                Defaults to the directory of the source file.
+            **kwargs: Options, as for convert_file().
+
+        Returns:
+            dict: Result, as from convert_job().
+        """
+        job = {
+            "file": in_file,
+            "language": language,
+            "outpath": outpath if outpath else os.path.dirname(in_file) + "/",
+            "options": {"format": "html", **kwargs},
+        }
+        return self.map([job])[0]
+
+    def close(self):
+        """Stop all worker processes."""
+        for conn in list(self.processes):
+            self._stop(conn)
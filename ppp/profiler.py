@@ -0,0 +1,292 @@
+"""Profile the render cost of each element of a form.
+
+The methods which prepare form components for rendering are decorated with
+profiled(). While a RenderProfiler is active in the current context, each
+call is timed, and the nodes each component is rendered with are rendered
+once more on their own, to time them. Otherwise, the decorated methods only
+check that no profiler is active.
+
+Classes
+- RenderProfiler: Render cost of each element of a form.
+
+Functions
+- profiled: Decorate a method of form components, to time it when profiling.
+"""
+import functools
+import time
+from contextvars import ContextVar
+from sys import stderr
+
+# Profiler of the renderings in the current context, if profiled.
+CURRENT_PROFILER = ContextVar("current_profiler", default=None)
+# Fields of profiler summaries with seconds taken, in order of report columns.
+TIME_FIELDS = ("self_seconds", "seconds", "dict_seconds", "render_seconds")
+
+
+def profiled(method):
+    """Decorate a method of form components, to time it when profiling.
+
+    Args:
+        method: The to_nodes() or to_dict() method of a component class.
+
+    Returns:
+        The decorated method.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, lang, **kwargs):
+        """Call the method, timing it if profiling."""
+        profiler = CURRENT_PROFILER.get()
+        if profiler is None:
+            return method(self, lang, **kwargs)
+        return profiler.call(method, self, lang, kwargs)
+
+    return wrapper
+
+
+class RenderProfiler:
+    """Class to profile the render cost of each element of a form.
+
+    The cost of an element is the time taken to prepare its nodes, as by
+    to_nodes(), including its to_dict() preprocessing, plus the time taken
+    to render them. The cost of groups, repeats and tables includes that of
+    their elements. Their own cost excludes it, so that the elements which
+    are responsible for a slow rendering come first. Headers of groups and
+    repeats count towards them.
+
+    Attributes:
+        path (str): Path of the source file of the form, to find the row
+            numbers of elements by their names.
+        elements (dict): Ids of components profiled mapped to records of
+            their 'kind', 'name', number of 'choices' and non-empty
+            'columns', and seconds taken.
+    """
+
+    def __init__(self, path=None):
+        """Initialize a profiler.
+
+        Args:
+            path (str): Path of the source file of the form.
+        """
+        self.path = path
+        self.elements = {}
+        self._stack = []
+        self._token = None
+        self._loaded = set()
+
+    def __repr__(self):
+        """Print representation of instance."""
+        return "<RenderProfiler '{}' (elements: {})>".format(
+            self.path, len(self.elements)
+        )
+
+    def __enter__(self):
+        """Start profiling renderings in the current context."""
+        self._token = CURRENT_PROFILER.set(self)
+        return self
+
+    def __exit__(self, *args):
+        """Stop profiling."""
+        CURRENT_PROFILER.reset(self._token)
+
+    @staticmethod
+    def is_header(component):
+        """Check if a component is the header of a group or repeat.
+
+        Args:
+            component: A form component.
+
+        Returns:
+            bool: True if so.
+        """
+        row = getattr(component, "row", None) or {}
+        return bool(row.get("is_group_header") or row.get("is_repeat_header"))
+
+    def record(self, component):
+        """Get the record of a component, added on first call.
+
+        Args:
+            component: A form component.
+
+        Returns:
+            dict: The record.
+        """
+        key = id(component)
+        if key not in self.elements:
+            data = getattr(component, "data", None)
+            row = component.row if component.row else data[0].row
+            choices = getattr(component, "choices", None)
+            self.elements[key] = {
+                "kind": type(component).__name__,
+                "name": row.get("name", ""),
+                "choices": len(choices.data) if choices else 0,
+                "columns": sum(1 for x in row.values() if x),
+                "parent": None,
+                "seconds": 0.0,
+                "dict_seconds": 0.0,
+                "render_seconds": 0.0,
+            }
+        return self.elements[key]
+
+    def call(self, method, component, lang, kwargs):
+        """Call a method of a component, timing it.
+
+        Args:
+            method: The to_nodes() or to_dict() method.
+            component: The component.
+            lang (str): The language.
+            kwargs (dict): Options.
+
+        Returns:
+            The return of the method.
+        """
+        if self.is_header(component):
+            return method(component, lang, **kwargs)
+        record = self.record(component)
+        key = id(component)
+        own = [x for x in self._stack if x[0] == key]
+        parents = [x[0] for x in self._stack if x[0] != key]
+        if parents and record["parent"] is None:
+            record["parent"] = parents[-1]
+        # The component, and seconds spent in timing renders of its elements,
+        # which do not count towards it.
+        frame = [key, 0.0]
+        self._stack.append(frame)
+        start = time.perf_counter()
+        try:
+            result = method(component, lang, **kwargs)
+        finally:
+            self._stack.pop()
+        seconds = time.perf_counter() - start - frame[1]
+        overhead = frame[1]
+        if method.__name__ == "to_dict":
+            record["dict_seconds"] += seconds
+        if not own:  # Else timed by the outer call.
+            record["seconds"] += seconds
+        if method.__name__ == "to_nodes":
+            render_seconds, timing_seconds = self.time_render(result, lang, kwargs)
+            record["render_seconds"] += render_seconds
+            record["seconds"] += render_seconds
+            overhead += timing_seconds
+        if self._stack:
+            self._stack[-1][1] += overhead
+        return result
+
+    def time_render(self, nodes, lang, kwargs):
+        """Time rendering nodes, as the form renders them.
+
+        Templates are loaded before the first rendering is timed, so that
+        the element which is rendered first does not seem to be slow.
+
+        Args:
+            nodes (list): Nodes, as from to_nodes().
+            lang (str): The language.
+            kwargs (dict): Options.
+
+        Returns:
+            tuple: Seconds taken to render, and in all, including loading
+            templates.
+        """
+        from ppp.config import render_env, render_nodes
+        from ppp.definitions.constants import NODE_TEMPLATES
+        from ppp.odkprompt import OdkPrompt
+
+        start = time.perf_counter()
+        env = render_env(kwargs.get("style"))
+        if env not in self._loaded:
+            for name in {*NODE_TEMPLATES.values(), "document.html", "macros.html"}:
+                env.get_template(name)
+            self._loaded.add(env)
+        settings = OdkPrompt.html_options(lang=lang, **kwargs)
+        loaded = time.perf_counter()
+        render_nodes(env, nodes, **settings)
+        end = time.perf_counter()
+        return end - loaded, end - start
+
+    def row_numbers(self):
+        """Get the row numbers of the named rows of the form.
+
+        Returns:
+            dict: Names mapped to the row number of their first row in the
+            'survey' worksheet, with the header as row 1.
+        """
+        if not self.path:
+            return {}
+        from pmix import Xlsform
+        from ppp.odkform import OdkForm
+
+        numbers = {}
+        for index, row in enumerate(OdkForm.read_raw_survey(Xlsform(self.path))):
+            if row.get("name"):
+                numbers.setdefault(row["name"], index + 2)
+        return numbers
+
+    def summary(self, top=None):
+        """Get the elements of the form, most costly first.
+
+        Args:
+            top (int): Number of elements to get. All if None.
+
+        Returns:
+            list: Records of elements, with their 'row' number, 'seconds'
+            taken including their elements, 'self_seconds' excluding them,
+            'dict_seconds' in to_dict(), and 'render_seconds' in rendering.
+        """
+        children = {}
+        for key, record in self.elements.items():
+            children.setdefault(record["parent"], []).append(key)
+        rows = self.row_numbers()
+        records = []
+        for key, record in self.elements.items():
+            nested = sum(self.elements[x]["seconds"] for x in children.get(key, []))
+            records.append(
+                {
+                    "kind": record["kind"],
+                    "name": record["name"],
+                    "row": rows.get(record["name"]),
+                    "choices": record["choices"],
+                    "columns": record["columns"],
+                    "self_seconds": round(max(record["seconds"] - nested, 0), 6),
+                    "seconds": round(record["seconds"], 6),
+                    "dict_seconds": round(record["dict_seconds"], 6),
+                    "render_seconds": round(record["render_seconds"], 6),
+                }
+            )
+        records.sort(key=lambda x: x["self_seconds"], reverse=True)
+        return records[:top] if top else records
+
+    def report(self, top=20, file=stderr):
+        """Print the most costly elements of the form as a table.
+
+        Args:
+            top (int): Number of elements to print.
+            file (file): Stream to print to.
+        """
+        line = "{:>9} {:>9} {:>9} {:>9}  {:<11} {:>5} {:>7} {:>7}  {}"
+        print("Slowest elements of {}:".format(self.path), file=file)
+        print(
+            line.format(
+                "self (ms)",
+                "total",
+                "to_dict",
+                "render",
+                "kind",
+                "row",
+                "choices",
+                "columns",
+                "name",
+            ),
+            file=file,
+        )
+        for record in self.summary(top):
+            print(
+                line.format(
+                    *("{:.2f}".format(record[x] * 1000) for x in TIME_FIELDS),
+                    record["kind"],
+                    record["row"] if record["row"] else "",
+                    record["choices"],
+                    record["columns"],
+                    record["name"],
+                ),
+                file=file,
+            )
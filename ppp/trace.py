@@ -0,0 +1,197 @@
+"""Trace conversions as Chrome trace events, to inspect them in a viewer.
+
+A ChromeTrace records a span for each stage of the conversions run in the
+context it is active in, as marked with stage(), tagged with the details of
+the stages it is nested in, e.g. the form, language, format and template of
+the conversion. Spans of worker processes are recorded by running work in
+them with traced(), and adding the events it returns to the trace of the
+parent process. Traces are written in the Trace Event Format, which trace
+viewers such as Perfetto and chrome://tracing read.
+
+Classes
+- ChromeTrace: Spans of the stages of conversions, as trace events.
+
+Functions
+- active_trace: Get the trace active in the current context.
+- traced: Call a function in a trace of its own, e.g. in a worker process.
+- conversion_tags: Get the details of a conversion to tag its spans with.
+"""
+import json
+import os
+import threading
+import time
+
+from ppp.metrics import STAGE_OBSERVERS, StageObserver, stage
+
+
+def active_trace():
+    """Get the trace active in the current context, if any.
+
+    Returns:
+        ChromeTrace: The innermost active trace, or None.
+    """
+    for observer in reversed(STAGE_OBSERVERS.get()):
+        if isinstance(observer, ChromeTrace):
+            return observer
+    return None
+
+
+def traced(name, tags, func, *args):
+    """Call a function in a trace of its own, as a stage.
+
+    Module-level, so that it can be run in a worker process.
+
+    Args:
+        name (str): Name of the stage.
+        tags (dict): Details of the stage.
+        func: The function.
+        *args: Its arguments.
+
+    Returns:
+        tuple: The return of the function, and the events of the trace.
+    """
+    with ChromeTrace() as trace:
+        with stage(name, **tags):
+            result = func(*args)
+    return result, trace.events
+
+
+def conversion_tags(in_file, language, options):
+    """Get the details of a conversion to tag its spans with.
+
+    Args:
+        in_file (str): Path of source file.
+        language (str or None): Language to render form.
+        options (dict): Options, as for convert_file().
+
+    Returns:
+        dict: The 'form', 'language', 'format' and 'template'.
+    """
+    return {
+        "form": os.path.basename(in_file),
+        "language": language,
+        "format": options.get("format") or "html",
+        "template": options.get("template") or "standard",
+    }
+
+
+class ChromeTrace(StageObserver):
+    """Class to trace the stages of conversions as Chrome trace events.
+
+    Spans are complete ('X') events, timed in microseconds of the monotonic
+    clock, which processes of the same machine share, with the process and
+    thread they ran in. Their args are their tags, and those of the stages
+    they are nested in.
+
+    Attributes:
+        events (list): Trace events recorded or added.
+    """
+
+    def __init__(self):
+        """Initialize a trace."""
+        self.events = []
+        self._stacks = {}
+
+    def __repr__(self):
+        """Print representation of instance."""
+        return "<ChromeTrace (events: {})>".format(len(self.events))
+
+    def _stack(self):
+        """Get the stages open in the current thread.
+
+        Returns:
+            list: Start times and tags of the stages, innermost last.
+        """
+        return self._stacks.setdefault(threading.get_ident(), [])
+
+    def tags(self):
+        """Get the tags of the stages open in the current thread.
+
+        Returns:
+            dict: Tags of the stages, those of inner stages overriding them.
+        """
+        stack = self._stack()
+        return dict(stack[-1][1]) if stack else {}
+
+    def start_stage(self, name, tags):
+        """Record the start of a stage.
+
+        Args:
+            name (str): Name of the stage.
+            tags (dict): Details of the stage.
+        """
+        self._stack().append((time.monotonic(), {**self.tags(), **tags}))
+
+    def end_stage(self, name, seconds, self_seconds, tags):
+        """Record the span of a stage.
+
+        Args:
+            name (str): Name of the stage.
+            seconds (float): Seconds spent in the stage.
+            self_seconds (float): Seconds spent in the stage, but not in
+                stages nested in it.
+            tags (dict): Details of the stage.
+        """
+        start, span_tags = self._stack().pop()
+        self.add_span(name, start, seconds, **span_tags)
+
+    def add_span(self, name, start, seconds, pid=None, **tags):
+        """Record a span.
+
+        Args:
+            name (str): Name of the span.
+            start (float): Time the span started, from time.monotonic().
+            seconds (float): Seconds the span took.
+            pid (int): Process of the span, e.g. a worker process, on the
+                row of its main thread. Defaults to the current thread.
+            **tags: Details of the span.
+        """
+        self.events.append(
+            {
+                "name": name,
+                "cat": "ppp",
+                "ph": "X",
+                "ts": round(start * 1e6, 3),
+                "dur": round(seconds * 1e6, 3),
+                "pid": pid if pid is not None else os.getpid(),
+                "tid": threading.get_native_id() if pid is None else pid,
+                "args": tags,
+            }
+        )
+
+    def extend(self, events):
+        """Add events, e.g. recorded in a worker process by traced().
+
+        Args:
+            events (list): Trace events.
+        """
+        self.events.extend(events)
+
+    def to_dict(self):
+        """Get the trace in the Trace Event Format.
+
+        Returns:
+            dict: 'traceEvents', in order of time, after a metadata event
+            naming each process.
+        """
+        pids = sorted({x["pid"] for x in self.events} | {os.getpid()})
+        names = [
+            {
+                "name": "process_name",
+                "ph": "M",
+                "pid": pid,
+                "args": {"name": "ppp" if pid == os.getpid() else "ppp worker"},
+            }
+            for pid in pids
+        ]
+        events = sorted(self.events, key=lambda x: (x["ts"], -x["dur"]))
+        return {"traceEvents": names + events, "displayTimeUnit": "ms"}
+
+    def write(self, path):
+        """Write the trace to a JSON file.
+
+        Args:
+            path (str): Path of file.
+        """
+        with open(path, mode="w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file)
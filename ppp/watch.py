@@ -0,0 +1,219 @@
+"""Watch XLSForms and re-render their conversions whenever they are saved.
+
+Classes
+- FormWatcher: Render state of a single XLSForm kept between conversions.
+
+Functions
+- watch: Poll n files and re-render n option combinations on change.
+"""
+import difflib
+import hashlib
+import os
+import time
+from sys import stderr
+
+from pmix import Xlsform
+
+from ppp import enumerate_combos, get_debug_file, get_out_file, write_out_file
+from ppp.definitions.constants import ALL_LANGUAGES_TOKEN
+from ppp.odkdiagnostics import OdkDiagnostics
+from ppp.odkform import OdkForm
+from ppp.odklanguageindex import OdkLanguageIndex
+
+
+class FormWatcher:
+    """Class to keep the render state of an XLSForm between conversions.
+
+    Workbooks can only be read whole, so on every save the workbook is read
+    and its survey rows converted again, which is cheap. Rendering is not, so
+    rendered top-level components are kept per combination of options, keyed
+    by content hash, and only components whose rows, choices, or numbering
+    changed are rendered again.
+
+    Attributes:
+        path (str): Path to source XLSForm.
+        languages (list): Languages to render form. If ALL_LANGUAGES_TOKEN
+            is among them, the form is rendered in every language it has.
+        outpath (str): Path to save converted files.
+        combos (list): Keyword-arg combinations, as from enumerate_combos().
+        stat (tuple): Modification time and size of file when last read.
+        row_hashes (dict): Worksheet names mapped to content hashes of their
+            rows when last converted.
+        fragment_caches (dict): Rendered components for each combination of
+            language and options.
+    """
+
+    worksheets = ("survey", "choices", "external_choices", "settings")
+
+    def __init__(self, path, languages=(None,), outpath=None, combos=({},)):
+        """Initialize a watcher. Nothing is read until update() is called.
+
+        Args:
+            path (str): Path to source XLSForm.
+            languages (list): Languages to render form.
+            outpath (str): Path to save converted files. Defaults to the
+                directory of the source file.
+            combos (list): Keyword-arg combinations of other options.
+        """
+        self.path = path
+        self.languages = list(languages)
+        self.outpath = (
+            outpath if outpath else os.path.join(os.path.dirname(path) or ".", "")
+        )
+        self.combos = list(combos)
+        self.stat = None
+        self.row_hashes = {}
+        self.fragment_caches = {}
+
+    def __repr__(self):
+        """Print representation of instance."""
+        return "<FormWatcher '{}'>".format(self.path)
+
+    def modified(self):
+        """Check if the source file was saved since it was last read.
+
+        Returns:
+            bool: True if modification time or size differs, else False.
+        """
+        try:
+            stat = os.stat(self.path)
+        except OSError:  # Mid-save, some editors replace the file.
+            return False
+        return (stat.st_mtime_ns, stat.st_size) != self.stat
+
+    @staticmethod
+    def hash_rows(wb, worksheets):
+        """Get content hashes of the rows of worksheets.
+
+        Args:
+            wb (Xlsform): A Xlsform object representing ODK form.
+            worksheets (tuple): Names of worksheets to hash.
+
+        Returns:
+            dict: Worksheet names mapped to lists of hex digests.
+        """
+        hashes = {}
+        for ws in worksheets:
+            try:
+                rows = wb[ws]
+            except KeyError:  # Worksheet does not exist.
+                continue
+            hashes[ws] = [
+                hashlib.sha1(repr([str(x) for x in row]).encode("utf-8")).hexdigest()
+                for row in rows
+            ]
+        return hashes
+
+    @staticmethod
+    def count_changed_rows(old, new):
+        """Count rows added, changed, moved, or removed between two readings.
+
+        Rows are compared in order, so that moved rows, and added or removed
+        duplicate rows, count as changed too.
+
+        Args:
+            old (dict): Row hashes, as from hash_rows().
+            new (dict): Row hashes, as from hash_rows().
+
+        Returns:
+            int: Number of rows which differ between the readings.
+        """
+        changed = 0
+        for ws in set(old) | set(new):
+            before, after = old.get(ws, []), new.get(ws, [])
+            if before == after:
+                continue
+            matcher = difflib.SequenceMatcher(None, before, after, autojunk=False)
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+                if tag != "equal":
+                    changed += max(i2 - i1, j2 - j1)
+        return changed
+
+    def update(self):
+        """Read the source file and re-render what changed.
+
+        Rows are only remembered as read once every file is written, so
+        that, if any fails, all are written again on the next call.
+
+        Returns:
+            list: Paths of files written. Empty if no rows changed.
+        """
+        stat = os.stat(self.path)
+        wb = Xlsform(self.path)
+        self.stat = (stat.st_mtime_ns, stat.st_size)
+        row_hashes = self.hash_rows(wb, self.worksheets)
+        n_changed = self.count_changed_rows(self.row_hashes, row_hashes)
+        if not n_changed:
+            return []
+
+        languages = self.languages
+        if ALL_LANGUAGES_TOKEN in languages:
+            languages = OdkLanguageIndex.survey_languages(wb) or [None]
+        written = []
+        diagnostics = OdkDiagnostics()
+        for language in languages:
+            for combo in self.combos:
+                start = time.perf_counter()
+                cache = self.fragment_caches.setdefault(
+                    repr((language, sorted(combo.items()))), {}
+                )
+                previous = set(cache)
+                # Rendering alters components, so each combo gets a new form.
+                form = OdkForm(wb, diagnostics, combo.get("debug", False))
+                output = form.to_html(lang=language, fragment_cache=cache, **combo)
+                out_file = get_out_file(self.path, language, self.outpath, **combo)
+                write_out_file(out_file, [output])
+                written.append(out_file)
+                if combo.get("debug") == "sidecar":
+                    debug_file = get_debug_file(out_file)
+                    write_out_file(debug_file, form.iter_json(language, **combo))
+                    written.append(debug_file)
+                print(
+                    "{} ({} rows changed, {} of {} components rendered, "
+                    "{:.2f}s)".format(
+                        out_file,
+                        n_changed,
+                        len(set(cache) - previous),
+                        len(cache),
+                        time.perf_counter() - start,
+                    )
+                )
+        diagnostics.emit()
+        # Only once all are written, so that a failed render is retried.
+        self.row_hashes = row_hashes
+        return written
+
+
+def watch(files, languages=[None], outpath=None, interval=1.0, **kwargs):
+    """Convert files and convert again whenever any of them are saved.
+
+    Runs until interrupted. Errors, e.g. from reading a file which is being
+    saved, are printed and the file is read again on its next change.
+
+    Args:
+        files (list): Paths to load source files.
+        languages (list): Languages to render forms.
+        outpath (str): Path of file name to save converted file if 1 file,
+            else path to directory for multiple files, in which case file names
+            will be automatically generated.
+        interval (float): Seconds between checks for changes.
+        **kwargs: Options, as for run(). Only 'html' and 'doc' formats are
+            supported.
+    """
+    combos = enumerate_combos(kwargs)
+    watchers = [FormWatcher(x, languages, outpath, combos) for x in files]
+    print("Watching {} file(s). Press Ctrl+C to stop.".format(len(watchers)))
+    try:
+        while True:
+            for watcher in watchers:
+                if not watcher.modified():
+                    continue
+                try:
+                    watcher.update()
+                # pylint: disable=broad-except
+                except Exception as err:
+                    msg = "An error occurred while attempting to convert '{}':\n{}"
+                    print(msg.format(watcher.path, err), file=stderr)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
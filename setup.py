@@ -57,7 +57,7 @@ setup(
         'ppp': get_pkg_data(
             pkg_name='ppp',
             data_dirs=['templates'],
-            extensions=['html', 'css'])
+            extensions=['html', 'css', 'png'])
     },
     license='LICENSE.txt',
     description='Converts XlsForms into readable formats.',
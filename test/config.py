@@ -5,3 +5,4 @@ import os
 TEST_PACKAGES = ["ppp", "test"]
 TEST_DIR = os.path.dirname(os.path.realpath(__file__)) + "/"
 TEST_STATIC_DIR = TEST_DIR + "static/"
+TEST_PERFORMANCE_BASELINE = TEST_STATIC_DIR + "performance_baseline.json"
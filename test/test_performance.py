@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Performance regression tests for PPP package.
+
+Forms are converted through the public API, and the time spent in each
+stage of their conversion, and their peak memory, are checked against
+budgets relative to a stored baseline. Times are scaled by the speed of the
+machine, as measured by a fixed workload, relative to that of the machine
+the baseline was measured on.
+
+They are slow, and depend on the load of the machine, so they are skipped
+unless PPP_PERF is set, e.g. by 'make test-performance'.
+
+Environment variables:
+- PPP_PERF: If set, the tests are run, else skipped.
+- PPP_PERF_TIME_FACTOR: Times may take this many times their baseline.
+  Defaults to 2.
+- PPP_PERF_MEMORY_FACTOR: Peak memory may be this many times its baseline.
+  Defaults to 1.5.
+- PPP_PERF_UPDATE_BASELINE: If set, the measurements are written as the
+  baseline, rather than checked against it.
+"""
+import contextlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import unittest
+
+from ppp import convert_file
+from ppp.memprofile import MemoryProfiler
+from ppp.metrics import ConversionMetrics
+from test.config import TEST_PERFORMANCE_BASELINE, TEST_STATIC_DIR
+
+TIME_FACTOR = float(os.environ.get("PPP_PERF_TIME_FACTOR", 2))
+MEMORY_FACTOR = float(os.environ.get("PPP_PERF_MEMORY_FACTOR", 1.5))
+UPDATE_BASELINE = bool(os.environ.get("PPP_PERF_UPDATE_BASELINE"))
+# Seconds added to the budget of each stage, so that the shortest stages do
+# not fail on noise.
+TIME_SLACK = 0.05
+# Number of times each form is converted, to time its fastest conversion.
+REPEATS = 2
+# Number of copies of the survey of FQ.xlsx in the generated large form.
+LARGE_FORM_COPIES = 4
+
+
+def calibrate():
+    """Time a fixed workload, to scale times by the speed of the machine.
+
+    Returns:
+        float: Seconds of the fastest of 3 runs of the workload.
+    """
+    runs = []
+    for _ in range(3):
+        start = time.perf_counter()
+        sorted(str(x) for x in range(300000))
+        runs.append(time.perf_counter() - start)
+    return min(runs)
+
+
+def write_large_form(path, copies=LARGE_FORM_COPIES):
+    """Write a large form, of the survey of FQ.xlsx repeated.
+
+    Names of each copy, and references to them, are suffixed with the number
+    of the copy, so that names stay unique.
+
+    Args:
+        path (str): Path of file to write.
+        copies (int): Number of copies of the survey.
+    """
+    from pmix import Xlsform
+    import xlsxwriter
+
+    wb = Xlsform(TEST_STATIC_DIR + "FQ.xlsx")
+    book = xlsxwriter.Workbook(path)
+    for ws in wb.data:
+        rows = [[x.value for x in row] for row in ws.data]
+        if ws.name == "survey":
+            header, body = rows[0], rows[1:]
+            name = header.index("name")
+            rows = [header] + body
+            for copy in range(1, copies):
+                suffix = "_" + str(copy)
+                for row in body:
+                    row = [
+                        re.sub(r"\$\{(\w+)\}", r"${\1" + suffix + "}", x)
+                        if isinstance(x, str)
+                        else x
+                        for x in row
+                    ]
+                    if row[name]:
+                        row[name] += suffix
+                    rows.append(row)
+        sheet = book.add_worksheet(ws.name)
+        for i, row in enumerate(rows):
+            for j, value in enumerate(row):
+                if value not in (None, ""):
+                    sheet.write(i, j, value)
+    book.close()
+
+
+def measure(path):
+    """Convert a form, timing its stages and profiling its memory.
+
+    The form is converted REPEATS times to time it, and once more to
+    profile its memory, as tracing allocations slows conversions down.
+
+    Args:
+        path (str): Path of source file.
+
+    Returns:
+        dict: 'seconds' taken and 'stages' mapped to seconds spent in them,
+        of the fastest conversion, and 'peak' bytes of memory.
+    """
+    out_dir = tempfile.mkdtemp()
+    quiet = io.StringIO()
+    runs = []
+    try:
+        with contextlib.redirect_stdout(quiet), contextlib.redirect_stderr(quiet):
+            for _ in range(REPEATS):
+                with ConversionMetrics() as metrics:
+                    convert_file(path, None, out_dir + "/", format="html")
+                runs.append(metrics)
+            with MemoryProfiler(top=0) as profiler:
+                convert_file(path, None, out_dir + "/", format="html")
+    finally:
+        shutil.rmtree(out_dir)
+    return {
+        "seconds": round(min(x.seconds for x in runs), 4),
+        "stages": {
+            name: round(min(x.stages.get(name, 0.0) for x in runs), 4)
+            for name in runs[0].stages
+        },
+        "peak": profiler.peak,
+    }
+
+
+@unittest.skipUnless(os.environ.get("PPP_PERF"), "PPP_PERF is not set.")
+class PerformanceTest(unittest.TestCase):
+    """Test that conversions stay within their time and memory budgets."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Measure the speed of the machine, and write the large form."""
+        cls.calibration = calibrate()
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.large_form = cls.tmp_dir + "/large.xlsx"
+        write_large_form(cls.large_form)
+        with open(TEST_PERFORMANCE_BASELINE, encoding="utf-8") as file:
+            cls.baseline = json.load(file)
+        cls.measurements = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        """Remove the large form, and update the baseline, if requested."""
+        shutil.rmtree(cls.tmp_dir)
+        if UPDATE_BASELINE:
+            baseline = {
+                "calibration_seconds": round(cls.calibration, 4),
+                "forms": {**cls.baseline["forms"], **cls.measurements},
+            }
+            with open(TEST_PERFORMANCE_BASELINE, "w", encoding="utf-8") as file:
+                json.dump(baseline, file, indent=2, sort_keys=True)
+                file.write("\n")
+
+    def check(self, name, path):
+        """Check the conversion of a form against its baseline.
+
+        Args:
+            name (str): Name of the form in the baseline.
+            path (str): Path of source file.
+        """
+        measured = measure(path)
+        self.measurements[name] = measured
+        if UPDATE_BASELINE:
+            return
+        baseline = self.baseline["forms"][name]
+        scale = self.calibration / self.baseline["calibration_seconds"]
+        times = {"total": (measured["seconds"], baseline["seconds"])}
+        for stage, seconds in baseline["stages"].items():
+            times[stage] = (measured["stages"].get(stage, 0.0), seconds)
+        for stage, (seconds, baseline_seconds) in times.items():
+            budget = baseline_seconds * scale * TIME_FACTOR + TIME_SLACK
+            with self.subTest(stage=stage):
+                self.assertLessEqual(
+                    seconds,
+                    budget,
+                    "Stage '{}' of {} took {:.3f}s, over its budget of "
+                    "{:.3f}s.".format(stage, name, seconds, budget),
+                )
+        budget = baseline["peak"] * MEMORY_FACTOR
+        self.assertLessEqual(
+            measured["peak"],
+            budget,
+            "Peak memory of {} was {} bytes, over its budget of {:.0f} "
+            "bytes.".format(name, measured["peak"], budget),
+        )
+
+    def test_fq(self):
+        """Test the conversion of FQ.xlsx."""
+        self.check("FQ.xlsx", TEST_STATIC_DIR + "FQ.xlsx")
+
+    def test_hq(self):
+        """Test the conversion of HQ.xlsx."""
+        self.check("HQ.xlsx", TEST_STATIC_DIR + "HQ.xlsx")
+
+    def test_large(self):
+        """Test the conversion of a large generated form."""
+        self.check("large", self.large_form)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,14 +1,36 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """Unit tests for PPP package."""
+import contextlib
+import hashlib
+import io
+import json
 import os
+import shutil
 import subprocess
+import tempfile
+import time
+import tracemalloc
 import unittest
+import zipfile
 from glob import glob
 
+from ppp import convert_file, run
+from ppp.definitions.constants import (
+    ALL_LANGUAGES_TOKEN,
+    ARCHIVE_MANIFEST_NAME,
+    COMPRESSION_FORMATS,
+    RENDER_BACKENDS,
+    SUPPORTED_FORMATS,
+)
+from ppp.definitions.error import InvalidLanguageException, OdkFormError
+from ppp.definitions.utils import compact_html
+from ppp.odkdependencygraph import OdkDependencyGraph
+from ppp.odkdiagnostics import OdkDiagnostics
 from ppp.odkform import OdkForm, set_template_env
 from ppp.odkprompt import OdkPrompt
 from ppp.odkgroup import OdkGroup
+from ppp.watch import FormWatcher
 from test.config import TEST_STATIC_DIR, TEST_PACKAGES
 from test.utils import get_args, get_test_suite
 
@@ -29,6 +51,12 @@ class MockForm(OdkForm):
         super().__init__(form)
 
 
+class MockWorkbook(dict):
+    """Mock object of Xlsform, of worksheet names mapped to lists of rows."""
+
+    form_language = None
+
+
 # # Unit Tests
 # pylint: disable=too-few-public-methods
 # - PyLint check not apply? - http://pylint-messages.wikidot.com/messages:r0903
@@ -262,6 +290,49 @@ class OdkPromptTest(PppTest):
             )
             self.assertTrue(question_number == v, msg=msg)
 
+    def test_question_number_warnings_once_per_form(self):
+        """Test that question numbers are extracted once, and warned of once."""
+        src = TEST_STATIC_DIR + "NoSpaceAfterPeriodWarning/input/1.xlsx"
+        diagnostics = OdkDiagnostics()
+        set_template_env("default")
+        for _ in range(2):
+            form = OdkForm.from_file(src, diagnostics)
+            html = form.to_html("English", format="html", template="standard")
+        warning = "Question number 202b does not have a space after '.'"
+        self.assertIn(warning, form.warnings)
+        self.assertEqual(diagnostics.records[warning]["rows"], [84])
+        self.assertIn(json.dumps(warning), html)
+        stream = io.StringIO()
+        diagnostics.emit(stream)
+        diagnostics.emit(stream)
+        self.assertEqual(stream.getvalue().count(warning + " (row 84)"), 1)
+        components = OdkForm.iter_components(form.questionnaire)
+        prompts = [x for x in components if isinstance(x, OdkPrompt)]
+        self.assertIn("202b", [x.question_number("English") for x in prompts])
+
+    def test_question_number_fallback(self):
+        """Test question numbers of labels without one in the language.
+
+        As before question numbers were extracted once, the number of the
+        default label, else of the English one, is used, as numbered.
+        """
+        row = {
+            "type": "text",
+            "simple_type": "text",
+            "name": "q1",
+            "label::English": "101. How old are you?",
+            "label::Français": "Quel âge avez-vous?",
+            "label::Español": "102. ¿Cuántos años tiene?",
+        }
+        prompt = OdkPrompt(row)
+        self.assertEqual(prompt.question_number("Español"), "102")
+        self.assertEqual(prompt.question_number("Français"), "101")
+        self.assertEqual(prompt.question_number(None), "101")
+        OdkForm._add_question_iter_nums([prompt])
+        self.assertEqual(prompt.row["question_number"], "101")
+        rendered = prompt.to_dict("Français", template="standard")
+        self.assertEqual(rendered["question_number"], "101")
+
 
 class OdkGroupTest(unittest.TestCase):
     """Unit tests for the OdkGroup class."""
@@ -410,6 +481,127 @@ class OdkFormTest(PppTest):
         )
         self.assertTrue(expected == actual, msg)
 
+    def test_dependency_graph(self):
+        """Test variable dependencies found in logic fields, both ways."""
+        form = OdkForm.from_file(TEST_STATIC_DIR + "NamesToQnums/input/1.xlsx")
+        graph = form.dependency_graph
+
+        # - Calculate, context group relevant, and field-list group relevant
+        self.assertEqual(graph.depends_on("unlinked"), ["level1"])
+        self.assertIn("empty_warn_grp", graph.dependents_of("unlinked"))
+        self.assertEqual(
+            graph.depends_on("today"),
+            ["system_date_check", "system_date", "manual_date"],
+        )
+        self.assertEqual(
+            graph.dependencies["witness_manual"]["name_typed"], ["constraint"]
+        )
+        # - Transitive
+        self.assertIn("today", graph.affected_by(["system_date"]))
+        self.assertIn('"today" -> "system_date"', graph.to_dot())
+
+    def test_undefined_references(self):
+        """Test references to variables not defined in the form."""
+        graph = OdkDependencyGraph()
+        graph.add_row({"type": "integer", "name": "age"})
+        graph.add_row(
+            {"type": "text", "name": "q1", "relevant": "${age} > ${min_age}"}
+        )
+        graph.add_row(
+            {"type": "note", "name": "q2", "constraint": "${min_age} < ${start}"}
+        )
+        graph.add_row({"type": "end group", "name": "", "relevant": "${gone}"})
+        self.assertEqual(graph.undefined_references(), {"min_age": ["q1", "q2"]})
+
+    def test_check(self):
+        """Test that all structural errors are collected, with row numbers."""
+        wb = MockWorkbook(
+            survey=[
+                ["type", "name", "label", "appearance"],
+                ["begin group", "grp", "Group", "field-list"],
+                ["select_one yes_no", "q1", "Q1", ""],
+                ["select_one missing", "q2", "Q2", ""],
+                ["end repeat", "", "", ""],
+                ["end group", "", "", ""],
+                ["select_one yes_no", "q3", "Q3", "label"],
+                ["begin repeat", "rpt", "Repeat", ""],
+            ],
+            choices=[
+                ["list_name", "name", "label"],
+                ["yes_no", "yes", "Yes"],
+                ["yes_no", "no", "No"],
+            ],
+        )
+        errors = OdkForm.check(wb)
+        self.assertEqual(
+            [(x["row"], x["name"], x["error"]) for x in errors],
+            [
+                (4, "q2", "OdkFormError"),
+                (5, "", "OdkFormError"),
+                (7, "q3", "OdkFormError"),
+                (None, "rpt", "OdkFormError"),
+            ],
+        )
+        languages = OdkForm.check(wb, languages=["English"])[4:]
+        self.assertEqual(
+            [x["error"] for x in languages], ["InvalidLanguageException"] * 2
+        )
+
+    def test_check_malformed(self):
+        """Test that malformed rows and worksheets are reported, not raised."""
+        wb = MockWorkbook(
+            survey=[
+                ["type", "label"],
+                ["select_one", "Q1"],
+                ["text", "Q2"],
+            ],
+            choices=[["list_name", "name", "label"]],
+        )
+        errors = OdkForm.check(wb)
+        self.assertEqual(
+            [(x["row"], x["error"]) for x in errors],
+            [(2, "OdkFormError"), (3, "KeyError")],
+        )
+        self.assertEqual(
+            errors[0]["message"], "Select type 'select_one' has no list name."
+        )
+        wb["survey"] = [["name", "label"], ["q1", "Q1"]]
+        errors = OdkForm.check(wb)
+        self.assertEqual(
+            [(x["row"], x["error"]) for x in errors], [(None, "OdkFormError")]
+        )
+        with self.assertRaises(OdkFormError):
+            OdkForm.convert_survey(wb, {}, {})
+
+    def test_language_index(self):
+        """Test languages and translation completeness found on load."""
+        rel_file_path = (
+            "multiple_file_language_option_conversion/BFR5-Selection-v2-jef.xlsx"
+        )
+        form = OdkForm.from_file(TEST_STATIC_DIR + rel_file_path)
+        index = form.language_index
+        self.assertEqual(index.languages, ["English", "Français"])
+        self.assertEqual(index.parse_column("label:Français"), ("label", "Français"))
+        self.assertEqual(
+            index.parse_column("media::image::English"), ("media::image", "English")
+        )
+        self.assertEqual(index.parse_column("name"), None)
+        self.assertEqual(index.completeness("English")["survey"]["label"], [27, 46])
+        index.validate("Français")
+        index.validate(None)
+        with self.assertRaises(InvalidLanguageException):
+            index.validate("Klingon")
+
+    def test_raw_survey(self):
+        """Test that the workbook is released, and read again for debug data."""
+        path = TEST_STATIC_DIR + "OdkFormTest.xlsx"
+        form = OdkForm.from_file(path)
+        self.assertNotIn("raw_data", form.metadata)
+        self.assertIsNone(form._raw_survey)
+        kept = OdkForm.from_file(path, keep_raw=True)
+        self.assertEqual(form.to_json(), kept.to_json())
+        self.assertEqual(form.raw_survey[0]["name"], "ever_birth")
+
     def test_to_html(self):
         """Test to_html method."""
         set_template_env("old")
@@ -426,6 +618,88 @@ class OdkFormTest(PppTest):
                 html,
             )
 
+    def test_render_backends(self):
+        """Test that both render backends produce the same output."""
+        for style in ("default", "old"):
+            set_template_env(style)
+            outputs = []
+            for backend in RENDER_BACKENDS:
+                # Rendering alters components, so each backend gets a new form.
+                form = OdkForm.from_file(TEST_STATIC_DIR + "FQ.xlsx")
+                outputs.append(
+                    form.to_html(
+                        lang="English", format="html", style=style, backend=backend
+                    )
+                )
+            self.assertEqual(outputs[0], outputs[1], msg=style)
+
+    def test_threaded_styles(self):
+        """Test that renderings in different styles can run in threads."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        def render(style):
+            """Render a new form in a style."""
+            form = OdkForm.from_file(TEST_STATIC_DIR + "OdkFormTest.xlsx")
+            return form.to_html(lang="English", format="html", style=style)
+
+        styles = ["default", "old"] * 4
+        expected = [render(x) for x in styles]
+        self.assertNotEqual(expected[0], expected[1])
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            self.assertEqual(list(executor.map(render, styles)), expected)
+
+    def test_profiler(self):
+        """Test that profiling times each element, without altering output."""
+        from ppp.profiler import RenderProfiler
+
+        set_template_env("default")
+        path = TEST_STATIC_DIR + "OdkFormTest.xlsx"
+        expected = OdkForm.from_file(path).to_html(lang="English", format="html")
+        with RenderProfiler(path) as profiler:
+            html = OdkForm.from_file(path).to_html(lang="English", format="html")
+        self.assertEqual(html, expected)
+        records = {x["name"]: x for x in profiler.summary()}
+        self.assertEqual(records["FB"]["kind"], "OdkGroup")
+        self.assertEqual(records["ever_birth"]["row"], 2)
+        self.assertEqual(records["fb_m"]["choices"], 13)
+        self.assertGreater(records["fb_m"]["dict_seconds"], 0)
+        self.assertLess(records["FB"]["self_seconds"], records["FB"]["seconds"])
+        self.assertEqual(len(profiler.summary(top=3)), 3)
+
+    def test_parallel_sections(self):
+        """Test that sections rendered in parallel make the same output."""
+        set_template_env("default")
+        outputs = []
+        for workers in (None, 2):
+            form = OdkForm.from_file(TEST_STATIC_DIR + "FQ.xlsx")
+            outputs.append(
+                form.to_html(lang="English", format="html", workers=workers)
+            )
+        self.assertEqual(outputs[0], outputs[1])
+
+    def test_compact(self):
+        """Test compact output, with classes in place of inline styles."""
+        self.assertEqual(
+            compact_html(
+                '<tr>\n  <td class="x">\n    <input/> <label>a\n  b</label>\n'
+                "  </td>\n  <!-- td -->\n</tr>\n<script>\n  var a;\n</script>"
+            ),
+            '<tr><td class="x"><input/> <label>a b</label></td></tr>'
+            "<script>\n  var a;\n</script>",
+        )
+        set_template_env("default")
+        path = TEST_STATIC_DIR + "OdkFormTest.xlsx"
+        for output_format in SUPPORTED_FORMATS:
+            kwargs = {"lang": "English", "format": output_format}
+            html = OdkForm.from_file(path).to_html(**kwargs)
+            compact = OdkForm.from_file(path).to_html(compact=True, **kwargs)
+            self.assertLess(len(compact), len(html) * 0.7)
+            if output_format == "html":
+                self.assertNotIn('style="', compact)
+                self.assertIn('class="question-cell b-t b-r v-text-top"', compact)
+            else:  # Inline styles are kept for MS Word.
+                self.assertEqual(compact, compact_html(html))
+
 
 class MultiConversionTest(unittest.TestCase):
     """Test conversion of n files in n languages for n option combinations."""
@@ -487,6 +761,462 @@ class MultiConversionTest(unittest.TestCase):
         expected_output = sorted(out_dir_ls_input_unsorted)
         self.assertEqual(len(expected_output), len(out_dir_ls_input))
 
+    def test_assets(self):
+        """Test that assets are written once and linked to from html files."""
+        src_dir = TEST_STATIC_DIR + "multiple_file_language_option_conversion/"
+        src_files = sorted(glob(src_dir + "[!~]*.xlsx"))
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            subprocess.call(
+                ["python3", "-m", "ppp"]
+                + src_files
+                + ["-l", "English", "-f", "html", "doc", "-a", "-o", tmp_dir + "/"],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            self.assertEqual(
+                sorted(os.listdir(tmp_dir + "/assets/default")),
+                ["logo.png", "style.css"],
+            )
+            outputs = glob(tmp_dir + "/*.*")
+            self.assertEqual(len(outputs), len(src_files) * 2)
+            for path in outputs:
+                with open(path, encoding="utf-8") as file:
+                    output = file.read()
+                if path.endswith(".html"):
+                    self.assertIn('href="assets/default/style.css"', output)
+                    self.assertIn('src="assets/default/logo.png"', output)
+                    self.assertNotIn("<style>", output)
+                else:  # Documents in other formats are self-contained.
+                    self.assertNotIn("assets/", output)
+                    self.assertIn("<style>", output)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_compress(self):
+        """Test that compressed output decompresses to the normal output."""
+        from importlib import import_module
+
+        src = TEST_STATIC_DIR + "OdkFormTest.xlsx"
+        set_template_env("default")
+        expected = OdkForm.from_file(src).to_html(format="html")
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            for compress, (module, suffix) in COMPRESSION_FORMATS.items():
+                with contextlib.redirect_stdout(io.StringIO()):
+                    convert_file(
+                        src, None, tmp_dir + "/", format="html", compress=compress
+                    )
+                path = tmp_dir + "/OdkFormTest.html" + suffix
+                with import_module(module).open(path, "rt", encoding="utf-8") as file:
+                    self.assertEqual(file.read(), expected)
+            self.assertEqual(len(os.listdir(tmp_dir)), len(COMPRESSION_FORMATS))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_debug_sidecar(self):
+        """Test that debug data is written to a file of its own."""
+        src = TEST_STATIC_DIR + "OdkFormTest.xlsx"
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                convert_file(src, None, tmp_dir + "/", format="html", debug="sidecar")
+            with open(tmp_dir + "/OdkFormTest.html.json", encoding="utf-8") as file:
+                debug_data = json.load(file)
+            with open(tmp_dir + "/OdkFormTest.html", encoding="utf-8") as file:
+                self.assertIn("if (false != false)", file.read())
+            form = OdkForm.from_file(src)
+            self.assertEqual(debug_data["survey"], form.raw_survey)
+            components = debug_data["form"]["questionnaire"]
+            self.assertEqual(len(components), len(form.questionnaire))
+            self.assertEqual(components[1]["component"], "OdkGroup")
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_debug_sidecar_after_render(self):
+        """Test debug data of a form with tables and double line breaks."""
+        src = TEST_STATIC_DIR + "FQ.xlsx"
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                with contextlib.redirect_stderr(io.StringIO()):
+                    convert_file(
+                        src, "English", tmp_dir + "/", format="html", debug="sidecar"
+                    )
+            with open(tmp_dir + "/FQ-English.html.json", encoding="utf-8") as file:
+                debug_data = json.load(file)
+            form = OdkForm.from_file(src)
+            components = debug_data["form"]["questionnaire"]
+            self.assertEqual(len(components), len(form.questionnaire))
+            self.assertIn('"component": "OdkTable"', json.dumps(components))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_all_languages(self):
+        """Test that a form is converted in every language it has."""
+        src = TEST_STATIC_DIR + "multiple_file_language_option_conversion/"
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                run(
+                    [src + "BFR5-Selection-v2-jef.xlsx"],
+                    [ALL_LANGUAGES_TOKEN],
+                    tmp_dir + "/",
+                    format="html",
+                )
+            self.assertEqual(
+                sorted(os.listdir(tmp_dir)),
+                [
+                    "BFR5-Selection-v2-jef-English.html",
+                    "BFR5-Selection-v2-jef-Français.html",
+                ],
+            )
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_archive(self):
+        """Test that converted files are written into an archive."""
+        src_dir = TEST_STATIC_DIR + "multiple_file_language_option_conversion/"
+        src_files = sorted(glob(src_dir + "[!~]*.xlsx"))
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                run(
+                    src_files,
+                    ["English"],
+                    format=["html", "doc"],
+                    archive=tmp_dir + "/out.zip",
+                )
+            self.assertEqual(os.listdir(tmp_dir), ["out.zip"])
+            with zipfile.ZipFile(tmp_dir + "/out.zip") as archive:
+                manifest = json.loads(archive.read(ARCHIVE_MANIFEST_NAME))
+                self.assertEqual(len(manifest), len(src_files) * 2)
+                for record in manifest:
+                    data = archive.read(record["name"])
+                    self.assertEqual(len(data), record["size"])
+                    self.assertEqual(
+                        hashlib.sha256(data).hexdigest(), record["sha256"]
+                    )
+            set_template_env("default")
+            form = OdkForm.from_file(src_dir + record["source"])
+            expected = form.to_html(lang="English", **record["options"])
+            self.assertEqual(data.decode("utf-8"), expected)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_metrics(self):
+        """Test the summary of a run, as JSON and in the Prometheus format."""
+        src = TEST_STATIC_DIR + "OdkFormTest.xlsx"
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            for name in ("metrics.json", "metrics.prom"):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    run(
+                        [src],
+                        ["English"],
+                        outpath=tmp_dir + "/",
+                        format=["html", "doc"],
+                        metrics=tmp_dir + "/" + name,
+                    )
+            with open(tmp_dir + "/metrics.json") as file:
+                summary = json.load(file)
+            self.assertEqual((summary["forms"], summary["conversions"]), (1, 2))
+            sizes = [os.path.getsize(x) for x in glob(tmp_dir + "/*.doc")]
+            sizes += [os.path.getsize(x) for x in glob(tmp_dir + "/*.html")]
+            self.assertEqual(summary["bytes"], sum(sizes))
+            stages = {"convert", "load", "read", "choices", "survey", "numbering"}
+            stages |= {"names", "render", "write"}
+            self.assertEqual(set(summary["stages"]), stages)
+            cache = summary["caches"]["template_env"]
+            self.assertEqual(cache["hits"] + cache["misses"], 2)
+            with open(tmp_dir + "/metrics.prom") as file:
+                self.assertIn("ppp_conversions 2\n", file.read())
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_memprofile(self):
+        """Test the peak and retained memory of each stage of a conversion."""
+        from ppp.memprofile import MemoryProfiler
+
+        src = TEST_STATIC_DIR + "OdkFormTest.xlsx"
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            with MemoryProfiler(top=3) as profiler:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    convert_file(src, "English", tmp_dir + "/", format="html")
+            self.assertFalse(tracemalloc.is_tracing())
+            stages = [x["stage"] for x in profiler.stages]
+            expected = ["read", "choices", "survey", "numbering", "write"]
+            self.assertEqual(stages, expected)
+            for record in profiler.stages:
+                self.assertGreaterEqual(record["peak"], record["retained"])
+                self.assertLessEqual(len(record["sites"]), 3)
+            self.assertGreater(profiler.peak, 0)
+            report = io.StringIO()
+            profiler.report(src, file=report)
+            self.assertIn("numbering", report.getvalue())
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_shared_choices(self):
+        """Test that identical choice lists of forms are one shared list."""
+        from ppp.definitions.error import OdkChoicesError
+
+        fq = OdkForm.from_file(TEST_STATIC_DIR + "FQ.xlsx")
+        hq = OdkForm.from_file(TEST_STATIC_DIR + "HQ.xlsx")
+        choices = fq.choices["yes_no_list"]
+        self.assertIs(hq.choices["yes_no_list"], choices)
+        again = OdkForm.from_file(TEST_STATIC_DIR + "FQ.xlsx")
+        self.assertEqual(
+            [x for x in fq.choices if fq.choices[x] is not again.choices[x]], []
+        )
+        self.assertEqual(choices.labels("English"), ["Yes", "No"])
+        with self.assertRaises(OdkChoicesError):
+            choices.add({"list_name": "yes_no_list", "name": "maybe"})
+
+    def test_batch(self):
+        """Test that distinct conversions of a manifest are run once each."""
+        from ppp.batch import batch
+
+        src = TEST_STATIC_DIR + "multiple_file_language_option_conversion/"
+        tmp_dir = tempfile.mkdtemp()
+        jobs = [
+            {"file": src + "BFR5-Selection-v2-jef.xlsx", "languages": "all"},
+            {"file": src + "BFR5-Selection-v2-jef.xlsx", "languages": ["English"]},
+            {"file": TEST_STATIC_DIR + "OdkFormTest.xlsx", "formats": ["html", "doc"]},
+        ]
+        try:
+            with open(tmp_dir + "/manifest.json", "w", encoding="utf-8") as file:
+                json.dump([{**x, "outpath": "out"} for x in jobs], file)
+            with contextlib.redirect_stderr(io.StringIO()):
+                report = batch([tmp_dir + "/manifest.json"], tmp_dir + "/report.json")
+            self.assertTrue(report["ok"])
+            self.assertEqual(
+                [(x["language"], x["options"]["format"]) for x in report["results"]],
+                [
+                    ("English", "html"),
+                    ("Français", "html"),
+                    (None, "html"),
+                    (None, "doc"),
+                ],
+            )
+            self.assertEqual(len(os.listdir(tmp_dir + "/out")), 4)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_trace(self):
+        """Test a trace of a batch, with spans in each worker process."""
+        from ppp.batch import batch
+
+        tmp_dir = tempfile.mkdtemp()
+        jobs = [
+            {"file": TEST_STATIC_DIR + "OdkFormTest.xlsx", "formats": ["html", "doc"]},
+            {"file": TEST_STATIC_DIR + "FQ.xlsx", "languages": "English"},
+        ]
+        try:
+            with open(tmp_dir + "/manifest.json", "w", encoding="utf-8") as file:
+                json.dump([{**x, "outpath": "out"} for x in jobs], file)
+            with contextlib.redirect_stderr(io.StringIO()):
+                batch(
+                    [tmp_dir + "/manifest.json"],
+                    tmp_dir + "/report.json",
+                    workers=2,
+                    trace=tmp_dir + "/trace.json",
+                )
+            with open(tmp_dir + "/trace.json") as file:
+                events = json.load(file)["traceEvents"]
+            spans = [x for x in events if x["ph"] == "X"]
+            self.assertNotIn(os.getpid(), {x["pid"] for x in spans})
+            self.assertEqual(
+                {x["name"] for x in spans},
+                {"file", "read", "convert", "load", "choices", "survey"}
+                | {"numbering", "names", "render", "write"},
+            )
+            tags = {
+                "form": "FQ.xlsx",
+                "language": "English",
+                "format": "html",
+                "template": "standard",
+            }
+            for name in ("convert", "names", "write"):
+                self.assertIn(tags, [x["args"] for x in spans if x["name"] == name])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_pool(self):
+        """Test that failed conversions in a pool get results of their own."""
+        from ppp.pool import ConversionPool
+
+        tmp_dir = tempfile.mkdtemp()
+        jobs = [
+            {
+                "file": TEST_STATIC_DIR + x,
+                "language": None,
+                "outpath": tmp_dir + "/",
+                "options": {"format": "html"},
+            }
+            for x in ("OdkFormTest.xlsx", "missing.xlsx")
+        ]
+        try:
+            with contextlib.redirect_stderr(io.StringIO()):
+                with ConversionPool(workers=2, max_jobs=1) as pool:
+                    results = pool.map(jobs)
+                    self.assertEqual(pool.processes, {})
+                with ConversionPool(timeout=0.001) as pool:
+                    timed_out = pool.map(jobs[:1])[0]
+            self.assertTrue(results[0]["ok"])
+            self.assertTrue(os.path.exists(results[0]["out_file"]))
+            self.assertEqual(results[1]["errors"][0]["error"], "FileNotFoundError")
+            self.assertEqual(timed_out["errors"][0]["error"], "TimeoutError")
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_aio(self):
+        """Test that concurrent async conversions match sequential ones."""
+        import asyncio
+
+        from ppp.aio import AsyncConverter
+        from ppp.odkform import OdkForm
+
+        src = TEST_STATIC_DIR + "OdkFormTest.xlsx"
+        set_template_env("default")
+        expected = OdkForm.from_file(src).to_html(format="html")
+        converter = AsyncConverter(max_workers=2, max_conversions=2)
+        jobs = [{"file": src, "options": {"format": "html"}}] * 3
+        try:
+            outputs = asyncio.run(converter.convert_many(jobs))
+        finally:
+            converter.close()
+        self.assertEqual(outputs, [expected] * 3)
+        self.assertEqual(len(converter.workbooks), 1)
+
+
+class WatchTest(unittest.TestCase):
+    """Test incremental re-rendering of watched forms."""
+
+    def setUp(self):
+        """Set up."""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.src = self.tmp_dir + "/form.xlsx"
+        shutil.copy(TEST_STATIC_DIR + "NamesToQnums/input/1.xlsx", self.src)
+
+    def tearDown(self):
+        """Tear down."""
+        shutil.rmtree(self.tmp_dir)
+
+    def test_fragment_cache(self):
+        """Test that cached renders are reused and identical to uncached."""
+        set_template_env("default")
+        kwargs = {"format": "html", "template": "standard"}
+        expected = OdkForm.from_file(self.src).to_html(lang="English", **kwargs)
+        cache = {}
+        first = OdkForm.from_file(self.src).to_html("English", cache, **kwargs)
+        reused = dict(cache)
+        second = OdkForm.from_file(self.src).to_html("English", cache, **kwargs)
+        self.assertEqual(expected, first)
+        self.assertEqual(expected, second)
+        self.assertEqual(reused, cache)
+
+    def test_update(self):
+        """Test that files are only written again when rows change."""
+        combos = [{"format": "html", "template": "standard", "style": "default"}]
+        watcher = FormWatcher(self.src, ["English"], self.tmp_dir + "/", combos)
+        self.assertFalse(watcher.row_hashes)
+        self.assertTrue(watcher.modified())
+        self.assertEqual(watcher.update(), [self.tmp_dir + "/form-English.html"])
+        self.assertFalse(watcher.modified())
+        self.assertEqual(watcher.update(), [])
+
+    def test_all_languages(self):
+        """Test that a watched form is rendered in every language it has."""
+        src = TEST_STATIC_DIR + "multiple_file_language_option_conversion/"
+        shutil.copy(src + "BFR5-Selection-v2-jef.xlsx", self.src)
+        combos = [{"format": "html", "template": "standard", "style": "default"}]
+        watcher = FormWatcher(
+            self.src, [ALL_LANGUAGES_TOKEN], self.tmp_dir + "/", combos
+        )
+        with contextlib.redirect_stdout(io.StringIO()):
+            written = watcher.update()
+        self.assertEqual(
+            written,
+            [
+                self.tmp_dir + "/form-English.html",
+                self.tmp_dir + "/form-Français.html",
+            ],
+        )
+
+    def test_update_retried(self):
+        """Test that a failed update is retried, and leaves no partial file."""
+        combos = [{"format": "html", "template": "standard", "style": "default"}]
+        out_dir = self.tmp_dir + "/out/"
+        watcher = FormWatcher(self.src, ["English"], out_dir, combos)
+        with self.assertRaises(OSError):
+            watcher.update()
+        self.assertFalse(watcher.row_hashes)
+        os.mkdir(out_dir)
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(watcher.update(), [out_dir + "form-English.html"])
+
+    def test_unsupported_options(self):
+        """Test that options which watching does not support are rejected."""
+        command = ["python3", "-m", "ppp", self.src, "-w", "-z", "gzip"]
+        result = subprocess.run(command, stderr=subprocess.PIPE, check=False)
+        self.assertEqual(result.returncode, 2)
+        self.assertIn(b"-z/--compress", result.stderr)
+
+    def test_count_changed_rows(self):
+        """Test that moved and duplicate rows count as changed."""
+        old = {"survey": ["a", "b", "c"], "choices": ["x"]}
+        self.assertEqual(FormWatcher.count_changed_rows(old, dict(old)), 0)
+        moved = {"survey": ["b", "a", "c"], "choices": ["x"]}
+        self.assertEqual(FormWatcher.count_changed_rows(old, moved), 2)
+        duplicated = {"survey": ["a", "b", "c", "c"], "choices": ["x"]}
+        self.assertEqual(FormWatcher.count_changed_rows(old, duplicated), 1)
+        removed = {"survey": ["a", "b", "c"]}
+        self.assertEqual(FormWatcher.count_changed_rows(old, removed), 1)
+
+    def test_default_outpath(self):
+        """Test that files are written next to a bare relative source file."""
+        self.assertEqual(FormWatcher("form.xlsx").outpath, "./")
+        self.assertEqual(FormWatcher("a/form.xlsx").outpath, "a/")
+
+
+class StartupTest(unittest.TestCase):
+    """Test that the CLI starts without importing rendering dependencies."""
+
+    # Cold-start budgets in seconds, generous enough for slow CI machines.
+    help_budget = 1.0
+    convert_budget = 5.0
+
+    @staticmethod
+    def time_command(args):
+        """Run a command in a fresh interpreter and time it."""
+        start = time.perf_counter()
+        subprocess.run(args, check=True, stdout=subprocess.DEVNULL)
+        return time.perf_counter() - start
+
+    def test_lazy_imports(self):
+        """Test that importing the CLI does not import jinja2, pmix or xlrd."""
+        code = (
+            "import sys, ppp.interfaces.cli; "
+            "print(','.join(sorted(m for m in ('jinja2', 'pmix', 'xlrd', "
+            "'ppp.odkform') if m in sys.modules)))"
+        )
+        output = subprocess.check_output(["python3", "-c", code])
+        self.assertEqual(output.decode().strip(), "")
+
+    def test_cold_start(self):
+        """Test cold-start time of argument parsing and a trivial conversion."""
+        elapsed = self.time_command(["python3", "-m", "ppp", "--help"])
+        self.assertLess(elapsed, self.help_budget)
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            src = TEST_STATIC_DIR + "NamesToQnums/input/1.xlsx"
+            command = ["python3", "-m", "ppp", src, "-o", tmp_dir + "/"]
+            self.assertLess(self.time_command(command), self.convert_budget)
+        finally:
+            shutil.rmtree(tmp_dir)
+
 
 class MultipleFieldLanguageDelimiterSupport(PppTest):
     """Support for both : and :: to be used as delimiter betw field & lang.